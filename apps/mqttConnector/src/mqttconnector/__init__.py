@@ -6,4 +6,4 @@ __version__ = "1.3.0"
 __description__ = "mqttConnector"
 __author_name__ = "Ronald Steinke"
 __author_mail__ = "ronald.steinke@fokus.fraunhofer.de"
-__requires__ = ["paho_mqtt"]
+__requires__ = ["paho_mqtt >= 1.5, < 2"]
@@ -7,6 +7,7 @@ from os import path as ospath
 from paho.mqtt import client as mqtt
 
 from openmtc_app.onem2m import XAE
+from openmtc_onem2m.client.mqtt import mqtt_loop
 
 
 class mqttConnector(XAE):
@@ -73,10 +74,10 @@ class mqttConnector(XAE):
                 keyfile=self.mqtts_keyfile)
             self.client.tls_insecure_set(True)
         self.client.connect(self._broker_host, self._broker_port)
-        # TODO let gevent handle this
-        self.client.loop_forever()
+        mqtt_loop.add(self.client)
 
     def _on_shutdown(self):
+        mqtt_loop.remove(self.client)
         self.client.disconnect()
 
     def _get_target_container(self, location, device, sensor):
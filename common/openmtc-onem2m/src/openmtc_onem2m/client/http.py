@@ -9,6 +9,7 @@ from socket import (
 from time import time
 from urllib.parse import urlparse
 from aplus import Promise
+from futile import LoggerMixin
 from futile.caching import LRUCache
 from geventhttpclient.client import HTTPClient
 from geventhttpclient.response import HTTPResponse
@@ -23,8 +24,7 @@ from openmtc_onem2m.exc import (
 )
 from openmtc_onem2m.model import (
     ResourceTypeE,
-    get_short_attribute_name,
-    get_short_member_name,
+    get_short_name,
 )
 from openmtc_onem2m.serializer.util import (
     decode_onem2m_content,
@@ -66,14 +66,117 @@ _header_to_field_map = {
 }
 
 
+class HTTPConnectionPool(object):
+    """Persistent connections to a single endpoint."""
+
+    def __init__(self, client):
+        super(HTTPConnectionPool, self).__init__()
+        self.client = client
+        self.in_flight = 0
+        self.requests = 0
+        self.last_used = time()
+
+
+class HTTPConnectionPools(LoggerMixin):
+    """Registry of keep-alive connection pools shared by all HTTP clients.
+
+    There is one pool per scheme, host, port and TLS parameters. A pool opens
+    at most max_connections connections to its host, further requests wait
+    for a free connection. Pools without requests for idle_timeout seconds
+    are closed.
+    """
+
+    def __init__(self, max_connections=50, idle_timeout=60.0,
+                 connection_timeout=120.0):
+        super(HTTPConnectionPools, self).__init__()
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.connection_timeout = connection_timeout
+
+        self._pools = {}
+        self._last_eviction = time()
+
+        # counters
+        self.created = 0
+        self.evicted = 0
+        self.requests = 0
+
+    def configure(self, max_connections=None, idle_timeout=None,
+                  connection_timeout=None):
+        """Changes the limits, pools created before keep theirs."""
+        if max_connections is not None:
+            self.max_connections = max_connections
+        if idle_timeout is not None:
+            self.idle_timeout = idle_timeout
+        if connection_timeout is not None:
+            self.connection_timeout = connection_timeout
+
+    def acquire(self, key, host, port, ssl_options=None, insecure=False):
+        """Returns the HTTPClient of the pool for key, to be handed back with
+        release() after the request.
+        """
+        now = time()
+        if now - self._last_eviction >= self.idle_timeout:
+            self._evict_idle(now)
+
+        try:
+            pool = self._pools[key]
+        except KeyError:
+            self.logger.debug("Creating connection pool for %s:%s", host, port)
+            pool = self._pools[key] = HTTPConnectionPool(HTTPClient(
+                host, port, connection_timeout=self.connection_timeout,
+                concurrency=self.max_connections, ssl=ssl_options is not None,
+                ssl_options=ssl_options, insecure=insecure))
+            self.created += 1
+
+        pool.in_flight += 1
+        pool.requests += 1
+        pool.last_used = now
+        self.requests += 1
+        return pool.client
+
+    def release(self, key):
+        pool = self._pools[key]
+        pool.in_flight -= 1
+        pool.last_used = time()
+
+    def _evict_idle(self, now):
+        self._last_eviction = now
+        for key, pool in list(self._pools.items()):
+            if not pool.in_flight and now - pool.last_used >= self.idle_timeout:
+                del self._pools[key]
+                pool.client.close()
+                self.evicted += 1
+
+    def close(self):
+        for pool in self._pools.values():
+            pool.client.close()
+        self._pools.clear()
+
+    def get_stats(self):
+        pools = self._pools.values()
+        return {
+            "pools": len(self._pools),
+            "in_flight": sum(p.in_flight for p in pools),
+            "requests": self.requests,
+            "created": self.created,
+            "evicted": self.evicted,
+        }
+
+
+connection_pools = HTTPConnectionPools()
+
+
 def get_client(m2m_ep, use_xml=False, ca_certs=None, cert_file=None, key_file=None,
-               insecure=False):
+               insecure=False, content_type=None):
+    key = (m2m_ep, use_xml, ca_certs, cert_file, key_file, insecure,
+           content_type)
     try:
-        return _clients[(m2m_ep, use_xml)]
+        return _clients[key]
     except KeyError:
-        # TODO: make connection_timeout and concurrency configurable
-        client = _clients[(m2m_ep, use_xml)] = OneM2MHTTPClient(
-            m2m_ep, use_xml, ca_certs, cert_file, key_file, insecure)
+        client = _clients[key] = OneM2MHTTPClient(
+            m2m_ep, use_xml, ca_certs, cert_file, key_file, insecure,
+            content_type=content_type)
         return client
 
 
@@ -82,7 +185,7 @@ class OneM2MHTTPClient(OneM2MClient):
     DEF_SSL_VERSION = ssl.PROTOCOL_TLSv1_2
 
     def __init__(self, m2m_ep, use_xml, ca_certs=None, cert_file=None, key_file=None,
-                 insecure=False):
+                 insecure=False, pools=None, content_type=None):
         super(OneM2MHTTPClient, self).__init__()
 
         self.parsed_url = urlparse(m2m_ep)
@@ -109,14 +212,25 @@ class OneM2MHTTPClient(OneM2MClient):
         else:
             ssl_options = None
 
+        # connections are kept open and shared with all clients of the same
+        # endpoint
+        if pools is None:
+            pools = connection_pools
+        pool_key = (self.parsed_url.scheme, host, port, ca_certs, cert_file,
+                    key_file, insecure)
+
         def get_http_client():
-            return HTTPClient(host, port, connection_timeout=120.0,
-                              concurrency=50, ssl=is_https,
-                              ssl_options=ssl_options, insecure=insecure)
+            return pools.acquire(pool_key, host, port, ssl_options, insecure)
+
+        def release_http_client():
+            pools.release(pool_key)
 
         self._get_client = get_http_client
+        self._release_client = release_http_client
 
-        self.content_type = 'application/' + ('xml' if use_xml else 'json')
+        # e.g. application/vnd.onem2m-res+cbor
+        self.content_type = content_type or (
+            'application/' + ('xml' if use_xml else 'json'))
 
     def _handle_network_error(self, exc, p, http_request, t,
                               exc_class=OpenMTCNetworkError):
@@ -146,7 +260,7 @@ class OneM2MHTTPClient(OneM2MClient):
         if onem2m_request.fc is not None:
             filter_criteria = onem2m_request.fc
             params.update({
-                (get_short_attribute_name(name) or get_short_member_name(name)): val
+                get_short_name(name): val
                 for name, val in filter_criteria.get_values(True).items()
             })
 
@@ -196,6 +310,8 @@ class OneM2MHTTPClient(OneM2MClient):
         self.logger.debug("Mapping HTTP response for OneM2M response: %s", response)
         rsc = response.get("x-m2m-rsc", 5000)
         if int(rsc) >= ERROR_MIN:
+            # consume the body, so the connection can be reused
+            response.read()
             return OneM2MErrorResponse(
                 get_error_class(rsc).response_status_code, onem2m_request)
 
@@ -203,7 +319,7 @@ class OneM2MHTTPClient(OneM2MClient):
             get_response_status(rsc),
             request=onem2m_request,
             rsc=rsc,
-            pc=decode_onem2m_content(response.read().decode("utf-8"), response.get("content-type"))
+            pc=decode_onem2m_content(response.read(), response.get("content-type"))
         )
 
     def send_onem2m_request(self, onem2m_request):
@@ -229,6 +345,6 @@ class OneM2MHTTPClient(OneM2MClient):
                 finally:
                     response.release()
             finally:
-                client.close()
+                self._release_client()
 
         return p
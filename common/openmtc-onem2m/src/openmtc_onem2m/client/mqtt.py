@@ -1,37 +1,24 @@
-from datetime import datetime
-
 from aplus import (
     Promise,
 )
 from collections import deque
+from futile import LoggerMixin
 from futile.caching import LRUCache
 import gevent
 from gevent import monkey; monkey.patch_all()
+from gevent.socket import wait_read, wait_write
 from . import OneM2MClient
 from openmtc.exc import ConnectionFailed
 from ..exc import (
-    ERROR_MIN,
-    CSEValueError,
     CSEError,
+    CSESyntaxError,
     CSETargetNotReachable)
-from ..serializer.util import (
-    decode_onem2m_content,
-    encode_onem2m_content,
-)
-from ..transport import (
-    OneM2MRequest,
-    OneM2MResponse,
-    OneM2MErrorResponse,
-    OneM2MOperation,
-)
-from ..model import ResourceTypeE
+from ..serializer import get_onem2m_supported_content_types
+from ..serializer.primitive import OneM2MPrimitiveCodec
+from ..transport import OneM2MErrorResponse
 import paho.mqtt.client as mqtt
-from simplejson import (
-    JSONDecoder,
-    JSONEncoder,
-    JSONDecodeError,
-)
 from socket import error as SocketError
+from time import monotonic
 from urllib.parse import urlparse
 from openmtc_onem2m.util import split_onem2m_address
 
@@ -49,11 +36,159 @@ portmap = {
 MQTT_QOS_LEVEL = 1
 MQTT_RESPONSE_TIMEOUT = 1
 
+#: Serialization formats of the primitives (last topic level, TS 0010, sec. 6.4) and the content
+#: types of their resources
+serialization_formats = {
+    'application/json':                 'json',
+    'application/vnd.onem2m-res+cbor':  'cbor',
+}
+
 _clients = LRUCache(threadsafe=False)
 
 
+class GeventMQTTLoop(LoggerMixin):
+    """
+    Drives the network I/O of paho MQTT clients from gevent instead of polling them with
+    Client.loop().
+
+    For every connected client a greenlet waits for its socket to become readable and calls
+    loop_read(). Outgoing packets are written by loop_write() from the moment paho registers the
+    socket for writing. A single greenlet calls loop_misc() of all clients once per interval for
+    keep alive and reconnects clients that lost their connection.
+    """
+
+    def __init__(self, misc_interval=1, reconnect_interval=5):
+        super(GeventMQTTLoop, self).__init__()
+        self.misc_interval = misc_interval
+        self.reconnect_interval = reconnect_interval
+        self._clients = set()
+        self._reconnect_times = {}
+        self._readers = {}
+        self._writers = {}
+        # greenlets blocked on a socket, only these are killed if their socket is closed
+        self._waiting = set()
+        self._misc = None
+
+    def add(self, client):
+        """
+        Starts driving a connected client.
+
+        :param mqtt.Client client:
+        """
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        self._clients.add(client)
+
+        sock = client.socket()
+        if sock is not None:
+            self._on_socket_open(client, None, sock)
+            if client.want_write():
+                self._on_socket_register_write(client, None, sock)
+
+        if self._misc is None:
+            self._misc = gevent.spawn(self._run_misc)
+
+    def remove(self, client):
+        """
+        Stops driving a client. Pending packets are written, packets published afterwards are
+        written right away as without external loop.
+
+        :param mqtt.Client client:
+        """
+        self._clients.discard(client)
+        self._reconnect_times.pop(client, None)
+        client.on_socket_open = None
+        client.on_socket_close = None
+        client.on_socket_register_write = None
+        self._stop_greenlets(client)
+
+        if client.want_write():
+            client.loop_write()
+
+    def _stop_greenlets(self, client):
+        for greenlets in (self._readers, self._writers):
+            greenlet = greenlets.pop(client, None)
+            if greenlet in self._waiting:
+                greenlet.kill(block=False)
+
+    def _on_socket_open(self, client, _, sock):
+        self._readers[client] = gevent.spawn(self._read, client, sock)
+
+    def _on_socket_close(self, client, _, sock):
+        # greenlets busy with the client end when they see the socket is gone
+        self._stop_greenlets(client)
+
+    def _on_socket_register_write(self, client, _, sock):
+        if client not in self._writers:
+            self._writers[client] = gevent.spawn(self._write, client, sock)
+
+    def _wait(self, wait, sock):
+        current = gevent.getcurrent()
+        self._waiting.add(current)
+        try:
+            wait(sock.fileno())
+        finally:
+            self._waiting.discard(current)
+
+    def _read(self, client, sock):
+        # SSL sockets may hold decrypted data the file descriptor does not signal
+        pending = getattr(sock, 'pending', None)
+        try:
+            while client.socket() is sock:
+                if not pending or not pending():
+                    self._wait(wait_read, sock)
+                client.loop_read()
+        except Exception:
+            self.logger.exception('Error reading from MQTT broker')
+        finally:
+            if self._readers.get(client) is gevent.getcurrent():
+                del self._readers[client]
+
+    def _write(self, client, sock):
+        try:
+            while client.socket() is sock and client.want_write():
+                client.loop_write()
+                if client.socket() is sock and client.want_write():
+                    self._wait(wait_write, sock)
+        except Exception:
+            self.logger.exception('Error writing to MQTT broker')
+        finally:
+            if self._writers.get(client) is gevent.getcurrent():
+                del self._writers[client]
+
+    def _run_misc(self):
+        try:
+            while self._clients:
+                gevent.sleep(self.misc_interval)
+                for client in list(self._clients):
+                    if client.socket() is None:
+                        self._reconnect(client)
+                    else:
+                        client.loop_misc()
+        finally:
+            self._misc = None
+
+    def _reconnect(self, client):
+        now = monotonic()
+        if now < self._reconnect_times.get(client, 0):
+            return
+        self._reconnect_times[client] = now + self.reconnect_interval
+
+        self.logger.debug('Reconnecting to MQTT broker ...')
+        try:
+            client.reconnect()
+        except SocketError as e:
+            self.logger.debug('Reconnect failed: %s' % (e, ))
+
+
+#: loop shared by all MQTT clients of the process
+mqtt_loop = GeventMQTTLoop()
+
+
 def get_client(m2m_ep, use_xml=False, client_id=None, handle_request_func=None,
-               ca_certs=None, cert_file=None, key_file=None, insecure=False):
+               ca_certs=None, cert_file=None, key_file=None, insecure=False,
+               content_type=None):
     """
 
     :param string m2m_ep:
@@ -64,14 +199,17 @@ def get_client(m2m_ep, use_xml=False, client_id=None, handle_request_func=None,
     :param string cert_file:
     :param string key_file:
     :param string insecure:
+    :param string content_type: content type of the requests sent, JSON by default
     :return OneM2MMQTTClient:
     """
+    key = (m2m_ep.split('#')[0], use_xml, content_type)
     try:
-        return _clients[(m2m_ep.split('#')[0], use_xml)]
+        return _clients[key]
     except KeyError:
-        client = _clients[(m2m_ep.split('#')[0], use_xml)] = OneM2MMQTTClient(
+        client = _clients[key] = OneM2MMQTTClient(
             m2m_ep, use_xml, client_id, handle_request_func, ca_certs=ca_certs,
-            cert_file=cert_file, key_file=key_file, insecure=insecure
+            cert_file=cert_file, key_file=key_file, insecure=insecure,
+            content_type=content_type
         )
         return client
 
@@ -81,48 +219,6 @@ class OneM2MMQTTClient(OneM2MClient):
     This class provides for a transport over the MQTT protocol as described in TS 0010
     """
 
-    __request_fields = frozenset([
-        'op',
-        'to',
-        'fr',
-        'rqi',
-        'ty',
-        'pc',
-        'rids',
-        'ot',
-        'rqet',
-        'rset',
-        'oet',
-        'rt',
-        'rp',
-        'rcn',
-        'ec',
-        'da',
-        'gid',
-        'fc',
-        'drt',
-        'tids',
-        'ltids',
-        'tqi',
-        'rvi',
-        'vsi',
-    ])
-
-    __response_fields = frozenset([
-        'rsc',
-        'rqi',
-        'pc',
-        'to',
-        'fr',
-        'ot',
-        'rset',
-        'ec',
-        'cts',
-        'cto',
-        'rvi',
-        'vsi',
-    ])
-
     @staticmethod
     def _mqtt_mask(id):
         return id.lstrip('/').replace('/', ':')
@@ -171,7 +267,8 @@ class OneM2MMQTTClient(OneM2MClient):
         return decorator
 
     def __init__(self, m2m_ep, _, client_id, handle_request_func=None, subscribe_sys_topics=False,
-                 ca_certs=None, cert_file=None, key_file=None, insecure=False):
+                 ca_certs=None, cert_file=None, key_file=None, insecure=False,
+                 content_type=None):
         """
         :param str m2m_ep:
         :param bool _:
@@ -179,24 +276,25 @@ class OneM2MMQTTClient(OneM2MClient):
         :param call handle_request_func:
         :param bool subscribe_sys_topics: Whether to subscribe to $SYS topics or not
                     (cf <https://github.com/mqtt/mqtt.github.io/wiki/SYS-Topics>)
+        :param str content_type: Content type of the requests sent, requests received are
+                    answered in the serialization they came in
         """
         super(OneM2MMQTTClient, self).__init__()
         parsed_url = urlparse(m2m_ep)
         self._default_target_id = parsed_url.fragment
 
-        def _default(x):
-            if isinstance(x, datetime):
-                try:
-                    isoformat = x.isoformat
-                except AttributeError:
-                    raise TypeError("%s (%s)" % (x, type(x)))
-
-                return isoformat()
-            else:
-                return x
+        # serialization format -> primitive codec
+        self._codecs = {}
+        supported = get_onem2m_supported_content_types()
+        for codec_type, serialization in serialization_formats.items():
+            if codec_type in supported:
+                self._codecs[serialization] = OneM2MPrimitiveCodec(codec_type)
 
-        self._encode = JSONEncoder(default=_default).encode
-        self._decode = JSONDecoder().decode
+        try:
+            self._serialization = serialization_formats[content_type or 'application/json']
+            self._codecs[self._serialization]
+        except KeyError:
+            raise ValueError('Unsupported content type: %s' % (content_type, ))
 
         self._handle_request_func = handle_request_func
 
@@ -299,14 +397,7 @@ class OneM2MMQTTClient(OneM2MClient):
         except SocketError as e:
             raise ConnectionFailed(e.message)
 
-        def loop():
-            try:
-                while self._client.loop(timeout=0.1) != mqtt.mqtt_cs_disconnecting:
-                    gevent.sleep()
-            except (SystemExit, KeyboardInterrupt, AttributeError):
-                pass
-
-        gevent.spawn(loop)
+        mqtt_loop.add(self._client)
 
     def _request_callback(self, client, _, message):
         """
@@ -319,13 +410,24 @@ class OneM2MMQTTClient(OneM2MClient):
         """
 
         def handle_request():
-            originator = message.topic.split('/')[3]
+            topic = message.topic.split('/')
+            originator = topic[3]
+            serialization = topic[5]
             try:
-                request = self._decode(message.payload)
-            except JSONDecodeError as e:
+                codec = self._codecs[serialization]
+            except KeyError:
+                self.logger.warn(
+                    'Got request in unsupported serialization %s from client %s'
+                    % (serialization, originator, )
+                )
+                return
+
+            try:
+                request = codec.loads(message.payload)
+            except ValueError as e:
                 self.logger.warn(
                     'Got rubbish request from client %s: %s'
-                    % (originator, e.message, )
+                    % (originator, e, )
                 )
                 return
 
@@ -344,23 +446,18 @@ class OneM2MMQTTClient(OneM2MClient):
                 return
 
             try:
-                request['pc'] = decode_onem2m_content(self._encode(request['pc']),
-                                                      'application/json')
-                request['ty'] = type(request['pc'])
-            except KeyError:
-                # No content, eh?
-                request['ty'] = None
-
-            self.logger.debug('Decoded JSON request: %s' % (request, ))
+                request = codec.decode_request(request)
+            except (KeyError, ValueError, CSESyntaxError) as e:
+                self.logger.warn(
+                    'Got invalid request %s from client %s: %s'
+                    % (rqi, originator, e, )
+                )
+                return
 
-            op = list(OneM2MOperation._member_map_.values())[request['op'] - 1]
-            to = request['to']
-            del request['op'], request['to']
+            self.logger.debug('Decoded request: %s' % (request, ))
 
             try:
-                response = self._handle_request_func(
-                    OneM2MRequest(op, to, **request)
-                )
+                response = self._handle_request_func(request)
                 try:
                     response = response.get()
                 except AttributeError:
@@ -380,18 +477,13 @@ class OneM2MMQTTClient(OneM2MClient):
 
             if response.content:
                 sp_id, cse_id, _ = split_onem2m_address(response.to)
-                response.content = self._decode(
-                    encode_onem2m_content(response.content, 'application/json',
-                                          path=sp_id + cse_id,
-                                          fields=response.fields)[1]
-                )
+                path = sp_id + cse_id
+            else:
+                path = None
 
             self._publish_message(
-                self._encode({
-                    k: getattr(response, k) for k in self.__response_fields
-                    if getattr(response, k) is not None
-                }),
-                self._build_topic(originator, self._client_id, type='resp'),
+                codec.encode_response(response, path),
+                self._build_topic(originator, self._client_id, type='resp') + '/' + serialization,
             )
             self._processed_request_ids.append(rqi)
 
@@ -407,13 +499,23 @@ class OneM2MMQTTClient(OneM2MClient):
         """
 
         def handle_response():
+            topic = message.topic.split('/')
+            # responses of older versions come without serialization
+            serialization = topic[5] if len(topic) > 5 else 'json'
+            try:
+                codec = self._codecs[serialization]
+            except KeyError:
+                self.logger.error('Discarding response in unsupported serialization %s',
+                                  serialization)
+                return
+
             try:
-                response = self._decode(message.payload)
-            except JSONDecodeError as e:
-                self.logger.error('Discarding response w/ damaged payload: %s', (e.message, ))
+                response = codec.loads(message.payload)
+            except ValueError as e:
+                self.logger.error('Discarding response w/ damaged payload: %s', e)
                 return
 
-            promise_key = (message.topic.split('/')[4], response['rqi'])
+            promise_key = (topic[4], response['rqi'])
             try:
                 p = self._request_promises[promise_key]
             except KeyError:
@@ -423,24 +525,21 @@ class OneM2MMQTTClient(OneM2MClient):
                 )
                 return
 
+            rqi = response['rqi']
             try:
-                response['pc'] = decode_onem2m_content(self._encode(response['pc']),
-                                                       'application/json')
-            except KeyError:
-                pass
-            except CSEValueError as e:
+                response = codec.decode_response(response)
+            except CSESyntaxError as e:
                 self.logger.error(
                     'Content of response %s could not be parsed, throwing on the trash heap: %s'
-                    % (response['rqi'], e.message)
+                    % (rqi, e)
                 )
                 p.reject(e)
+                return
 
-            status_code = response['rsc']
-            del response['rsc']
-            if status_code >= ERROR_MIN:
-                p.reject(OneM2MErrorResponse(status_code, **response))
+            if isinstance(response, OneM2MErrorResponse):
+                p.reject(response)
             else:
-                p.fulfill(OneM2MResponse(status_code, **response))
+                p.fulfill(response)
 
         gevent.spawn(handle_response)
 
@@ -480,20 +579,6 @@ class OneM2MMQTTClient(OneM2MClient):
 
         client_id = self._get_client_id_from_originator(request.originator)
 
-        if request.ty and request.op == OneM2MOperation.create:
-            request.ty = ResourceTypeE[request.resource_type.typename].value
-        else:
-            request.ty = None
-
-        request.op = 1 + list(OneM2MOperation._member_map_.keys()).index(
-            OneM2MOperation[request.op].name)
-        if request.pc:
-            request.pc = self._decode(
-                encode_onem2m_content(request.pc, 'application/json', path=request.to)[1]
-            )
-        if request.fc:
-            request.fc = encode_onem2m_content(request.fc, 'application/json', path=request.to)[1]
-
         if self._default_target_id:
             target_id = self._default_target_id
         else:
@@ -518,11 +603,8 @@ class OneM2MMQTTClient(OneM2MClient):
         gevent.spawn_later(MQTT_RESPONSE_TIMEOUT, self._cancel_request, promises_key)
 
         self._publish_message(
-            self._encode({
-                str(k): getattr(request, k) for k in self.__request_fields
-                if getattr(request, k) is not None
-            }),
-            self._build_topic(client_id, target_id) + '/json',
+            self._codecs[self._serialization].encode_request(request),
+            self._build_topic(client_id, target_id) + '/' + self._serialization,
         )
 
         return p
@@ -535,6 +617,7 @@ class OneM2MMQTTClient(OneM2MClient):
         # - need to change the idea of the client_id, maybe two per entity
         # - different clients per broker, maybe per default target_id as well
         if self._client:
+            mqtt_loop.remove(self._client)
             self._client.disconnect()
             # TODO(sho): this is abominable. But for the time being, there seems to be no elegant
             #            solution to this.
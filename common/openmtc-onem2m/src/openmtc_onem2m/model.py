@@ -405,6 +405,12 @@ class FilterUsageE(OneM2MIntEnum):
     ConditionalRetrieval = 2
 
 
+@unique
+class ContentStatusE(OneM2MIntEnum):
+    partialContent = 1
+    fullContent = 2
+
+
 @unique
 class CountryCodeE(OneM2MIntEnum):
     india = 91
@@ -524,6 +530,7 @@ class FilterCriteria(OneM2MEntity):
     attribute = ListAttribute()  # m2m:attribute
     filterUsage = EntityAttribute(FilterUsageE)
     limit = Attribute(int)  # xs:nonNegativeInteger
+    offset = Attribute(int)  # xs:nonNegativeInteger
 
 # TODO: attribute
 
@@ -772,11 +779,13 @@ class EventNotificationCriteria(OneM2MEntity):
 
 
 class BatchNotify(OneM2MEntity):
-    pass  # TODO
+    number = Attribute(int)
+    duration = Attribute(int)  # seconds
 
 
 class RateLimit(OneM2MEntity):
-    pass  # TODO
+    maxNrOfNotify = Attribute(int)
+    timeWindow = Attribute(int)  # seconds
 
 
 class Subscription(RegularResourceC):
@@ -1484,6 +1493,7 @@ long_to_short_member_mapping = {
     "sizeBelow": "szb",
     "contentType": "cty",
     "limit": "lim",
+    "offset": "ofst",
     "attribute": "atr",
     "notificationEventType": "net",
     "operationMonitor": "om",
@@ -1593,6 +1603,25 @@ def get_short_member_name(n):
     return long_to_short_member_mapping.get(n)
 
 
+# resource, attribute and member names in one table each, resource names take
+# precedence over attribute names and those over member names
+long_to_short_mapping = dict(long_to_short_member_mapping)
+long_to_short_mapping.update(long_to_short_attribute_mapping)
+long_to_short_mapping.update(long_to_short_resource_mapping)
+
+short_to_long_mapping = dict(short_to_long_member_mapping)
+short_to_long_mapping.update(short_to_long_attribute_mapping)
+short_to_long_mapping.update(short_to_long_resource_mapping)
+
+
+def get_long_name(n):
+    return short_to_long_mapping.get(n)
+
+
+def get_short_name(n):
+    return long_to_short_mapping.get(n)
+
+
 long_to_short_root_mapping = {
     "requestPrimitive": "rqp",
     "responsePrimitive": "rsp"
@@ -63,13 +63,40 @@ def get_onem2m_encoder(accept):
     return get_serializer(accepted_type)
 
 
-def register_onem2m_serializer(content_type, factory):
+def register_onem2m_serializer(content_type, factory, replace=False):
+    if replace:
+        _factories[content_type] = factory
+        _serializers.pop(content_type, None)
+        return
+
     set_value = _factories.setdefault(content_type, factory)
 
     if set_value is not factory:
         raise OpenMTCError("Content type is already registered: %s" %
                            (content_type, ))
 
+
+try:
+    # orjson is optional, it speeds up encoding and decoding considerably
+    from .json.fast import OneM2MFastJsonSerializer
+except ImportError:
+    get_logger(__name__).debug("orjson not available, using the default JSON "
+                               "serializer")
+else:
+    for _content_type, _factory in list(_factories.items()):
+        if _factory is OneM2MJsonSerializer:
+            register_onem2m_serializer(_content_type, OneM2MFastJsonSerializer,
+                                       replace=True)
+    del _content_type, _factory
+
+try:
+    from .cbor import OneM2MCborSerializer
+except ImportError:
+    get_logger(__name__).debug("cbor2 not available, CBOR is not supported")
+else:
+    register_onem2m_serializer("application/vnd.onem2m-res+cbor",
+                               OneM2MCborSerializer)
+
 ################################################################################
 # import other serializers at serializers
 ################################################################################
@@ -7,13 +7,13 @@ from openmtc_onem2m.exc import CSESyntaxError, CSEBadRequest, CSEValueError
 from openmtc_onem2m.model import (get_onem2m_type, ContentInstance,
                                   ResourceTypeE, Notification,
                                   get_onem2m_resource_type,
-                                  get_short_attribute_name,
-                                  get_short_member_name, get_long_member_name,
+                                  get_short_member_name,
                                   get_short_resource_name,
-                                  get_long_attribute_name,
+                                  long_to_short_mapping, short_to_long_mapping,
                                   OneM2MEntity, OneM2MResource, Container,
-                                  get_long_resource_name, OneM2MContentResource,
-                                  URIList, OneM2MIntEnum, SecurityInfo)
+                                  OneM2MContentResource,
+                                  URIList, OneM2MIntEnum, SecurityInfo,
+                                  AggregatedNotification)
 
 _typename_matcher = re_compile(r'^m2m:([a-z]+)$')
 
@@ -22,7 +22,33 @@ def get_typename(tn):
     return _typename_matcher.findall(tn).pop()
 
 
+def get_resource_values(data):
+    """Splits a parsed representation {"m2m:<type>": {...}} into the
+    resource type and its values.
+    """
+    try:
+        typename, data = list(data.items())[0]
+        return get_onem2m_type(get_typename(typename)), data
+    except (AttributeError, IndexError, TypeError):
+        raise CSESyntaxError("Not a valid resource representation")
+
+
+def make_val(val_path, resource_id):
+    try:
+        if val_path:
+            val_path += '/' if not val_path.endswith('/') else ''
+    except AttributeError:
+        val_path = ''
+
+    if resource_id.startswith(val_path):
+        return resource_id
+    return val_path + resource_id
+
+
 class OneM2MSerializer(LoggerMixin, metaclass=ABCMeta):
+    #: encode_resource() returns bytes instead of text
+    binary = False
+
     @abstractmethod
     def encode_resource(self, resource, response, pretty=False,
                         encoding="utf-8", fields=None):
@@ -34,6 +60,9 @@ class OneM2MSerializer(LoggerMixin, metaclass=ABCMeta):
 
     def decode(self, s):
         resource_type, data = self.decode_resource_values(s)
+        return self.decode_values(resource_type, data)
+
+    def decode_values(self, resource_type, data):
         if issubclass(resource_type, OneM2MContentResource):
             return resource_type(data)
         child_resource = data.pop("childResource", None)
@@ -47,9 +76,16 @@ class OneM2MSerializer(LoggerMixin, metaclass=ABCMeta):
             except (TypeError, AttributeError, KeyError, ValueError):
                 raise CSEValueError("Invalid entry in child resources: %s",
                                     child_resource)
+        if resource_type is AggregatedNotification:
+            # the notifications are already parsed
+            data["notification"] = [
+                self.decode_values(Notification, n)
+                for n in data.pop("m2m:sgn", None) or ()
+            ]
         if resource_type is Notification and data.get("notificationEvent"):
             representation = data["notificationEvent"]["representation"]
-            representation = self.decode(self.dumps(representation))
+            representation = self.decode_values(
+                *get_resource_values(representation))
             data["notificationEvent"]["representation"] = representation
         resource = resource_type(**data)
         if child_resource:
@@ -77,22 +113,18 @@ class OneM2MDictSerializer(OneM2MSerializer):
                         event.representation, pretty, path, encoding, fields, True
                     )
                     representation["notificationEvent"] = {
-                        get_short_attribute_name(k) or get_short_member_name(k): v
-                        for k, v in e.items()
+                        long_to_short_mapping.get(k): v for k, v in e.items()
                     }
             except (AttributeError, KeyError):
                 self.logger.exception("failed to encode notify")
 
-        def make_val(val_path, resource_id):
-            try:
-                if val_path:
-                    val_path += '/' if not val_path.endswith('/') else ''
-            except AttributeError:
-                val_path = ''
-
-            if resource_id.startswith(val_path):
-                return resource_id
-            return val_path + resource_id
+        if isinstance(resource, AggregatedNotification):
+            # the notifications are encoded as list of m2m:sgn
+            representation = {"m2m:sgn": [
+                self.encode_resource(n, pretty, path, encoding, fields,
+                                     True)["m2m:sgn"]
+                for n in representation.get("notification") or ()
+            ]}
 
         if isinstance(resource, OneM2MResource) and "childResource" in representation:
 
@@ -113,14 +145,14 @@ class OneM2MDictSerializer(OneM2MSerializer):
             if isinstance(resource.oldest, ContentInstance):
                 representation['oldest'] = resource.oldest.resourceID
 
-        if not isinstance(resource, OneM2MContentResource):
-            representation = {
-                get_short_resource_name(k) or get_short_attribute_name(k) or
-                get_short_member_name(k): v for
-                k, v in representation.items()}
+        if not isinstance(resource, (OneM2MContentResource,
+                                     AggregatedNotification)):
+            representation = self._shorten_keys(type(resource),
+                                                representation)
 
         if not isinstance(resource, (OneM2MResource, Notification,
-                                     SecurityInfo, OneM2MContentResource)):
+                                     AggregatedNotification, SecurityInfo,
+                                     OneM2MContentResource)):
             return representation
 
         typename = 'm2m:' + (get_short_resource_name(resource.typename) or
@@ -134,6 +166,22 @@ class OneM2MDictSerializer(OneM2MSerializer):
 
         return self.dumps({typename: representation})
 
+    def _shorten_keys(self, resource_type, representation):
+        get_short_name = long_to_short_mapping.get
+        return {get_short_name(k): v for k, v in representation.items()}
+
+    def encode_resource_chunks(self, resource, pretty=False, path=None,
+                               encoding="utf-8", fields=None,
+                               chunk_size=1000):
+        """Like encode_resource() but returns an iterable of string chunks.
+
+        Serializers able to stream large representations (e.g. the URI list
+        of a discovery) override this, by default the whole representation
+        is returned as single chunk.
+        """
+        yield self.encode_resource(resource, pretty=pretty, path=path,
+                                   encoding=encoding, fields=fields)
+
     def _handle_partial_addressing(self, resource, pretty):
         for k, v in resource.items():
             if k in ('latest', 'oldest') and isinstance(v, ContentInstance):
@@ -144,22 +192,40 @@ class OneM2MDictSerializer(OneM2MSerializer):
 
     def decode_resource_values(self, s):
 
+        get_long_name = short_to_long_mapping.get
+
         def convert_to_long_keys(d):
-            return {get_long_resource_name(k) or get_long_attribute_name(k) or
-                    get_long_member_name(k) or k: v for k, v in d.items()}
+            return {get_long_name(k, k): v for k, v in d.items()}
 
         try:
             if hasattr(s, "read"):
                 data = self.load(s, object_hook=convert_to_long_keys)
             else:
+                # str, bytes or bytearray, the buffer is parsed as it is
                 data = self.loads(s, object_hook=convert_to_long_keys)
         except (ValueError, TypeError) as exc:
             raise CSEBadRequest("Failed to parse input: %s" % (exc, ))
 
         self.logger.debug("Read data: %s", data)
 
-        try:
-            typename, data = list(data.items())[0]
-            return get_onem2m_type(get_typename(typename)), data
-        except (AttributeError, IndexError, TypeError):
-            raise CSESyntaxError("Not a valid resource representation")
+        return get_resource_values(data)
+
+    def decode_resource_data(self, data):
+        get_long_name = short_to_long_mapping.get
+
+        def convert_to_long_keys(value):
+            if type(value) is dict:
+                return {get_long_name(k, k): convert_to_long_keys(v)
+                        for k, v in value.items()}
+            if type(value) is list:
+                return [convert_to_long_keys(v) for v in value]
+            return value
+
+        return get_resource_values(convert_to_long_keys(data))
+
+    def decode_parsed(self, data):
+        """Decodes a representation already parsed by loads(), e.g. the
+        content of a request primitive.
+        """
+        resource_type, data = self.decode_resource_data(data)
+        return self.decode_values(resource_type, data)
@@ -0,0 +1,69 @@
+from datetime import datetime
+
+from cbor2 import dumps, loads, CBORError
+
+from openmtc.timestamp import Timestamp, format_timestamp
+from openmtc_onem2m.model import ContentInstance
+from openmtc_onem2m.serializer.base import OneM2MDictSerializer
+from openmtc_onem2m.serializer.tables import OneM2MKeyTableMixin
+
+
+def _prepare(value):
+    # timestamps are strings in oneM2M, cbor2 encodes datetimes natively
+    if type(value) is dict:
+        return {k: _prepare(v) if type(v) in _prepared else v
+                for k, v in value.items()}
+    if type(value) is list:
+        return [_prepare(v) if type(v) in _prepared else v for v in value]
+    return format_timestamp(value)
+
+
+_prepared = frozenset((dict, list, datetime, Timestamp))
+
+
+def _default(encoder, x):
+    if isinstance(x, datetime):
+        encoder.encode(format_timestamp(x))
+    elif isinstance(x, ContentInstance):
+        encoder.encode(x.resourceID)
+    else:
+        try:  # handle model classes
+            values = x.values
+        except AttributeError:
+            raise TypeError("%s (%s)" % (x, type(x)))
+        encoder.encode(_prepare(values) if type(values) in _prepared
+                       else values)
+
+
+def _dumps(obj):
+    if type(obj) in _prepared:
+        obj = _prepare(obj)
+    return dumps(obj, default=_default)
+
+
+def _loads(s):
+    # raise ValueError on invalid input like the JSON decoders
+    try:
+        return loads(s)
+    except CBORError as exc:
+        raise ValueError(str(exc))
+
+
+def _load(fp):
+    return _loads(fp.read())
+
+
+class OneM2MCborSerializer(OneM2MKeyTableMixin, OneM2MDictSerializer):
+    """Encodes resources as CBOR (application/vnd.onem2m-res+cbor).
+
+    The representation is the same as for JSON: short names and timestamps
+    as strings. Byte strings are sent as they are.
+    """
+
+    binary = True
+
+    def __init__(self, *args, **kw):
+        self.loads = _loads
+        self.load = _load
+        # there is no pretty representation of binary data
+        self.dumps = self.pretty_dumps = _dumps
@@ -1,8 +1,11 @@
-from openmtc_onem2m.serializer.base import OneM2MDictSerializer
+from openmtc_onem2m.serializer.base import OneM2MDictSerializer, make_val
 from json import JSONEncoder
 from futile.logging import get_logger
 from datetime import datetime
-from openmtc_onem2m.model import ContentInstance
+from openmtc.timestamp import format_timestamp
+from openmtc_onem2m.model import (ContentInstance, URIList,
+                                  get_short_resource_name,
+                                  get_short_member_name)
 
 logger = get_logger(__name__)
 
@@ -30,7 +33,7 @@ del logger
 
 def _default(x):
     if isinstance(x, datetime):
-        return x.strftime("%Y%m%dT%H%M%S")
+        return format_timestamp(x)
     elif isinstance(x, ContentInstance):
         return x.resourceID
     elif isinstance(x, bytes):
@@ -57,3 +60,24 @@ class OneM2MJsonSerializer(OneM2MDictSerializer):
         self.load = load
         self.dumps = _simple_encoder.encode
         self.pretty_dumps = _pretty_encoder.encode
+
+    def encode_resource_chunks(self, resource, pretty=False, path=None,
+                               encoding="utf-8", fields=None,
+                               chunk_size=1000):
+        if pretty or not isinstance(resource, URIList):
+            for chunk in super(OneM2MJsonSerializer, self).encode_resource_chunks(
+                    resource, pretty, path, encoding, fields, chunk_size):
+                yield chunk
+            return
+
+        # stream the URIs of large discovery results instead of building
+        # the complete document in memory
+        typename = 'm2m:' + (get_short_resource_name(resource.typename) or
+                             get_short_member_name(resource.typename))
+        yield '{"%s":[' % (typename, )
+        dumps = self.dumps
+        uris = resource.values
+        for i in range(0, len(uris), chunk_size):
+            chunk = [make_val(path, x) for x in uris[i:i + chunk_size]]
+            yield ("," if i else "") + dumps(chunk)[1:-1]
+        yield ']}'
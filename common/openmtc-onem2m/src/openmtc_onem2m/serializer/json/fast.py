@@ -0,0 +1,55 @@
+"""JSON serializer based on orjson.
+
+Only importable if orjson is installed.
+"""
+
+from datetime import datetime
+
+from orjson import (dumps, loads, OPT_INDENT_2, OPT_NON_STR_KEYS,
+                    OPT_PASSTHROUGH_DATETIME)
+
+from openmtc.timestamp import format_timestamp
+from openmtc_onem2m.model import ContentInstance
+from openmtc_onem2m.serializer.json import OneM2MJsonSerializer
+from openmtc_onem2m.serializer.tables import OneM2MKeyTableMixin
+
+
+def _default(x):
+    if isinstance(x, datetime):
+        return format_timestamp(x)
+    elif isinstance(x, ContentInstance):
+        return x.resourceID
+    elif isinstance(x, bytes):
+        return x.decode('utf-8')
+    else:
+        try:  # handle model classes
+            return x.values
+        except AttributeError:
+            raise TypeError("%s (%s)" % (x, type(x)))
+
+
+# enums are encoded by orjson as their value
+_options = OPT_NON_STR_KEYS | OPT_PASSTHROUGH_DATETIME
+
+
+def _dumps(obj):
+    return dumps(obj, default=_default, option=_options).decode("utf-8")
+
+
+def _pretty_dumps(obj):
+    return dumps(obj, default=_default,
+                 option=_options | OPT_INDENT_2).decode("utf-8")
+
+
+def _load(fp):
+    return loads(fp.read())
+
+
+class OneM2MFastJsonSerializer(OneM2MKeyTableMixin, OneM2MJsonSerializer):
+    def __init__(self, *args, **kw):
+        super(OneM2MFastJsonSerializer, self).__init__(*args, **kw)
+
+        self.loads = loads
+        self.load = _load
+        self.dumps = _dumps
+        self.pretty_dumps = _pretty_dumps
@@ -0,0 +1,162 @@
+"""Encoding of request and response primitives (TS 0010, sec. 6.4).
+
+A primitive is encoded as a single document holding its parameters and the
+representation of its content. The content is built as part of that document
+and decoded from it, so a primitive is serialized and parsed exactly once.
+"""
+
+from operator import attrgetter
+
+from openmtc_onem2m.exc import ERROR_MIN
+from openmtc_onem2m.model import ResourceTypeE
+from openmtc_onem2m.serializer import get_onem2m_decoder
+from openmtc_onem2m.transport import (OneM2MErrorResponse, OneM2MOperation,
+                                      OneM2MRequest, OneM2MResponse)
+
+request_fields = (
+    'op',
+    'to',
+    'fr',
+    'rqi',
+    'ty',
+    'pc',
+    'rids',
+    'ot',
+    'rqet',
+    'rset',
+    'oet',
+    'rt',
+    'rp',
+    'rcn',
+    'ec',
+    'da',
+    'gid',
+    'fc',
+    'drt',
+    'tids',
+    'ltids',
+    'tqi',
+    'rvi',
+    'vsi',
+)
+
+response_fields = (
+    'rsc',
+    'rqi',
+    'pc',
+    'to',
+    'fr',
+    'ot',
+    'rset',
+    'ec',
+    'cts',
+    'cto',
+    'rvi',
+    'vsi',
+)
+
+_request_values = attrgetter(*request_fields)
+_response_values = attrgetter(*response_fields)
+
+#: operation -> operation code of the primitive and vice versa
+_operation_codes = {op: code for code, op in enumerate(OneM2MOperation, 1)}
+_operations = {code: op for op, code in _operation_codes.items()}
+
+
+class OneM2MPrimitiveCodec(object):
+    """Encodes and decodes the primitives of a content type.
+
+    :param str content_type: content type of the resource representations,
+                             e.g. application/json
+    """
+
+    def __init__(self, content_type):
+        super(OneM2MPrimitiveCodec, self).__init__()
+        self.content_type = content_type
+        self._serializer = serializer = get_onem2m_decoder(content_type)
+        self.dumps = serializer.dumps
+        #: parses a payload into the primitive dict, raises ValueError
+        self.loads = serializer.loads
+
+    def _encode_content(self, content, path, fields=None):
+        return self._serializer.encode_resource(content, path=path,
+                                                fields=fields,
+                                                encapsulated=True)
+
+    def decode_content(self, content):
+        """Decodes the content of a parsed primitive.
+
+        :raises CSESyntaxError: if the content is no valid representation
+        """
+        if not content:
+            return None
+        return self._serializer.decode_parsed(content)
+
+    def encode_request(self, request):
+        """
+        :param OneM2MRequest request:
+        :return: the payload
+        """
+        primitive = {
+            k: v for k, v in zip(request_fields, _request_values(request))
+            if v is not None
+        }
+        op = request.op
+        primitive['op'] = _operation_codes[op]
+        if request.ty and op == OneM2MOperation.create:
+            primitive['ty'] = ResourceTypeE[request.ty.typename].value
+        else:
+            primitive.pop('ty', None)
+        if request.pc:
+            primitive['pc'] = self._encode_content(request.pc, request.to)
+        if request.fc:
+            primitive['fc'] = self._encode_content(request.fc, request.to)
+        return self.dumps(primitive)
+
+    def decode_request(self, primitive):
+        """Creates the request of a primitive parsed by loads(). The
+        primitive is reused for the arguments of the request.
+
+        :raises CSESyntaxError: if the content is no valid representation
+        :raises KeyError: if op or to is missing
+        :raises ValueError: if the operation is unknown
+        """
+        op = primitive.pop('op')
+        try:
+            op = _operations[op]
+        except (KeyError, TypeError):
+            raise ValueError('Unknown operation: %s' % (op, ))
+        to = primitive.pop('to')
+        pc = primitive['pc'] = self.decode_content(primitive.get('pc'))
+        primitive['ty'] = type(pc) if pc is not None else None
+        return OneM2MRequest(op, to, **primitive)
+
+    def encode_response(self, response, path=None):
+        """
+        :param OneM2MResponse response:
+        :param str path: path prefix of the resource IDs in the content
+        :return: the payload
+        """
+        primitive = {
+            k: v for k, v in zip(response_fields, _response_values(response))
+            if v is not None
+        }
+        if response.pc:
+            primitive['pc'] = self._encode_content(response.pc, path,
+                                                   response.fields)
+        return self.dumps(primitive)
+
+    def decode_response(self, primitive):
+        """Creates the response of a primitive parsed by loads(). The
+        primitive is reused for the arguments of the response.
+
+        Error responses are returned as OneM2MErrorResponse.
+
+        :raises CSESyntaxError: if the content is no valid representation
+        """
+        status_code = primitive.pop('rsc')
+        if 'pc' in primitive:
+            primitive['pc'] = self.decode_content(primitive['pc'])
+        if status_code >= ERROR_MIN:
+            return OneM2MErrorResponse(status_code, **primitive)
+        return OneM2MResponse(status_code, **primitive)
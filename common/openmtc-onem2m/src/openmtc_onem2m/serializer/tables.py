@@ -0,0 +1,259 @@
+"""Precomputed translation between the long names of the model and the short
+names of the serialized representations.
+
+Instead of up to three name lookups per key, the names are translated with
+the merged tables of the model. Resource classes get an encoder building
+their short named representation from the stored values in a single pass.
+"""
+
+from datetime import datetime
+
+from openmtc.model import Attribute, Entity, EntityAttribute
+from openmtc_onem2m.exc import CSEBadRequest, CSESyntaxError
+from openmtc_onem2m.model import (AggregatedNotification, Notification,
+                                  OneM2MContentResource, OneM2MResource,
+                                  long_to_short_mapping,
+                                  long_to_short_member_mapping,
+                                  long_to_short_resource_mapping,
+                                  short_to_long_mapping)
+from openmtc_onem2m.serializer.base import get_resource_values, make_val
+
+_short_names = long_to_short_mapping
+_long_names = short_to_long_mapping
+
+
+class _KeyTable(dict):
+    """Translation table of a resource class.
+
+    Holds the names of the attributes of the class, other keys are looked up
+    in the complete table without being added.
+    """
+
+    def __init__(self, names, fallback):
+        super(_KeyTable, self).__init__(names)
+        self.fallback = fallback
+
+    def __missing__(self, key):
+        return self.fallback(key)
+
+
+_short_tables = {}
+
+
+def _get_short_table(resource_type):
+    try:
+        return _short_tables[resource_type]
+    except KeyError:
+        names = getattr(resource_type, "attribute_names", ())
+        table = _short_tables[resource_type] = _KeyTable(
+            ((n, _short_names.get(n)) for n in names), _short_names.get)
+        return table
+
+
+# values of these types hold no objects with keys to translate
+_flat_types = (str, int, float, bytes, datetime)
+
+class _ResourceDecoder(object):
+    """Translates the keys of the representations of a resource class.
+
+    Representations of a class mostly come with the same keys in the same
+    order. The long names of such a key order are translated once and
+    reused, only the values of attributes that can hold objects are walked.
+    """
+
+    # key orders remembered per class, others are translated key by key
+    max_key_orders = 32
+
+    def __init__(self, resource_type):
+        super(_ResourceDecoder, self).__init__()
+        self.resource_type = resource_type
+
+        flat = set()
+        for attr in getattr(resource_type, "attributes", ()):
+            value_type = getattr(attr, "content_type", attr.type)
+            if (not isinstance(attr, EntityAttribute) and
+                    isinstance(value_type, type) and
+                    issubclass(value_type, _flat_types)):
+                flat.add(_short_names.get(attr.name))
+        self.flat = frozenset(flat)
+
+        # key order -> (long names, (short, long) names of the keys to walk)
+        self.key_orders = {}
+
+    def _get_key_order(self, keys):
+        key_orders = self.key_orders
+        try:
+            return key_orders[keys]
+        except KeyError:
+            if len(key_orders) >= self.max_key_orders:
+                return None
+            get_long = _long_names.get
+            flat = self.flat
+            key_order = key_orders[keys] = (
+                tuple(get_long(k, k) for k in keys),
+                tuple((k, get_long(k, k)) for k in keys if k not in flat))
+            return key_order
+
+    def decode(self, values):
+        key_order = self._get_key_order(tuple(values))
+        if key_order is None:
+            get_long = _long_names.get
+            flat = self.flat
+            return {
+                get_long(k, k): v if k in flat or type(v) not in _nested else
+                _to_long_keys(v) for k, v in values.items()}
+
+        long_names, walk = key_order
+        result = dict(zip(long_names, values.values()))
+        for k, long_name in walk:
+            v = values[k]
+            if v and type(v) in _nested:
+                result[long_name] = _to_long_keys(v)
+        return result
+
+
+# "m2m:<type>" -> decoder
+_decoders = {}
+
+
+def _get_decoder(typename, data):
+    try:
+        return _decoders[typename]
+    except KeyError:
+        resource_type, _ = get_resource_values(data)
+        decoder = _decoders[typename] = _ResourceDecoder(resource_type)
+        return decoder
+
+
+class _ResourceEncoder(object):
+    """Builds the short named representation of a resource class.
+
+    Values of plain attributes are read from the instance directly, other
+    attributes (e.g. lists creating their default on access) are read through
+    their descriptor.
+    """
+
+    def __init__(self, resource_type):
+        super(_ResourceEncoder, self).__init__()
+        typename = resource_type.typename
+        self.typename = 'm2m:' + (long_to_short_resource_mapping.get(typename)
+                                  or long_to_short_member_mapping.get(typename))
+
+        attributes = []
+        for attr in resource_type.attributes:
+            name = attr.name
+            key = "_" + name
+            direct = (type(attr).__get__ is Attribute.__get__ and
+                      not hasattr(resource_type, key))
+            attributes.append((name, _short_names.get(name), key, attr.default,
+                               direct))
+        self.attributes = tuple(attributes)
+
+    def encode(self, resource):
+        d = resource.__dict__
+        return {
+            short: d.get(key, default) if direct else getattr(resource, name)
+            for name, short, key, default, direct in self.attributes
+        }
+
+
+_encoders = {}
+
+
+def _get_encoder(resource_type):
+    try:
+        return _encoders[resource_type]
+    except KeyError:
+        # resources overriding how their values are collected (e.g. flexible
+        # containers) and special representations use the generic path
+        if (issubclass(resource_type, OneM2MResource) and
+                not issubclass(resource_type, (Notification,
+                                               AggregatedNotification,
+                                               OneM2MContentResource)) and
+                resource_type.get_values is Entity.get_values and
+                resource_type.get_attribute_values is
+                Entity.get_attribute_values):
+            encoder = _ResourceEncoder(resource_type)
+        else:
+            encoder = None
+        _encoders[resource_type] = encoder
+        return encoder
+
+
+def _to_long_keys(value, get_long=_long_names.get):
+    if type(value) is dict:
+        return {get_long(k, k): v if type(v) not in _nested else
+                _to_long_keys(v) for k, v in value.items()}
+    return [v if type(v) not in _nested else _to_long_keys(v) for v in value]
+
+
+_nested = frozenset((dict, list))
+
+
+class OneM2MKeyTableMixin(object):
+    """Encodes and decodes resources using the precomputed tables.
+
+    Mixed into serializers providing dumps(), pretty_dumps(), loads() and
+    load(). loads() and load() are called without object_hook.
+    """
+
+    def encode_resource(self, resource, pretty=False, path=None,
+                        encoding="utf-8", fields=None, encapsulated=False):
+        encoder = not fields and _get_encoder(type(resource))
+        if not encoder:
+            return super(OneM2MKeyTableMixin, self).encode_resource(
+                resource, pretty, path, encoding, fields, encapsulated)
+
+        representation = encoder.encode(resource)
+
+        children = representation.get("ch")
+        if children is not None:
+            representation["ch"] = [{
+                "val": make_val(path, c.resourceID),
+                "nm": c.basename,
+                "typ": c.resourceType
+            } for c in children]
+
+        # latest and oldest of containers are encoded as their resourceID
+        # by the default hook of dumps()
+
+        representation = {encoder.typename: representation}
+
+        if encapsulated:
+            return representation
+
+        if pretty:
+            return self.pretty_dumps(representation)
+
+        return self.dumps(representation)
+
+    def _shorten_keys(self, resource_type, representation):
+        names = _get_short_table(resource_type)
+        return {names[k]: v for k, v in representation.items()}
+
+    def decode_resource_values(self, s):
+        try:
+            if hasattr(s, "read"):
+                data = self.load(s)
+            else:
+                data = self.loads(s)
+        except (ValueError, TypeError) as exc:
+            raise CSEBadRequest("Failed to parse input: %s" % (exc, ))
+
+        self.logger.debug("Read data: %s", data)
+
+        return self.decode_resource_data(data)
+
+    def decode_resource_data(self, data):
+        try:
+            typename, values = next(iter(data.items()))
+        except (AttributeError, StopIteration):
+            raise CSESyntaxError("Not a valid resource representation")
+        decoder = _get_decoder(typename, data)
+
+        if type(values) is not dict:
+            if type(values) in _nested:
+                values = _to_long_keys(values)
+            return decoder.resource_type, values
+
+        return decoder.resource_type, decoder.decode(values)
@@ -32,4 +32,27 @@ def encode_onem2m_content(content, content_type, pretty=False, path=None,
     data = serializer.encode_resource(content, pretty=pretty, path=path,
                                       fields=fields)
 
+    if serializer.binary:
+        return content_type, data
+    return content_type + "; charset=utf-8", data
+
+
+def encode_onem2m_content_chunks(content, content_type, pretty=False,
+                                 path=None, fields=None, chunk_size=1000):
+    """Like encode_onem2m_content() but returns the data as iterable of
+    string chunks (see OneM2MDictSerializer.encode_resource_chunks()).
+    """
+    logger.debug("Encoding result in chunks: %s", content_type)
+
+    if content is None:
+        return None, None
+
+    serializer = get_onem2m_encoder(content_type)
+
+    data = serializer.encode_resource_chunks(content, pretty=pretty,
+                                             path=path, fields=fields,
+                                             chunk_size=chunk_size)
+
+    if serializer.binary:
+        return content_type, data
     return content_type + "; charset=utf-8", data
@@ -2,12 +2,11 @@ from abc import ABCMeta
 from collections import Sequence, OrderedDict, Mapping
 from datetime import datetime
 from enum import Enum
-from iso8601 import parse_date, ParseError
-from operator import attrgetter
 
 from futile import issubclass, NOT_SET
 from futile.logging import LoggerMixin
 from openmtc.model.exc import ModelError, ModelTypeError
+from openmtc.timestamp import parse_timestamp
 
 
 class StrEnum(str, Enum):
@@ -90,7 +89,7 @@ class Member(LoggerMixin):
         self.set_value(instance, value)
 
     def set_value(self, instance, value):
-        setattr(instance, "_" + self.name, value)
+        instance.__dict__["_" + self.name] = value
 
     def convert(self, value, instance):
         try:
@@ -186,10 +185,7 @@ class DatetimeAttribute(Attribute):
 
     def convert(self, value, instance):
         if isinstance(value, str):
-            try:
-                return parse_date(value)
-            except ParseError as e:
-                raise ValueError(str(e))
+            return parse_timestamp(value)
         return super(DatetimeAttribute, self).convert(value, instance)
 
 
@@ -422,22 +418,50 @@ class ResourceType(ABCMeta):
 
         self.__members__ = attributes + subresources + collections
 
-    # TODO: caching
+        # name or name + "Reference" -> (member, is list, is reference), so
+        # set_values() only looks at the given values instead of all members
+        members_by_name = self._members_by_name = {}
+        for member in self.__members__:
+            is_list = isinstance(member, ListAttribute)
+            members_by_name[member.name + "Reference"] = (member, is_list,
+                                                          True)
+        for member in self.__members__:
+            is_list = isinstance(member, ListAttribute)
+            members_by_name[member.name] = (member, is_list, False)
+
+        # attribute name -> key of its value in the instance __dict__
+        self._value_keys = {a.name: "_" + a.name for a in attributes}
+
+        self._attribute_names = tuple(a.name for a in attributes)
+        self._collection_names = tuple(c.name for c in collections)
+        self._subresource_names = tuple(s.name for s in subresources)
+        self._member_names = tuple(m.name for m in self.__members__)
+
+        # used to check the representations of create and update requests
+        self.mandatory_attributes = tuple(
+            a for a in attributes if getattr(a, "mandatory", False))
+        self.read_only_attributes = tuple(
+            a for a in attributes
+            if getattr(a, "accesstype", None) == Attribute.RO)
+        self.write_once_attributes = tuple(
+            a for a in attributes
+            if getattr(a, "accesstype", None) == Attribute.WO)
+
     @property
     def attribute_names(self):
-        return list(map(attrgetter("name"), self.attributes))
+        return self._attribute_names
 
     @property
     def collection_names(self):
-        return list(map(attrgetter("name"), self.collections))
+        return self._collection_names
 
     @property
     def subresource_names(self):
-        return list(map(attrgetter("name"), self.subresources))
+        return self._subresource_names
 
     @property
     def member_names(self):
-        return list(map(attrgetter("name"), self.__members__))
+        return self._member_names
 
 
 class Entity(LoggerMixin, metaclass=ResourceType):
@@ -445,31 +469,67 @@ class Entity(LoggerMixin, metaclass=ResourceType):
         self.set_values(kw)
 
     def set_values(self, values):
-        self.logger.debug("Setting values for entity of type %s with %s",
-                          type(self), values)
-        values = values.copy()
+        self._set_member_values(values, False)
 
-        for member in self.__members__:
+    def _set_member_values(self, values, lists_from_mappings):
+        members_by_name = self._members_by_name
+        extra_values = {}
+
+        for k, v in values.items():
             try:
-                v = values.pop(member.name)
-                if (v is not None and isinstance(member, ListAttribute) and
-                        not isinstance(v, (list, tuple, set))):
-                    l = [v]
-                    v = l
-                setattr(self, member.name, v)
+                member, is_list, is_reference = members_by_name[k]
             except KeyError:
-                try:
-                    v = values.pop(member.name + "Reference")
-                    # TODO: proper solution?
-                    if (v is not None and isinstance(member, ListAttribute) and
-                            not isinstance(v, (list, tuple, set))):
-                        v = list(v.values())[0]
-                    setattr(self, member.name, v)
-                except KeyError:
-                    pass
+                extra_values[k] = v
+                continue
+            if is_reference and member.name in values:
+                extra_values[k] = v
+                continue
+            if (v is not None and is_list and
+                    not isinstance(v, (list, tuple, set))):
+                # TODO: proper solution?
+                if is_reference or lists_from_mappings:
+                    v = list(v.values())[0]
+                else:
+                    v = [v]
+            member.__set__(self, v)
 
-        if values:
-            self._set_extra_values(values)
+        if extra_values:
+            self._set_extra_values(extra_values)
+
+    @classmethod
+    def from_trusted_values(cls, values, *args, **kw):
+        """Creates an entity from values that are already of the right types.
+
+        The values of attributes are stored without any conversion or
+        checks, so this must only be used for values taken from other
+        entities or created internally, never for received data.
+        """
+        entity = cls(*args, **kw)
+        entity._set_trusted_values(values)
+        return entity
+
+    def _set_trusted_values(self, values):
+        d = self.__dict__
+        value_keys = self._value_keys
+        other_values = {}
+
+        for k, v in values.items():
+            try:
+                d[value_keys[k]] = v
+            except KeyError:
+                other_values[k] = v
+
+        if other_values:
+            self.set_values(other_values)
+
+    def __copy__(self):
+        # same as the default of copy() without building the arguments of
+        # __reduce_ex__(), the copy keeps sharing the keys of its instance
+        # dict with all instances of the class
+        cls = type(self)
+        c = cls.__new__(cls)
+        c.__dict__.update(self.__dict__)
+        return c
 
     def _set_extra_values(self, values):
         """
@@ -601,45 +661,29 @@ class Resource(Entity):
             return getattr(self, self.id_attribute)
 
     def set_values(self, values):
-        values = values.copy()
-
-        keys = [k for k in values.keys() if "_" in k]
-        for k in keys:
-            values[k.replace("_", "-")] = values.pop(k)
+        for k in values:
+            if "_" in k:
+                values = {k.replace("_", "-"): v for k, v in values.items()}
+                break
 
         path = self.path
         if path is not None:
+            missing_values = {}
             id_attribute = self.id_attribute
             if (id_attribute is not None and
                     id_attribute not in values):
-                values[id_attribute] = path.rpartition("/")[-1]
+                missing_values[id_attribute] = path.rpartition("/")[-1]
 
             path_attribute = self.path_attribute
             if (path_attribute is not None and
                     path_attribute not in values):
-                values[path_attribute] = path
+                missing_values[path_attribute] = path
 
-        for member in self.__members__:
-            try:
-                v = values.pop(member.name)
-                # FIXME: move into de-serializer and handle dicts
-                if (v is not None and isinstance(member, ListAttribute) and
-                        not isinstance(v, (list, tuple, set))):
-                    v = list(v.values())[0]
-                setattr(self, member.name, v)
-            except KeyError:
-                try:
-                    v = values.pop(member.name + "Reference")
-                    # TODO: proper solution?
-                    if (v is not None and isinstance(member, ListAttribute) and
-                            not isinstance(v, (list, tuple, set))):
-                        v = list(v.values())[0]
-                    setattr(self, member.name, v)
-                except KeyError:
-                    pass
+            if missing_values:
+                values = dict(values, **missing_values)
 
-        if values:
-            self._set_extra_values(values)
+        # FIXME: move into de-serializer and handle dicts
+        self._set_member_values(values, True)
 
     def __repr__(self):
         return "%s(path='%s', name='%s')" % (type(self).__name__, self.path,
@@ -664,12 +708,15 @@ class FlexibleAttributesMixin(object):
 
     def __setattr__(self, k, v):
         if not k.startswith("_") and not hasattr(self, k) and k != "parent":
-            self._flex_attrs.add(k)
+            # never modify the set in place, it is shared with copies of the
+            # entity (see Entity.__copy__())
+            self._flex_attrs = self._flex_attrs | {k}
 
         return super(FlexibleAttributesMixin, self).__setattr__(k, v)
 
     def __delattr__(self, k):
-        self._flex_attrs.discard(k)
+        if k in self._flex_attrs:
+            self._flex_attrs = self._flex_attrs - {k}
 
         return super(FlexibleAttributesMixin, self).__delattr__(k)
 
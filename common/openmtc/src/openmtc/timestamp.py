@@ -0,0 +1,95 @@
+"""Timestamps of the model.
+
+Timestamps are parsed from the oneM2M basic format (20170101T120000) or any
+other ISO 8601 format and keep their formatted representation and their
+POSIX timestamp once computed, so they are only formatted and converted
+once no matter how often a resource is encoded or compared.
+"""
+
+from datetime import datetime, timezone
+
+from iso8601 import ParseError, parse_date
+
+UTC = timezone.utc
+
+
+class Timestamp(datetime):
+    """A datetime caching its oneM2M representation and POSIX timestamp.
+
+    Arithmetic results and copies like replace() are Timestamps as well but
+    start without cached values.
+    """
+
+    __slots__ = ("_formatted", "_epoch")
+
+    def timestamp(self):
+        try:
+            return self._epoch
+        except AttributeError:
+            epoch = self._epoch = datetime.timestamp(self)
+            return epoch
+
+
+def parse_timestamp(value):
+    """Parses a timestamp in the oneM2M basic format or ISO 8601.
+
+    Timestamps without time zone are taken as UTC.
+
+    :raises ValueError: if value is no valid timestamp
+    """
+    if not isinstance(value, str):
+        raise ValueError("Invalid timestamp: %r" % (value,))
+
+    if (len(value) == 15 and value[8] == "T" and value[:8].isdigit() and
+            value[9:].isdigit()):
+        # the basic format without fractions, it is its own formatting
+        try:
+            timestamp = Timestamp.fromisoformat(value + "Z")
+        except ValueError:
+            # no basic format support before Python 3.11
+            pass
+        else:
+            timestamp._formatted = value
+            return timestamp
+
+    try:
+        timestamp = Timestamp.fromisoformat(value)
+    except ValueError:
+        # only the most common formats are supported by fromisoformat()
+        try:
+            timestamp = parse_date(value)
+        except ParseError as e:
+            # no ValueError in some versions of iso8601
+            raise ValueError(str(e))
+        return Timestamp(timestamp.year, timestamp.month, timestamp.day,
+                         timestamp.hour, timestamp.minute, timestamp.second,
+                         timestamp.microsecond, timestamp.tzinfo)
+
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=UTC)
+    return timestamp
+
+
+def format_timestamp(value):
+    """Returns the oneM2M basic format of a datetime, e.g. 20170101T120000.
+
+    Like strftime() the date and time are taken as they are, without
+    converting to UTC.
+    """
+    try:
+        return value._formatted
+    except AttributeError:
+        formatted = "%04d%02d%02dT%02d%02d%02d" % (
+            value.year, value.month, value.day, value.hour, value.minute,
+            value.second)
+        if isinstance(value, Timestamp):
+            value._formatted = formatted
+        return formatted
+
+
+def timestamp_now():
+    return Timestamp.now(UTC)
+
+
+def timestamp_from_epoch(epoch):
+    return Timestamp.fromtimestamp(epoch, UTC)
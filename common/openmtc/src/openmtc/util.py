@@ -1,6 +1,8 @@
-from datetime import datetime, timedelta, tzinfo
+from datetime import timedelta, tzinfo
 import time
 
+from openmtc.timestamp import UTC, timestamp_from_epoch, timestamp_now
+
 ZERO = timedelta(0)
 
 
@@ -19,11 +21,12 @@ class Utc(tzinfo):
         return ZERO
 
 
-UTC = Utc()
+# UTC is timezone.utc now, its C implementation makes comparisons of
+# datetimes much faster. The class is kept for unpickling stored datetimes.
 
 
 def datetime_now():
-    return datetime.now(UTC)
+    return timestamp_now()
 
 
 def datetime_the_future(offset=0):
@@ -33,5 +36,5 @@ def datetime_the_future(offset=0):
         @return: datetime in <offset> seconds
     """
     f = time.time() + offset
-    return datetime.fromtimestamp(f, UTC)
+    return timestamp_from_epoch(f)
 
@@ -4,6 +4,7 @@ from inspect import getargspec
 from futile.logging import LoggerMixin
 from openmtc_onem2m.exc import OneM2MError
 from openmtc_onem2m.model import (
+    AggregatedNotification,
     EventNotificationCriteria,
     NotificationEventTypeE,
     Subscription,
@@ -189,6 +190,17 @@ class BaseNotificationHandler(object):
             'rep': notification.notificationEvent.representation,
         }
 
+    def _handle_notification(self, originator, notification):
+        # batched notifications arrive as aggregated notification
+        if isinstance(notification, AggregatedNotification):
+            notifications = notification.notification or ()
+        else:
+            notifications = (notification, )
+
+        for n in notifications:
+            if not n.verificationRequest:
+                self._callback(originator, **self._unpack_notification(n))
+
     def start(self):
         raise NotImplementedError
 
@@ -205,9 +217,7 @@ class MqttNotificationHandler(BaseNotificationHandler):
         from openmtc_onem2m.exc import get_response_status
 
         def wrapper(request):
-            if not request.content.verificationRequest:
-                notification = self._unpack_notification(request.content)
-                self._callback(request.originator, **notification)
+            self._handle_notification(request.originator, request.content)
             return OneM2MResponse(status_code=get_response_status(2000), request=request)
 
         self._client = get_client(self._endpoint.geturl(), handle_request_func=wrapper)
@@ -264,9 +274,7 @@ class HttpNotificationHandler(BaseNotificationHandler):
                     request.data = request.environ['wsgi.input'].read(cl)
 
             notification = get_onem2m_decoder(request.content_type).decode(request.data)
-            if not notification.verificationRequest:
-                notification = self._unpack_notification(notification)
-                self._callback(request.headers['x-m2m-origin'], **notification)
+            self._handle_notification(request.headers['x-m2m-origin'], notification)
 
             return Response(
                 headers={
@@ -411,6 +411,7 @@ def main(default_config_file, is_gateway):
 
     stop_plugins()
     stop_components()
+    db.stop()
 
     for timer in _timers:
         try:
@@ -2,7 +2,9 @@ from . import controller
 import openmtc_onem2m.model as model
 from aplus import Promise
 from openmtc.util import datetime_now
-from openmtc_cse.methoddomain.controller import OneM2MDefaultController
+from openmtc_cse.methoddomain.acp_cache import AccessDecisionCache
+from openmtc_cse.methoddomain.controller import (OneM2MDefaultController,
+                                                 create_controller_context)
 from openmtc_onem2m.exc import (STATUS_INTERNAL_SERVER_ERROR, CSEConflict,
                                 CSENotFound, CSENotImplemented)
 from openmtc_onem2m.model import (CSEBase, CSETypeIDE)
@@ -39,8 +41,11 @@ class OneM2MMethodDomain(Component):
         }
 
         self._cse_base = None
+        self._cse_type = None
         self._rel_cse_id = None
         self._abs_cse_id = None
+        self._access_decision_cache = None
+        self._controller_context = None
 
     def initialize(self, api):
         self._api = api
@@ -48,16 +53,21 @@ class OneM2MMethodDomain(Component):
 
         self._api.handle_onem2m_request = self.handle_onem2m_request
 
+        self._init_cse_config()
+        self._init_controller_context()
+        self._init_access_decision_cache()
+        self._register_access_decision_cache_handlers()
+
     def start(self):
         pass
 
     def stop(self):
         pass
 
-    def init_cse_base(self):
+    def _init_cse_config(self):
         # get config values
         onem2m_config = self.config["onem2m"]
-        self._cse_base = cse_base_name = onem2m_config.get("cse_base", "onem2m")
+        self._cse_base = onem2m_config.get("cse_base", "onem2m")
 
         # TODO(rst): check later
         # node_link = 'dummy'
@@ -84,6 +94,53 @@ class OneM2MMethodDomain(Component):
         except KeyError:
             raise ConfigurationError("Missing configuration key: sp_id")
 
+        self._cse_type = cse_type
+
+    def _init_controller_context(self):
+        # the settings derived from the config are shared by all controllers
+        self._controller_context = create_controller_context(
+            self.config, self._api, self.events)
+
+    def update_config(self, config):
+        """Applies a changed configuration to subsequent requests."""
+        self.config = config
+        self._init_cse_config()
+        self._init_controller_context()
+        # the cached decisions depend on the former configuration
+        self._init_access_decision_cache()
+
+    def _init_access_decision_cache(self):
+        cache_size = self.config["onem2m"].get("acp_cache_size", 10000)
+        if cache_size:
+            self._access_decision_cache = AccessDecisionCache(cache_size)
+        else:
+            self._access_decision_cache = None
+
+    def _register_access_decision_cache_handlers(self):
+        # registered once, they use the cache of the current configuration
+        def policy_changed(policy, _):
+            if self._access_decision_cache is not None:
+                self._access_decision_cache.invalidate_policy(policy)
+
+        def policy_created(policy, _):
+            if self._access_decision_cache is not None:
+                self._access_decision_cache.invalidate_missing_policies()
+
+        self.events.resource_created.register_handler(
+            policy_created, model.AccessControlPolicy)
+        self.events.resource_updated.register_handler(
+            policy_changed, model.AccessControlPolicy)
+        self.events.resource_deleted.register_handler(
+            policy_changed, model.AccessControlPolicy)
+
+    def get_access_decision_cache_stats(self):
+        if self._access_decision_cache is None:
+            return None
+        return self._access_decision_cache.get_stats()
+
+    def init_cse_base(self):
+        cse_base_name = self._cse_base
+
         # time
         now = datetime_now()
 
@@ -95,7 +152,7 @@ class OneM2MMethodDomain(Component):
             resourceType=model.ResourceTypeE['CSEBase'],
             creationTime=now,
             lastModifiedTime=now,
-            cseType=cse_type,
+            cseType=self._cse_type,
             CSE_ID=self._rel_cse_id,
             supportedResourceType=[model.ResourceTypeE[x.typename]
                                    for x in self.controller_classes.keys()],
@@ -120,7 +177,11 @@ class OneM2MMethodDomain(Component):
         db_session = self._api.start_onem2m_session()
         try:
             result = self._handle_onem2m_request(db_session, onem2m_request)
-            db_session.commit()
+            # errors of the controllers come as rejected promise
+            if isinstance(result, Promise) and result.isRejected():
+                db_session.rollback()
+            else:
+                db_session.commit()
             return result
         except Exception as error:
             if log_error(error):
@@ -249,7 +310,9 @@ class OneM2MMethodDomain(Component):
                 resource_type = type(res)
 
             ctrl_class = self._get_controller_class(resource_type)
-            ctrl = ctrl_class(db_session, resource_type, handle_onem2m_request)
+            ctrl = ctrl_class(db_session, resource_type, handle_onem2m_request,
+                              self._access_decision_cache,
+                              self._controller_context)
             return self._run_controller(ctrl, request, res)
 
         # TS-0004 7.3.3.2 -> check existence
@@ -0,0 +1,76 @@
+from futile.caching import LRUCache
+from futile.logging import LoggerMixin
+
+
+class AccessDecisionCache(LoggerMixin):
+    """Caches the outcome of access control evaluations.
+
+    Entries are keyed by (originator, operation, authenticated, privilege
+    type, accessControlPolicyIDs). The IDs are read from the target (or its
+    parents) on every request, so changing the accessControlPolicyIDs of a
+    holder needs no invalidation. Changing or deleting an
+    <accessControlPolicy> invalidates all decisions it took part in.
+
+    Decisions depending on accessControlContexts (time windows, IP
+    addresses) are never cached.
+    """
+
+    def __init__(self, max_items=10000):
+        super(AccessDecisionCache, self).__init__()
+        self._decisions = LRUCache(max_items=max_items, threadsafe=False)
+        # resourceID of a policy -> keys of the decisions based on it
+        self._keys_by_policy = {}
+        # keys of decisions where a referenced policy could not be found
+        self._keys_missing_policy = set()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        try:
+            decision = self._decisions[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return decision
+
+    def set(self, key, decision, policies, missing_policy=False):
+        decisions = self._decisions
+        decisions[key] = decision
+        for policy in policies:
+            keys = self._keys_by_policy.setdefault(policy.resourceID, set())
+            keys.add(key)
+            if len(keys) > decisions.max_items:
+                # forget the keys evicted in the meantime
+                keys.intersection_update(decisions)
+        if missing_policy:
+            self._keys_missing_policy.add(key)
+
+    def invalidate_policy(self, policy):
+        keys = self._keys_by_policy.pop(policy.resourceID, ())
+        for key in keys:
+            self._decisions.pop(key, None)
+        self.invalidations += len(keys)
+
+    def invalidate_missing_policies(self):
+        # a policy that was referenced before it existed may have appeared
+        keys = self._keys_missing_policy
+        self._keys_missing_policy = set()
+        for key in keys:
+            self._decisions.pop(key, None)
+        self.invalidations += len(keys)
+
+    def clear(self):
+        self._decisions.clear()
+        self._keys_by_policy.clear()
+        self._keys_missing_policy.clear()
+
+    def get_stats(self):
+        return {
+            "size": len(self._decisions),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
@@ -1,6 +1,7 @@
 import base64
 import binascii
 import string
+from collections import namedtuple
 from datetime import datetime
 from itertools import chain
 from operator import attrgetter
@@ -8,7 +9,6 @@ from random import choice
 from urllib.parse import urlparse
 from xml.sax import SAXParseException
 
-from iso8601.iso8601 import parse_date, ParseError
 from pyparsing import ParseException
 from rdflib import Graph
 
@@ -17,8 +17,9 @@ from futile import uc
 from futile.logging import LoggerMixin
 from openmtc.exc import OpenMTCError
 from openmtc.model import FlexibleAttributesMixin
+from openmtc.timestamp import parse_timestamp
 from openmtc.util import datetime_now, datetime_the_future
-from openmtc_cse.methoddomain.filtercriteria import check_match
+from openmtc_cse.methoddomain.filtercriteria import compile_filter_criteria
 from openmtc_onem2m.exc import (CSEOperationNotAllowed, STATUS_OK, CSETypeError,
                                 CSEMissingValue, CSEValueError, STATUS_CREATED,
                                 CSEError, CSESyntaxError, CSEBadRequest,
@@ -32,7 +33,8 @@ from openmtc_onem2m.model import (ExpiringResource, Notification,
                                   DiscResTypeE, Container, AccessControlPolicy,
                                   AccessControlPolicyIDHolder, AccessControlRuleC,
                                   DynAuthDasRequestC, SecurityInfo, SecurityInfoTypeE,
-                                  AE, ResultContentE, ContentInstance)
+                                  AE, ResultContentE, ContentInstance,
+                                  ContentStatusE)
 from openmtc_onem2m.transport import (OneM2MResponse, OneM2MRequest,
                                       OneM2MOperation, OneM2MErrorResponse)
 from openmtc_onem2m.util import split_onem2m_address
@@ -42,18 +44,109 @@ from openmtc_server.util import match_now_cron
 from openmtc_server.util import uri_safe
 from openmtc_server.util.async_ import async_all
 
-_resource_id_counter = {}
+class ResourceIDCounter(object):
+    """Hands out the numbers of new resource IDs.
+
+    The counters are kept in a shelve of the database. To avoid a write per
+    created resource, numbers are reserved in blocks and only the end of the
+    reserved block is stored. After a restart the counting continues behind
+    the last reserved block, skipping its unused numbers.
+    """
+
+    block_size = 1000
+
+    def __init__(self):
+        self._next = {}
+        self._reserved = {}
+        self._shelve = None
+
+    def next(self, key, api):
+        try:
+            n = self._next[key]
+        except KeyError:
+            n = self._next[key] = self._reserved[key] = self._load(key, api)
+        if n >= self._reserved[key]:
+            self._reserve(key, n + self.block_size, api)
+        self._next[key] = n + 1
+        return n
+
+    def _get_shelve(self, api):
+        if self._shelve is None:
+            try:
+                self._shelve = api.get_shelve("resource_ids")
+            except AttributeError:
+                # APIs without database access count in memory only
+                self._shelve = {}
+        return self._shelve
+
+    def _load(self, key, api):
+        return self._get_shelve(api).get(key, 0)
+
+    def _reserve(self, key, reserved, api):
+        shelve = self._get_shelve(api)
+        shelve[key] = self._reserved[key] = reserved
+        try:
+            shelve.commit()
+        except AttributeError:
+            pass
+
+
+_resource_id_counter = ResourceIDCounter()
+
+ControllerContext = namedtuple("ControllerContext", (
+    "global_config", "onem2m_config", "api", "events", "require_auth",
+    "sp_id", "rel_cse_id", "abs_cse_id", "default_privileges",
+    "dynamic_authorization_supported", "dynamic_authorization_poa"))
+
+
+def create_controller_context(config, api, events):
+    """Derives the request independent settings of the controllers from the
+    configuration. The context is shared by all requests and must not be
+    modified, a new one has to be created when the configuration changes.
+    """
+    global_config = config["global"]
+    onem2m_config = config["onem2m"]
+
+    sp_id = "//" + onem2m_config["sp_id"]  # //openmtc.org
+    rel_cse_id = "/" + onem2m_config["cse_id"]  # /mn-cse-1
+
+    # default policies
+    default_privileges = tuple(
+        AccessControlRuleC(**x)
+        for x in onem2m_config.get("default_privileges", []))
+
+    # dynamic authorization
+    dynamic_authorization = onem2m_config.get("dynamic_authorization", {})
+
+    return ControllerContext(
+        global_config=global_config,
+        onem2m_config=onem2m_config,
+        api=api,
+        events=events,
+        require_auth=global_config.get("require_auth", True),
+        sp_id=sp_id,
+        rel_cse_id=rel_cse_id,
+        abs_cse_id=sp_id + rel_cse_id,  # //openmtc.org/mn-cse-1
+        default_privileges=default_privileges,
+        dynamic_authorization_supported=dynamic_authorization.get('enabled',
+                                                                  False),
+        dynamic_authorization_poa=tuple(dynamic_authorization.get('poa', [])))
 
 
 class OneM2MDefaultController(LoggerMixin):
     RANDOM_SOURCE = string.ascii_letters + string.digits
 
     result_content_type = None
+    content_status = None
+    content_offset = None
 
-    def __init__(self, db_session, resource_type, handle_onem2m_request):
+    def __init__(self, db_session, resource_type, handle_onem2m_request,
+                 access_decision_cache=None, context=None):
         super(OneM2MDefaultController, self).__init__()
         self.resource_type = resource_type
         self.handle_onem2m_request = handle_onem2m_request
+        self._access_decision_cache = access_decision_cache
+        self._context = context
 
         # DB wrapper
 
@@ -63,9 +156,12 @@ class OneM2MDefaultController(LoggerMixin):
             return db_session.update(resource, fields)
         self._create = db_session.store
         self._get = db_session.get
+        # read-only resources for lookups which do not modify them
+        self._view = db_session.view
         self._update = _update
         self._delete = db_session.delete
         self._get_collection = db_session.get_collection
+        self._find = db_session.find
         self._get_latest_content_instance = db_session.get_latest_content_instance
         self._get_oldest_content_instance = db_session.get_oldest_content_instance
 
@@ -75,14 +171,19 @@ class OneM2MDefaultController(LoggerMixin):
         self.request = request
         self.resource = target_resource
 
-        self.global_config = api.config["global"]
-        self.onem2m_config = api.config["onem2m"]
-        self.api = api.api
-        self.events = api.events
+        context = self._context
+        if context is None:
+            context = create_controller_context(api.config, api.api,
+                                                api.events)
+
+        self.global_config = context.global_config
+        self.onem2m_config = context.onem2m_config
+        self.api = context.api
+        self.events = context.events
 
         self.values = None
 
-        self._require_auth = self.global_config.get("require_auth", True)
+        self._require_auth = context.require_auth
 
         # TODO(rkr): maybe make subjectAltName as mandatory in the certificate,
         # TODO          before handling it to the WSGI application
@@ -93,17 +194,15 @@ class OneM2MDefaultController(LoggerMixin):
         self.is_authenticated = getattr(request, "_authenticated", None)
         self.remote_ip_addr = getattr(request, "_remote_ip_addr", None)
 
-        self._sp_id = "//" + self.onem2m_config["sp_id"]  # //openmtc.org
-        self._rel_cse_id = "/" + self.onem2m_config["cse_id"]  # /mn-cse-1
-        self._abs_cse_id = self._sp_id + self._rel_cse_id  # //openmtc.org/mn-cse-1
+        self._sp_id = context.sp_id
+        self._rel_cse_id = context.rel_cse_id
+        self._abs_cse_id = context.abs_cse_id
 
-        # default policies
-        self._default_privileges = [AccessControlRuleC(**x) for x in self.onem2m_config.get("default_privileges", [])]
+        self._default_privileges = context.default_privileges
 
-        # dynamic authorization
-        dynamic_authorization = self.onem2m_config.get("dynamic_authorization", {})
-        self._dynamic_authorization_supported = dynamic_authorization.get('enabled', False)
-        self._dynamic_authorization_poa = dynamic_authorization.get('poa', [])
+        self._dynamic_authorization_supported = \
+            context.dynamic_authorization_supported
+        self._dynamic_authorization_poa = context.dynamic_authorization_poa
 
         # release version indicator
         if not self.request.rvi:
@@ -197,7 +296,8 @@ class OneM2MDefaultController(LoggerMixin):
                           resource.selfPrivileges)
 
         # TODO(rst): check if default policies are also valid for selfPrivileges
-        if self._perform_evaluation([resource], "selfPrivileges"):
+        if self._evaluate_privileges((resource.resourceID, ), "selfPrivileges",
+                                     lambda: [resource]):
             return
 
         raise CSEPermissionDenied("Authentication failed. Cause: selfPrivileges")
@@ -218,18 +318,19 @@ class OneM2MDefaultController(LoggerMixin):
         self._check_privileges(parent)
 
     def _get_parent_of_resource(self, resource):
-        return self._get(resource.parentID)
+        return self._view(resource.parentID)
 
     def _check_privileges(self, resource):
         # get all ACPs
-        policies = []   # acpi, accessControlPolicyIDs
+        policy_ids = ()   # acpi, accessControlPolicyIDs
         if resource.accessControlPolicyIDs:
-            policies = self._get_policies(resource.accessControlPolicyIDs)
+            policy_ids = tuple(resource.accessControlPolicyIDs)
         elif isinstance(resource, Container):
-            policies = self._get_parent_policies_of_container(resource)
+            policy_ids = self._get_parent_policy_ids_of_container(resource)
 
         # perform evaluation based on policies/default policies
-        if self._perform_evaluation(policies, "privileges"):
+        if self._evaluate_privileges(policy_ids, "privileges",
+                                     lambda: self._get_policies(policy_ids)):
             return
 
         if self._dynamic_authorization_supported:
@@ -239,17 +340,45 @@ class OneM2MDefaultController(LoggerMixin):
 
         raise CSEPermissionDenied("Authorization failed.")
 
-    def _get_parent_policies_of_container(self, resource):
-        policies = []
+    def _get_parent_policy_ids_of_container(self, resource):
         parent_resource = self._get_parent_of_resource(resource)
         if parent_resource.accessControlPolicyIDs:
-            policies = self._get_policies(parent_resource.accessControlPolicyIDs)
-            return policies
+            return tuple(parent_resource.accessControlPolicyIDs)
+        elif isinstance(parent_resource, Container):
+            return self._get_parent_policy_ids_of_container(parent_resource)
+        return ()
+
+    def _evaluate_privileges(self, policy_ids, privilege_type, get_policies):
+        cache = self._access_decision_cache
+        if cache is None:
+            return self._perform_evaluation(get_policies(), privilege_type)
+
+        # the holder's accessControlPolicyIDs are part of the key, so only
+        # changes of the policies themselves need to invalidate the cache
+        key = (self.request.originator,
+               self._get_request_operation_value(self.request),
+               bool(self.is_authenticated), privilege_type, policy_ids)
+        decision = cache.get(key)
+        if decision is not None:
+            return decision
+
+        policies = get_policies()
+        decision = self._perform_evaluation(policies, privilege_type)
+        if self._is_cacheable(policies, privilege_type):
+            cache.set(key, decision, policies,
+                      len(policies) < len(policy_ids))
+        return decision
+
+    def _is_cacheable(self, policies, privilege_type):
+        # decisions depending on time windows or ip addresses may differ
+        # for the next request
+        if policies:
+            rules = chain.from_iterable(map(attrgetter(privilege_type),
+                                            policies))
         else:
-            if isinstance(parent_resource, Container):
-                return self._get_parent_policies_of_container(parent_resource)
-            else:
-                return policies
+            rules = self._default_privileges
+        return not any(getattr(acr, "accessControlContexts", None)
+                       for acr in rules)
 
     def _get_policies(self, access_control_policy_ids):
 
@@ -392,7 +521,7 @@ class OneM2MDefaultController(LoggerMixin):
         try:
             for dac_id in resource.dynamicAuthorizationConsultationIDs:
                 try:
-                    dac = self._get(dac_id)
+                    dac = self._view(dac_id)
                     if dac.dynamicAuthorizationEnabled:
                         return dac
                 except DBNotFound:
@@ -402,7 +531,7 @@ class OneM2MDefaultController(LoggerMixin):
         except AttributeError:
             return None
         else:
-            return self._get_dynamic_authorization_consultation(self._get(pid))
+            return self._get_dynamic_authorization_consultation(self._view(pid))
 
     def _create_dynamic_policy(self, resource, acp_info):
         acp = AccessControlPolicy(
@@ -445,16 +574,8 @@ class OneM2MDefaultController(LoggerMixin):
             return _perform_access_decision(self._default_privileges)
         return False
 
-    def _is_authorized(self, request, acr):
-        """This method performs access control decision (TS-0003 7.1.5) for a single acr.
-        res_acr(k) = res_authn(k) AND res_origs(k) AND res_ops(k) AND res_ctxts(k).
-
-        :param request:
-        :param acr:
-        :return:
-        """
-        self.logger.debug("_is_authorized -> keys: %s", acr.__dict__)
-
+    @staticmethod
+    def _get_request_operation_value(request):
         # get enum value of requested operation name
         request_op_val = getattr(AccessControlOperationE, request.op)
 
@@ -467,6 +588,20 @@ class OneM2MDefaultController(LoggerMixin):
             except AttributeError:
                 pass
 
+        return request_op_val
+
+    def _is_authorized(self, request, acr):
+        """This method performs access control decision (TS-0003 7.1.5) for a single acr.
+        res_acr(k) = res_authn(k) AND res_origs(k) AND res_ops(k) AND res_ctxts(k).
+
+        :param request:
+        :param acr:
+        :return:
+        """
+        self.logger.debug("_is_authorized -> keys: %s", acr.__dict__)
+
+        request_op_val = self._get_request_operation_value(request)
+
         # results for each part in the acr
         res_origs = False
         res_ops = False
@@ -675,8 +810,8 @@ class OneM2MDefaultController(LoggerMixin):
             else:
                 if not isinstance(expiration_time, datetime):
                     try:
-                        expiration_time = parse_date(expiration_time)
-                    except ParseError as e:
+                        expiration_time = parse_timestamp(expiration_time)
+                    except ValueError as e:
                         raise CSEValueError(
                             "Illegal value for expirationTime: %s" % (e,))
                 if expiration_time < self.now + self.global_config["min_lifetime"]:
@@ -690,25 +825,20 @@ class OneM2MDefaultController(LoggerMixin):
 
             values["expirationTime"] = expiration_time
 
-        rt_attributes = rt.attributes
         ignore_extra = True  # todo(rst): check this later with flexContainer
         is_flex = ignore_extra and issubclass(self.resource_type,
                                               FlexibleAttributesMixin)
 
-        # TODO: optimize
         if ignore_extra and not is_flex:
             names = rt.attribute_names
-            for k in values.keys():
-                if k not in names:
-                    values.pop(k)
-
-        for attribute in rt_attributes:
-            have_attr = (attribute.name in values and
-                         values[attribute.name] is not None)
-            # TODO(rkr): check mandatory attributes
-            if not have_attr and attribute.mandatory:
+            values = {k: v for k, v in values.items() if k in names}
+
+        # TODO(rkr): check mandatory attributes
+        for attribute in rt.mandatory_attributes:
+            if values.get(attribute.name) is None:
                 raise CSEMissingValue("Missing attribute: %s" % (attribute.name,))
-            if have_attr and attribute.accesstype == attribute.RO:
+        for attribute in rt.read_only_attributes:
+            if values.get(attribute.name) is not None:
                 self._handle_ro_attribute(attribute)
 
         self.values = values
@@ -735,7 +865,7 @@ class OneM2MDefaultController(LoggerMixin):
         if "stateTag" in resource_type.attribute_names:
             values["stateTag"] = 0
 
-        resource = resource_type(**values)
+        resource = self._new_resource(values)
         resource.path = self._get_resource_path()
 
         self.logger.info("Created resource of type '%s' at %s",
@@ -745,14 +875,16 @@ class OneM2MDefaultController(LoggerMixin):
 
         return self._create(resource)
 
+    def _new_resource(self, values):
+        return self.resource_type(**values)
+
     def _set_resource_id(self, values):
         short_name = get_short_resource_name(self.resource_type.typename)
-        try:
-            _resource_id_counter[short_name] += 1
-        except KeyError:
-            _resource_id_counter[short_name] = 0
-        values["resourceID"] = short_name + str(
-            _resource_id_counter[short_name])
+        values["resourceID"] = self._get_unused_resource_id(short_name,
+                                                            short_name)
+
+    def _get_unused_resource_id(self, counter_key, prefix):
+        return prefix + str(_resource_id_counter.next(counter_key, self.api))
 
     def _set_mandatory_create_attributes(self, values):
         # time attributes
@@ -829,6 +961,7 @@ class OneM2MDefaultController(LoggerMixin):
 
     def _prepare_discovery(self):
         self.limit = None
+        self.offset = 0
         self.truncated = False
 
         try:
@@ -840,49 +973,85 @@ class OneM2MDefaultController(LoggerMixin):
 
         if hasattr(self.request.filter_criteria, 'limit'):
             self.limit = self.request.filter_criteria.limit
+        if hasattr(self.request.filter_criteria, 'offset'):
+            self.offset = self.request.filter_criteria.offset or 0
+
+        # results are collected before the response is sent, as the content
+        # status has to be known beforehand, so they are always capped
+        max_results = self.onem2m_config.get("max_discovery_results", 10000)
+        if max_results and not 0 < (self.limit or 0) <= max_results:
+            self.limit = max_results
 
         self.logger.debug("_prepare_resource -> _handle_result: %s" %
                           self.resource)
 
+        self.match = compile_filter_criteria(self.request.filter_criteria)
+
         self.discovered = []
         self.result = URIList(self.discovered)
         self._discovery()
 
+        if self.truncated:
+            # the offset of the next page is handed out as continuation
+            # token, see TS-0004 6.4.1 (Content Status, Content Offset)
+            self.content_status = ContentStatusE.partialContent
+            self.content_offset = self.offset + len(self.discovered)
+
     def _discovery(self):
         try:
-            return self._do_discovery(self.resource)
+            candidates = self._find(self.resource,
+                                    self.request.filter_criteria)
+            if candidates is None:
+                nodes = self._iter_subtree(self.resource)
+            else:
+                # candidates already match the indexed criteria,
+                # self.match() is still needed for the others
+                nodes = iter(candidates)
+            self._do_discovery(nodes)
         except OpenMTCError:
             self.logger.exception("Error during discovery")
             raise CSEError("Error during discovery")
 
-    def _do_discovery(self, node):
-        self.logger.debug("_do_discovery: %s", node)
+    def _do_discovery(self, nodes):
+        # nodes come in a stable order (tree or creation order), so offset
+        # and limit can be used to page through the results
+        skip = self.offset
 
-        if self.limit and len(self.discovered) >= self.limit:
-            self.logger.debug("stopping discovery: limit reached")
-            self.truncated = True
-            return True
+        for node in nodes:
+            if not self.match(node):
+                continue
 
-        if check_match(node, self.request.filter_criteria):
             try:
                 self._check_authorization(node)
-                if self.drt == DiscResTypeE.unstructured:
-                    self.discovered.append(node.resourceID)
-                else:
-                    self.discovered.append(node.path)
             except CSEPermissionDenied:
-                pass
+                continue
 
-        if not self.truncated:
-            self._retrieve_children_for_resource(node)
-            self.logger.debug("checking sub resources of: %s", node)
-            self.logger.debug("childResource: %s", node.childResource)
-            for s in node.childResource:
-                self.logger.debug("is resource '%s' virtual? -> %s", s.name,
-                                  s.virtual)
-                if not s.virtual:
-                    sub_node = self._get(s.path)
-                    self._do_discovery(sub_node)
+            if skip:
+                skip -= 1
+                continue
+
+            if self.limit and len(self.discovered) >= self.limit:
+                self.logger.debug("stopping discovery: limit reached")
+                self.truncated = True
+                return
+
+            if self.drt == DiscResTypeE.unstructured:
+                self.discovered.append(node.resourceID)
+            else:
+                self.discovered.append(node.path)
+
+    def _iter_subtree(self, node):
+        self.logger.debug("_iter_subtree: %s", node)
+
+        yield node
+
+        # the children are the stored resources, they are only read and
+        # not assigned to the node
+        self.logger.debug("checking sub resources of: %s", node)
+        for s in self._get_collection(None, node):
+            if not s.virtual:
+                for n in self._iter_subtree(s):
+                    yield n
 
     def _prepare_resource(self):
         self.logger.debug("preparing resource.")
@@ -904,7 +1073,8 @@ class OneM2MDefaultController(LoggerMixin):
         fields = list(self.resource.values.keys())
         if self.request.rcn != ResultContentE.attributes_and_child_resource_references:
             fields = [k for k in fields if k != 'childResource']
-        return OneM2MResponse(STATUS_OK, pc=self.result, request=self.request, fields=fields)
+        return OneM2MResponse(STATUS_OK, pc=self.result, request=self.request, fields=fields,
+                              cts=self.content_status, cto=self.content_offset)
 
     def _retrieve_children(self):
         return self._retrieve_children_for_resource(self.resource)
@@ -948,8 +1118,8 @@ class OneM2MDefaultController(LoggerMixin):
             else:
                 if not isinstance(expiration_time, datetime):
                     try:
-                        expiration_time = parse_date(expiration_time)
-                    except ParseError as e:
+                        expiration_time = parse_timestamp(expiration_time)
+                    except ValueError as e:
                         raise CSEValueError(
                             "Illegal value for expirationTime: %s" % (e,))
                 if expiration_time < self.now + self.global_config[
@@ -967,21 +1137,16 @@ class OneM2MDefaultController(LoggerMixin):
 
             values["expirationTime"] = expiration_time
 
-        rt_attributes = rt.attributes
         ignore_extra = True  # todo(rst): check this later with flexContainer
         is_flex = ignore_extra and issubclass(self.resource_type,
                                               FlexibleAttributesMixin)
 
-        # TODO: optimize
         if ignore_extra and not is_flex:
             names = rt.attribute_names
-            for k in values.keys():
-                if k not in names:
-                    values.pop(k)
+            values = {k: v for k, v in values.items() if k in names}
 
-        for attribute in rt_attributes:
-            have_attr = attribute.name in values
-            if have_attr and attribute.accesstype == attribute.WO:
+        for attribute in rt.write_once_attributes:
+            if attribute.name in values:
                 self._handle_wo_attribute(attribute)
 
     def _handle_wo_attribute(self, attribute):
@@ -1129,11 +1294,7 @@ class AEController(OneM2MDefaultController):
     def _set_resource_id(self, values):
 
         def get_generic_ae_id():
-            try:
-                _resource_id_counter["ae"] += 1
-            except KeyError:
-                _resource_id_counter["ae"] = 0
-            return "CAE" + str(_resource_id_counter["ae"])
+            return self._get_unused_resource_id("ae", "CAE")
 
         try:
             _, _, ae_id = split_onem2m_address(self.request.originator)
@@ -1347,6 +1508,11 @@ class ContentInstanceController(OneM2MDefaultController):
         self.parent.latest = self.resource
         self._update(self.parent)
 
+    def _new_resource(self, values):
+        # the values are taken from the decoded request content or set by
+        # _set_mandatory_create_attributes(), no need to convert them again
+        return self.resource_type.from_trusted_values(values)
+
     def _check_create_representation(self):
         super(ContentInstanceController, self)._check_create_representation()
 
@@ -7,27 +7,87 @@ from openmtc_onem2m.model import FilterCriteria
 _logger = get_logger(__name__)
 
 
-def check_match(resource, filter_criteria):
-    _logger.debug("checking if filter criteria '%s' are matched by "
-                  "resource '%s'", filter_criteria, resource)
-    for criteria, value in filter_criteria.get_values(True).items():
-        if not value:
-            continue
-        _logger.debug("checking if resource matches: %s=%s", criteria, value)
+def _never(resource):
+    return False
+
+
+def _always(resource):
+    return True
+
+
+def _labels_test(values):
+    labels = frozenset(values)
+
+    def test(resource):
+        try:
+            return not labels.isdisjoint(resource.labels)
+        except (AttributeError, TypeError):
+            return False
+    return test
+
+
+def _resource_type_test(values):
+    resource_types = frozenset(map(int, values))
+
+    def test(resource):
         try:
-            filter_function = getattr(filters, criteria)
+            return resource.resourceType in resource_types
         except AttributeError:
-            _logger.error("'%s' is not a valid filter criterion", criteria)
             return False
+    return test
+
+
+def _filter_test(filter_function, value):
+    def test(resource):
+        return filter_function(resource, value)
+    return test
+
+
+def compile_filter_criteria(filter_criteria, ignore=()):
+    """Compiles filter_criteria into a predicate for resources.
+
+    The criteria values are parsed once, so the returned function can be
+    used for any number of resources. Criteria named in ignore are skipped.
+    """
+    _logger.debug("compiling filter criteria '%s'", filter_criteria)
+    if filter_criteria is None:
+        return _always
+
+    tests = []
+    for criteria, value in filter_criteria.get_values(True).items():
+        if not value or criteria in ignore or criteria == "filterUsage":
+            continue
+        if criteria in ("limit", "offset"):
+            # paging, only invalid values affect matching
+            if not getattr(filters, criteria)(None, value):
+                return _never
+        elif criteria == "labels":
+            tests.append(_labels_test(value))
+        elif criteria == "resourceType":
+            tests.append(_resource_type_test(value))
         else:
-            if not filter_function(resource, value):
-                _logger.debug("resource '%s' does not match criterion '%s=%s'",
-                              resource, criteria, value)
+            try:
+                filter_function = getattr(filters, criteria)
+            except AttributeError:
+                _logger.error("'%s' is not a valid filter criterion", criteria)
+                return _never
+            tests.append(_filter_test(filter_function, value))
+
+    if not tests:
+        return _always
+    if len(tests) == 1:
+        return tests[0]
+
+    def match(resource):
+        for test in tests:
+            if not test(resource):
                 return False
+        return True
+    return match
 
-    _logger.debug("resource '%s' matches filter criteria '%s'",
-                  resource, filter_criteria)
-    return True
+
+def check_match(resource, filter_criteria):
+    return bool(compile_filter_criteria(filter_criteria)(resource))
 
 
 def parse_filter_criteria(filter_criteria):
@@ -35,7 +95,8 @@ def parse_filter_criteria(filter_criteria):
         filter_criteria = {}
     _logger.debug("parsing '%s'", filter_criteria)
     int_criteria = ('stateTagSmaller', 'stateTagBigger', 'resourceType',
-                    'sizeAbove', 'sizeBelow', 'filterUsage', 'limit')
+                    'sizeAbove', 'sizeBelow', 'filterUsage', 'limit',
+                    'offset')
     parsed_criteria = {}
     for k, v in filter_criteria.items():
         if k in int_criteria:
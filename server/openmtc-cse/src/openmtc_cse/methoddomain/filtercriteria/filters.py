@@ -195,6 +195,21 @@ def limit(resource, value):
     return value > 0
 
 
+def offset(resource, value):
+    """
+    Number of matching resources to skip before the first one is returned.
+    Used to page through discovery results together with limit.
+
+    :param resource:
+    :type resource:
+    :param value: number of resources to skip
+    :type value: int
+    :return: True if valid offset, False otherwise
+    :rtype: bool
+    """
+    return value >= 0
+
+
 def filterUsage(resource, value):
     """
     Indicates how the filter criteria is used.
@@ -216,4 +231,4 @@ def filterUsage(resource, value):
 
 
 filters = [stateTagSmaller, stateTagBigger, expireBefore, expireAfter, labels,
-           resourceType, sizeAbove, sizeBelow, limit, filterUsage]
+           resourceType, sizeAbove, sizeBelow, limit, offset, filterUsage]
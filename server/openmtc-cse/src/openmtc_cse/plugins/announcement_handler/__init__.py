@@ -9,6 +9,7 @@ from openmtc_onem2m.transport import OneM2MRequest, MetaInformation, \
 from openmtc_server.Plugin import Plugin
 from copy import deepcopy
 from openmtc_server.util.async_ import async_all
+from .fanout import AnnouncementFanOut, AnnouncementUpdateQueue
 from re import sub
 from urllib.parse import urlparse
 # url join with coap compatibility
@@ -29,7 +30,8 @@ class AnnouncementHandler(Plugin):
     def __init__(self, api, config, *args, **kw):
         super(AnnouncementHandler, self).__init__(api, config, *args, **kw)
         self._announcements = {}
-        self._cse_base = urlparse(self.config['global']['cse_base']).path
+        # the global section has no cse_base, it is part of the onem2m one
+        self._cse_base = self.config['onem2m'].get('cse_base', 'onem2m')
         # TODO_oneM2M: self._cse_links should be filled with registration plugin, using a static value in the mean time
         # self._cse_links = {}
         self._cse_links = {
@@ -51,6 +53,18 @@ class AnnouncementHandler(Plugin):
         self.events.resource_deleted.register_handler(self._cse_deleted,
                                                       CSEBase)
 
+        # base of the announced resources on the remote CSEs
+        self._remote_cse_base = self.config.get('remote_cse_base',
+                                                self._cse_base)
+
+        # requests to the remote CSEs are sent concurrently
+        self._fan_out = AnnouncementFanOut(
+            self.api, max_concurrency=self.config.get("max_concurrency", 10),
+            timeout=self.config.get("timeout", 30.0))
+        self._updates = AnnouncementUpdateQueue(
+            self.api, self._fan_out,
+            batch_delay=self.config.get("batch_delay", 0.1))
+
         self._initialized()
 
     def _start(self):
@@ -82,6 +96,17 @@ class AnnouncementHandler(Plugin):
             .then(self._started)
         # return self._started()
 
+    def _stop(self):
+        self._updates.stop()
+        self.logger.debug("Announcement stats: %s",
+                          self.get_announcement_stats())
+        self._stopped()
+
+    def get_announcement_stats(self):
+        stats = self._fan_out.get_stats()
+        stats["updates"] = self._updates.get_stats()
+        return stats
+
     def _cse_created(self, cse, req):
         # TODO_oneM2M: Test this with RemoteCSE registration
         self._cse_links[cse.path] = cse.link
@@ -369,8 +394,8 @@ class AnnouncementHandler(Plugin):
             #                            requestingEntity=req_ent_mid)
             #
             # return self.api.send_request_indication(create_annc_req_ind)
-            cse_req = OneM2MRequest(OneM2MOperation.create, target_id, req_ent_mid,
-                                    MetaInformation(None), cn=annc, ty=annc_id)
+            cse_req = OneM2MRequest(OneM2MOperation.create, target_id,
+                                    fr=req_ent_mid, ty=type(annc), pc=annc)
             self.logger.debug('Sending Announcement %s' % cse_req)
             return self.api.send_onem2m_request(cse_req)
 
@@ -395,7 +420,8 @@ class AnnouncementHandler(Plugin):
             # stored the URI of the announced resource after it was created.
             self.logger.debug("announcements %s" % self._announcements)
             annc_path = self._announcements[resource.path]['uris'][cse_uri]
-            target_id = urljoin(cse_uri, '/onem2m/' + annc_path)
+            target_id = urljoin(cse_uri, '/%s/%s' % (self._remote_cse_base,
+                                                     annc_path))
 
             cse_req = OneM2MRequest(OneM2MOperation.delete, target_id, None,
                                     MetaInformation(None))
@@ -454,22 +480,32 @@ class AnnouncementHandler(Plugin):
 
             filtered_cses = [x for x in db_cse_list if x not in set(cse_list)]
 
-            # links the send funcs with the handle result funcs
-            create_func = lambda s: send_create_annc_pre(s) \
-                .then(lambda r: handle_create(AnncResult(s, r)),
-                      lambda r: handle_create_err(AnncResult(s, r)))
-            delete_func = lambda s: send_delete_annc(s) \
-                .then(lambda r: handle_delete(AnncResult(s, r)),
-                      lambda r: handle_delete_err(AnncResult(s, r)))
+            # links the send funcs with the handle result funcs, the requests
+            # to all CSEs are sent at once
+            def create_all():
+                return async_all([
+                    p.then(lambda r, s=s: handle_create(AnncResult(s, r)),
+                           lambda r, s=s: handle_create_err(AnncResult(s, r)))
+                    for s, p in zip(create_list, self._fan_out.map(
+                        send_create_annc_pre, create_list))
+                ])
+
+            def delete_all():
+                return async_all([
+                    p.then(lambda r, s=s: handle_delete(AnncResult(s, r)),
+                           lambda r, s=s: handle_delete_err(AnncResult(s, r)))
+                    for s, p in zip(delete_list, self._fan_out.map(
+                        send_delete_annc, delete_list))
+                ])
 
             # filters out all False in the list
             def filter_func(l):
                 return [_f for _f in l if _f]
 
             return async_all([
-                (async_all(list(map(create_func, create_list))).then(filter_func)
+                (create_all().then(filter_func)
                  .then(lambda l: l + filtered_cses)),
-                async_all(list(map(delete_func, delete_list))).then(filter_func)
+                delete_all().then(filter_func)
             ])
 
         return send_anncs(check_cse_list())
@@ -493,9 +529,8 @@ class AnnouncementHandler(Plugin):
 
             # self.api.handle_request_indication(update_req_ind)
             # TODO_oneM2M: Update the resource by sending the request
-            cse_req = OneM2MRequest(OneM2MOperation.update, resource.path, str(self),
-                                    MetaInformation(None), cn=resource,
-                                    ty=resource)
+            cse_req = OneM2MRequest(OneM2MOperation.update, resource.path,
+                                    fr=str(self), pc=resource)
             # self.api.handle_onem2m_request(cse_req)
 
         if len(remove_list) or len(add_list):
@@ -580,11 +615,13 @@ class AnnouncementHandler(Plugin):
                 # of expiration of the original resource;
                 annc.expirationTime = resource.expirationTime
 
-                # TODO(rst): fix this later
-                # update_req_ind = UpdateRequestIndication(uris[cse_uri], annc)
-                #
-                # # todo investigate response for not accepted expirationTime
-                # return self.api.send_request_indication(update_req_ind)
+                # todo investigate response for not accepted expirationTime
+                target_id = urljoin(cse_uri, '/%s/%s' % (
+                    self._remote_cse_base, uris[cse_uri]))
+                cse_req = OneM2MRequest(OneM2MOperation.update, target_id,
+                                        pc=annc)
+                self.logger.debug('Updating Announcement %s' % cse_req)
+                return self.api.send_onem2m_request(cse_req)
 
             old_resource.labels = resource.labels
             try:
@@ -597,7 +634,12 @@ class AnnouncementHandler(Plugin):
             # TODO: conversion to set()  is questionable
             update_list = [x for x in cse_list if x not in set(add_list)]
 
-            return async_all(list(map(send_update_annc_pre, update_list)))
+            # updates of many resources are sent to each CSE in batches
+            for cse_uri in update_list:
+                if cse_uri in uris:
+                    self._updates.add(cse_uri, resource.path,
+                                      lambda c=cse_uri: send_update_annc_pre(c))
+            return None
 
         self.logger.debug('No attributes changed, returning None')
         return None
@@ -0,0 +1,191 @@
+from collections import deque
+from time import time
+
+from aplus import Promise
+from futile.logging import LoggerMixin
+from openmtc_onem2m.exc import CSETargetNotReachable
+
+
+class AnnouncementFanOut(LoggerMixin):
+    """Sends announcement requests to many remote CSEs at once.
+
+    At most max_concurrency requests are in flight, the others wait for a
+    free slot. The requests of a single map() call share one deadline.
+    """
+
+    def __init__(self, api, max_concurrency=10, timeout=30.0):
+        super(AnnouncementFanOut, self).__init__()
+        self.api = api
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+
+        # (send, target, promise)
+        self._queue = deque()
+        self._in_flight = 0
+
+        # counters
+        self.sent = 0
+        self.failed = 0
+        self.timed_out = 0
+
+    def map(self, send, targets):
+        """Calls send(target) for all targets concurrently.
+
+        Returns a promise per target, settled with the outcome of its
+        request. Requests not answered within timeout seconds are rejected
+        with CSETargetNotReachable.
+        """
+        promises = [Promise() for _ in targets]
+        if not promises:
+            return promises
+
+        # [timer], emptied once the deadline is reached: the timer must not
+        # be cancelled by the rejections it makes, that would kill it before
+        # the callbacks of the remaining promises have run
+        timer = []
+        pending = [len(promises)]
+
+        def done(_):
+            pending[0] -= 1
+            if not pending[0] and timer:
+                self.api.cancel_timer(timer.pop())
+
+        for target, p in zip(targets, promises):
+            p.then(done, done)
+            self._queue.append((send, target, p))
+
+        timer.append(self.api.set_timer(self.timeout, self._expire, promises,
+                                        timer))
+        self._schedule()
+        return promises
+
+    def _schedule(self):
+        queue = self._queue
+        while queue and self._in_flight < self.max_concurrency:
+            send, target, p = queue.popleft()
+            if not p.isPending():
+                # deadline exceeded while waiting
+                continue
+            self._in_flight += 1
+            # timers run outside of the task runner's pool
+            self.api.set_timer(0, self._run, send, target, p)
+
+    def _run(self, send, target, p):
+        try:
+            result = send(target)
+            if isinstance(result, Promise):
+                result = result.get()
+        except Exception as error:
+            self.failed += 1
+            if p.isPending():
+                p.reject(error)
+        else:
+            self.sent += 1
+            if p.isPending():
+                p.fulfill(result)
+        finally:
+            self._in_flight -= 1
+            self._schedule()
+
+    def _expire(self, promises, timer):
+        del timer[:]
+        for p in promises:
+            if p.isPending():
+                self.timed_out += 1
+                p.reject(CSETargetNotReachable(
+                    "No answer within %ss" % (self.timeout, )))
+
+    def get_stats(self):
+        return {
+            "queued": len(self._queue),
+            "in_flight": self._in_flight,
+            "sent": self.sent,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+        }
+
+
+class AnnouncementUpdateQueue(LoggerMixin):
+    """Coalesces updates of announced resources into per CSE batches.
+
+    Updates are collected for batch_delay seconds and then sent to every
+    remote CSE together. Several updates of the same resource in between
+    result in a single request with the latest state. The lag between the
+    first change of a resource and the delivery of its update is measured.
+    """
+
+    def __init__(self, api, fan_out, batch_delay=0.1):
+        super(AnnouncementUpdateQueue, self).__init__()
+        self.api = api
+        self.fan_out = fan_out
+        self.batch_delay = batch_delay
+
+        # cse_uri -> {resource path: (send, time of the first change)}
+        self._pending = {}
+        self._timer = None
+
+        # counters
+        self.queued = 0
+        self.coalesced = 0
+        self.delivered = 0
+        self.failed = 0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+
+    def add(self, cse_uri, path, send):
+        """Queues send() to update the announcement of path at cse_uri."""
+        batch = self._pending.setdefault(cse_uri, {})
+        try:
+            queued = batch[path][1]
+        except KeyError:
+            queued = time()
+            self.queued += 1
+        else:
+            self.coalesced += 1
+        batch[path] = (send, queued)
+
+        if self._timer is None:
+            self._timer = self.api.set_timer(self.batch_delay, self.flush)
+
+    def flush(self):
+        self._timer = None
+        pending, self._pending = self._pending, {}
+
+        for cse_uri, batch in pending.items():
+            self.logger.debug("Sending %d announcement updates to %s",
+                              len(batch), cse_uri)
+            items = list(batch.values())
+            promises = self.fan_out.map(lambda item: item[0](), items)
+            for (_, queued), p in zip(items, promises):
+                p.then(lambda _, queued=queued: self._delivered(queued),
+                       lambda error, uri=cse_uri: self._failed(uri, error))
+
+    def _delivered(self, queued):
+        lag = time() - queued
+        self.delivered += 1
+        self.lag_total += lag
+        if lag > self.lag_max:
+            self.lag_max = lag
+
+    def _failed(self, cse_uri, error):
+        self.failed += 1
+        self.logger.warning("Failed to update announcement at %s: %s",
+                            cse_uri, error)
+
+    def stop(self):
+        if self._timer is not None:
+            self.api.cancel_timer(self._timer)
+            self._timer = None
+        self._pending.clear()
+
+    def get_stats(self):
+        return {
+            "pending": sum(len(b) for b in self._pending.values()),
+            "queued": self.queued,
+            "coalesced": self.coalesced,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "lag_avg": (self.lag_total / self.delivered
+                        if self.delivered else 0.0),
+            "lag_max": self.lag_max,
+        }
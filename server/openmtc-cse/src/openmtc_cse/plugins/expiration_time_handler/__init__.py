@@ -1,20 +1,30 @@
-from openmtc_server.Plugin import Plugin
-from datetime import timedelta
-from futile.collections.sortedlist import sortedlist
+from time import time
+
+from openmtc_onem2m import OneM2MRequest
+from openmtc_onem2m.exc import STATUS_NOT_FOUND
 from openmtc_onem2m.model import ExpiringResource
-from openmtc.util import datetime_now
+from openmtc_onem2m.transport import OneM2MErrorResponse, OneM2MOperation
+from openmtc_server.Plugin import Plugin
+from .timetable import Timetable
 
 
-class ExpirationTimeHandler(Plugin):
-    DEFAULT_LIFETIME = 24 * 60 * 60  # 1day
+def get_timestamp(expiration_time):
+    try:
+        return expiration_time.timestamp()
+    except AttributeError:
+        # already a timestamp
+        return expiration_time
+
 
+class ExpirationTimeHandler(Plugin):
     timeout = 5
+    batch_size = 100
 
     _timer = None
+    _wakeup = None
+    _running = False
 
     def _init(self):
-        # todo(rst): transform to onem2m
-        raise RuntimeError('needs to be revised.')
         self.events.resource_created.register_handler(
             self._handle_expiration_time, ExpiringResource)
         self.events.resource_deleted.register_handler(self._handle_delete,
@@ -22,18 +32,23 @@ class ExpirationTimeHandler(Plugin):
         self.events.resource_updated.register_handler(self._handle_update,
                                                       ExpiringResource)
 
-        self.default_lifetime = timedelta(
-            seconds=self.config.get("default_lifetime", self.DEFAULT_LIFETIME))
+        self.batch_size = self.config.get("batch_size", self.batch_size)
 
-        self._timetable = sortedlist()
-        self._purged = set()
+        onem2m_config = self.config.get("onem2m", {})
+        self._abs_cse_id = "//%s/%s" % (
+            onem2m_config.get("sp_id", "openmtc.org"),
+            onem2m_config.get("cse_id", "mn-cse-1"))
 
-        shelve = self.get_shelve("resources")
+        self._timetable = Timetable()
 
+        # the shelve holds {path: expiration timestamp} of all tracked
+        # resources, so the timetable is restored without walking the tree
+        shelve = self.get_shelve("resources")
         for path, expiration_time in shelve.items():
-            self._do_handle_expiration_time(path, expiration_time, shelve)
+            self._timetable.add(path, get_timestamp(expiration_time))
 
-        shelve.commit()
+        self.logger.debug("Restored %d expiration times",
+                          len(self._timetable))
         self._initialized()
 
     def _start(self):
@@ -45,78 +60,120 @@ class ExpirationTimeHandler(Plugin):
         self._running = False
         if self._timer is not None:
             self.api.cancel_timer(self._timer)
+            self._timer = None
         self._stopped()
 
-    def _handle_expiration_time(self, instance, req_ind):
+    def _handle_expiration_time(self, instance, req):
+        if instance.expirationTime is None:
+            return
         shelve = self.get_shelve("resources")
         self._do_handle_expiration_time(instance.path, instance.expirationTime,
                                         shelve)
         shelve.commit()
 
     def _do_handle_expiration_time(self, path, expiration_time, shelve):
-        if expiration_time is not None:
-            shelve[path] = expiration_time
-            self.logger.debug("Adding resource to timetable: %s", path)
-            self._timetable.add((expiration_time, path))
+        expiration_time = get_timestamp(expiration_time)
+        shelve[path] = expiration_time
+        self.logger.debug("Adding resource to timetable: %s", path)
+        self._timetable.add(path, expiration_time)
+        self._schedule(expiration_time)
 
-    def _handle_delete(self, instance, req_ind):
-        self._purged.discard(req_ind.path)
+    def _handle_delete(self, instance, req):
         shelve = self.get_shelve("resources")
-        self._do_delete(req_ind.path, shelve)
+        self._do_delete(instance.path, shelve)
         shelve.commit()
 
     def _do_delete(self, path, shelve):
+        self._timetable.remove(path)
         try:
-            expiration_time = shelve.pop(path)
+            del shelve[path]
         except KeyError:
             self.logger.debug("Resource %s is unknown", path)
-        else:
-            self.logger.debug("Removing resource from timetable: %s", path)
-            try:
-                self._timetable.remove((expiration_time, path))
-            except ValueError:
-                pass
-
-    def _handle_update(self, instance, req_ind):
-        if instance.path in self._purged:
+
+    def _handle_update(self, instance, req):
+        expiration_time = self._timetable.get(instance.path)
+        if instance.expirationTime is None:
+            if expiration_time is None:
+                return
+        elif get_timestamp(instance.expirationTime) == expiration_time:
+            # e.g. a container updated by a new content instance
             return
 
         shelve = self.get_shelve("resources")
         try:
-            self._do_delete(instance.path, shelve)
-            self._do_handle_expiration_time(instance.path,
-                                            instance.expirationTime, shelve)
+            if instance.expirationTime is None:
+                self._do_delete(instance.path, shelve)
+            else:
+                # replaces the former entry
+                self._do_handle_expiration_time(instance.path,
+                                                instance.expirationTime,
+                                                shelve)
             shelve.commit()
         except:
             shelve.rollback()
             raise
 
     def _purge(self, path):
-        self._purged.add(path)
-        # ri = DeleteRequestIndication(path, reason="expired")
-        # return self.api.handle_request_indication(ri)
+        self.logger.info("Resource has expired: %s", path)
+        request = OneM2MRequest(OneM2MOperation.delete, path,
+                                fr=self._abs_cse_id)
+        try:
+            self.api.handle_onem2m_request(request).get()
+        except OneM2MErrorResponse as error_response:
+            if error_response.response_status_code == STATUS_NOT_FOUND:
+                # already gone, e.g. together with an expired parent
+                return True
+            self.logger.error("Failed to delete expired resource %s: %s",
+                              path, error_response)
+            return False
+        except Exception:
+            self.logger.exception("Failed to delete expired resource %s",
+                                  path)
+            return False
+        return True
+
+    def _schedule(self, expiration_time):
+        # wake up earlier if needed
+        if not self._running or (self._wakeup is not None and
+                                 self._wakeup <= expiration_time):
+            return
+        if self._timer is not None:
+            self.api.cancel_timer(self._timer)
+        delay = max(expiration_time - time(), 0)
+        self._wakeup = time() + delay
+        self._timer = self.api.set_timer(delay, self._check_timetable)
 
     def _check_timetable(self):
+        self._timer = None
+        self._wakeup = None
+
         if not self._running:
             return
 
-        now = datetime_now()
-        sleeptime = self.timeout
+        now = time()
+        expired = self._timetable.pop_expired(now, self.batch_size)
+
+        if expired:
+            shelve = self.get_shelve("resources")
+            for path in expired:
+                if self._purge(path):
+                    shelve.pop(path, None)
+                else:
+                    # try again later
+                    self._timetable.add(path, now + self.timeout)
+            shelve.commit()
 
-        while len(self._timetable) > 0 and now >= self._timetable[0][0]:
-            expired_path = self._timetable.pop(0)[1]
-            # self._resources.pop(expired_path)
-            self.logger.info("Resource has expired: %s", expired_path)
-            self._purge(expired_path)
-        try:
-            td = self._timetable[0][0] - now
-            try:
-                td = td.total_seconds()
-            except AttributeError:
-                # Jython does not have timedelta.total_seconds()
-                td = td.seconds + (td.days * 24 * 60 * 60)
-            sleeptime = min(td, sleeptime)
-        except IndexError:
-            pass
+        if len(expired) == self.batch_size:
+            # more to do, but let others run in between
+            sleeptime = 0
+        else:
+            sleeptime = self.timeout
+            next_expiration_time = self._timetable.next_expiration_time()
+            if next_expiration_time is not None:
+                sleeptime = max(min(next_expiration_time - now, sleeptime), 0)
 
+        if self._timer is not None:
+            # rescheduled by an event handler in the meantime
+            self.api.cancel_timer(self._timer)
+        self._wakeup = now + sleeptime
         self._timer = self.api.set_timer(sleeptime, self._check_timetable)
@@ -0,0 +1,83 @@
+from heapq import heappush, heappop, heapify
+from itertools import count
+
+
+class Timetable(object):
+    """Paths ordered by their expiration time (a timestamp).
+
+    Backed by a binary heap. Removing or rescheduling a path only forgets
+    its current entry, the stale heap entry is skipped when it comes up and
+    the heap is rebuilt once stale entries make up most of it. So all
+    operations are O(log n) instead of the O(n) of a sorted list removal.
+    """
+
+    def __init__(self):
+        super(Timetable, self).__init__()
+        # (expiration time, sequence number, path)
+        self._heap = []
+        # path -> (expiration time, sequence number) of its valid entry
+        self._entries = {}
+        self._counter = count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, path):
+        return path in self._entries
+
+    def get(self, path, default=None):
+        """Returns the expiration time of the path."""
+        try:
+            return self._entries[path][0]
+        except KeyError:
+            return default
+
+    def add(self, path, expiration_time):
+        """Adds the path, replacing an entry it already has."""
+        seq = next(self._counter)
+        self._entries[path] = (expiration_time, seq)
+        heappush(self._heap, (expiration_time, seq, path))
+        self._check_compact()
+
+    def remove(self, path):
+        try:
+            del self._entries[path]
+        except KeyError:
+            return False
+        self._check_compact()
+        return True
+
+    def _check_compact(self):
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._compact()
+
+    def _compact(self):
+        self._heap = [(t, seq, path)
+                      for path, (t, seq) in self._entries.items()]
+        heapify(self._heap)
+
+    def _drop_stale(self):
+        heap = self._heap
+        entries = self._entries
+        while heap:
+            t, seq, path = heap[0]
+            if entries.get(path) == (t, seq):
+                return heap[0]
+            heappop(heap)
+        return None
+
+    def next_expiration_time(self):
+        entry = self._drop_stale()
+        return None if entry is None else entry[0]
+
+    def pop_expired(self, now, limit=None):
+        """Removes and returns the paths expired at now, earliest first."""
+        expired = []
+        while limit is None or len(expired) < limit:
+            entry = self._drop_stale()
+            if entry is None or entry[0] > now:
+                break
+            heappop(self._heap)
+            del self._entries[entry[2]]
+            expired.append(entry[2])
+        return expired
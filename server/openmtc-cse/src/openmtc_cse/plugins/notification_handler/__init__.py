@@ -1,16 +1,24 @@
+from openmtc_cse.methoddomain.filtercriteria import compile_filter_criteria
+from time import time
+
 from openmtc_onem2m import OneM2MRequest
 from openmtc_onem2m.exc import CSENotFound
 from openmtc_onem2m.model import (
     Subscription,
     Notification,
+    AggregatedNotification,
     SubscribableResource,
     NotificationEventC,
     NotificationContentTypeE,
     EventNotificationCriteria,
     NotificationEventTypeE,
+    FilterCriteria,
+    ResourceTypeE,
 )
 from openmtc_onem2m.transport import OneM2MOperation
 from openmtc_server.Plugin import Plugin
+from openmtc_server.db.exc import DBError
+from .outbox import NotificationOutbox
 
 
 def get_event_notification_criteria(subscription):
@@ -34,13 +42,39 @@ def get_event_notification_criteria(subscription):
     return event_notification_criteria
 
 
+def compile_event_notification_criteria(event_notification_criteria):
+    # the event related criteria are checked when looking up the
+    # subscriptions, the rest applies to the resource like filter criteria
+    return compile_filter_criteria(
+        event_notification_criteria,
+        ignore=("notificationEventType", "operationMonitor", "attribute"))
+
+
 class NotificationHandler(Plugin):
     def __init__(self, api, config, *args, **kw):
         super(NotificationHandler, self).__init__(api, config, *args,  **kw)
 
         # subscriptions_info contains the relevant info of a current
-        # subscriptions, i.e. {pid: {rid: {net: value, ...}}}
+        # subscriptions, i.e. {rid: {"pid": pid, "enc": enc, ...}}
         self.subscriptions_info = {}
+        # the same info indexed by parent and notification event type, i.e.
+        # {pid: {net: {rid: info}}}, so handling an event only touches the
+        # subscriptions concerned
+        self._subscriptions = {}
+        # notifications held back by batchNotify, rateLimit or latestNotify,
+        # i.e. {rid: {"sub": sub, "resources": [...], "timer": timer, ...}}
+        self._pending = {}
+        # notify requests are delivered in the background, see outbox
+        self._outbox = NotificationOutbox(
+            api,
+            max_queue_size=config.get("max_queue_size", 1000),
+            max_in_flight=config.get("max_in_flight", 2),
+            max_retries=config.get("max_retries", 5),
+            retry_backoff=config.get("retry_backoff", 1.0),
+            max_retry_backoff=config.get("max_retry_backoff", 60.0),
+            request_timeout=config.get("request_timeout", 30.0),
+        )
+        self._cse_base = config.get('onem2m', {}).get('cse_base', 'onem2m')
         cse_id = config.get('onem2m', {}).get('cse_id', 'mn-cse-1')
         sp_id = config.get('onem2m', {}).get('sp_id', 'openmtc.org')
         self._rel_cse_id = '/' + cse_id
@@ -67,6 +101,77 @@ class NotificationHandler(Plugin):
 
         self._initialized()
 
+    def _start(self):
+        self._load_subscriptions()
+        self._started()
+
+    def _stop(self):
+        for state in self._pending.values():
+            if state["timer"] is not None:
+                self.api.cancel_timer(state["timer"])
+        self._pending.clear()
+        self._outbox.stop()
+        self._stopped()
+
+    def _load_subscriptions(self):
+        # subscriptions survive a restart when the DB is persistent
+        session = self.api.start_onem2m_session()
+        try:
+            cse_base = session.get(self._cse_base)
+            subscriptions = session.find(cse_base, FilterCriteria(
+                resourceType=[ResourceTypeE.subscription]))
+            if subscriptions is None:
+                subscriptions = self._find_subscriptions(session, cse_base)
+            for subscription in subscriptions:
+                self._add_subscription(subscription)
+            session.commit()
+        except DBError:
+            self.logger.exception("Failed to load subscriptions")
+            session.rollback()
+
+        self.logger.debug("Loaded %d subscriptions",
+                          len(self.subscriptions_info))
+
+    def _find_subscriptions(self, session, resource):
+        for child in session.get_collection(None, resource):
+            if isinstance(child, Subscription):
+                yield child
+            elif not child.virtual:
+                for subscription in self._find_subscriptions(session, child):
+                    yield subscription
+
+    def _add_subscription(self, subscription):
+        enc = get_event_notification_criteria(subscription)
+        info = {
+            "pid": subscription.parentID,
+            "enc": enc,
+            "match": compile_event_notification_criteria(enc),
+            "sub": subscription,
+        }
+        self.subscriptions_info[subscription.resourceID] = info
+
+        by_net = self._subscriptions.setdefault(subscription.parentID, {})
+        for net in enc.notificationEventType:
+            by_net.setdefault(net, {})[subscription.resourceID] = info
+
+    def _remove_subscription(self, rid):
+        try:
+            info = self.subscriptions_info.pop(rid)
+        except KeyError:
+            return
+
+        pid = info["pid"]
+        by_net = self._subscriptions.get(pid, {})
+        for net in info["enc"].notificationEventType:
+            subs = by_net.get(net, {})
+            subs.pop(rid, None)
+            if not subs:
+                by_net.pop(net, None)
+        if not by_net:
+            self._subscriptions.pop(pid, None)
+
+        self._discard_pending(rid)
+
     def _get_subscription_reference(self, to, path):
         if to.startswith('//'):
             return self._abs_cse_id + '/' + path
@@ -76,41 +181,29 @@ class NotificationHandler(Plugin):
             return path
 
     def _get_sub_list(self, pid, net):
-        return [
-            v['sub'] for v in self.subscriptions_info.values()
-            if v['pid'] == pid and net in v['enc'].notificationEventType
-        ]
+        try:
+            return [v['sub'] for v in self._subscriptions[pid][net].values()]
+        except KeyError:
+            return []
 
     def _delete_subs_from_parent(self, pid):
-        self.subscriptions_info = {
-            k: v for k, v in self.subscriptions_info.items() if v["pid"] != pid
-        }
+        for subs in self._subscriptions.pop(pid, {}).values():
+            for rid in subs:
+                self.subscriptions_info.pop(rid, None)
+                self._discard_pending(rid)
 
     def _handle_subscription_created(self, subscription, _):
-        # todo: store somewhere
-        # if not self.subscriptions_info.get(subscription.resourceID):
-        #     self.subscriptions_info[subscription.resourceID] = {}
-
-        self.subscriptions_info[subscription.resourceID] = {
-            "pid": subscription.parentID,
-            "enc": get_event_notification_criteria(subscription),
-            "sub": subscription,
-        }
+        self._add_subscription(subscription)
 
     def _handle_subscription_updated(self, subscription, _):
-        self.subscriptions_info[subscription.resourceID].update({
-            "enc": get_event_notification_criteria(subscription),
-            # TODO(rst): test this
-            "sub": subscription,
-        })
+        # the notification event types may have changed
+        self._remove_subscription(subscription.resourceID)
+        self._add_subscription(subscription)
 
     def _handle_subscription_deleted(self, subscription, req):
         # only when subscription is deleted directly
         if not req.cascading:
-            try:
-                del self.subscriptions_info[subscription.resourceID]
-            except KeyError:
-                pass
+            self._remove_subscription(subscription.resourceID)
 
         # 7.5.1.2.4 Notification for Subscription Deletion
         # Originator:
@@ -201,11 +294,13 @@ class NotificationHandler(Plugin):
         # Step 1.0 Check the eventNotificationCriteria attribute of the
         # <subscription> resource associated with the modified resource:
 
-        def __check_event_notification_criteria():
-            # return check_match()
-            return True
+        try:
+            match = self.subscriptions_info[sub.resourceID]["match"]
+        except KeyError:
+            match = compile_event_notification_criteria(
+                get_event_notification_criteria(sub))
 
-        if not __check_event_notification_criteria():
+        if not match(resource):
             return
 
         # step 2.0
@@ -260,21 +355,24 @@ class NotificationHandler(Plugin):
         except AttributeError:
             pass
 
-        try:
-            latest_notify = sub.latestNotify
         # Step 2.3 Check the latestNotify attribute:
         # - If the latestNotify attribute is set, the Originator shall assign
         #   Event Category parameter of value 'latest' of the notifications
         #   generated pertaining to the subscription created. Then continue with
         #   other step
-            if latest_notify:
-                pass
-        except AttributeError:
-            pass
+        # -> see _queue_notification(), only the latest of the held back
+        #    notifications is sent
 
-        # NOTE: The use of some attributes such as rateLimit, batchNotify and
-        # preSubscriptionNotify is not supported in this release of the
-        # document.
+        # Step 2.4 Check the batchNotify and rateLimit attributes:
+        # - If batchNotify is set, notifications are aggregated until the
+        #   given number is reached or the duration expired
+        # - If rateLimit is set, no more than maxNrOfNotify Notify requests
+        #   are sent within timeWindow, the remaining ones are held back
+        if sub.batchNotify or sub.rateLimit or sub.latestNotify:
+            return self._queue_notification(resource, sub)
+
+        # NOTE: The use of preSubscriptionNotify is not supported in this
+        # release of the document.
 
         # Step 3.0 The Originator shall check the notification and reachability
         # schedules, but the notification schedules may be checked in different
@@ -348,20 +446,114 @@ class NotificationHandler(Plugin):
         # shall send the latest Notify request primitive.
         self._send_notification(resource, sub)
 
+    def _queue_notification(self, resource, sub):
+        rid = sub.resourceID
+        try:
+            state = self._pending[rid]
+        except KeyError:
+            state = self._pending[rid] = {
+                "resources": [],
+                "timer": None,
+                "window_start": 0,
+                "window_count": 0,
+            }
+        state["sub"] = sub
+
+        if sub.latestNotify:
+            state["resources"] = [resource]
+        else:
+            state["resources"].append(resource)
+
+        batch_notify = sub.batchNotify
+        if batch_notify:
+            if batch_notify.number and \
+                    len(state["resources"]) >= batch_notify.number:
+                return self._flush_notifications(rid)
+            if state["timer"] is None and batch_notify.duration:
+                state["timer"] = self.api.set_timer(
+                    batch_notify.duration, self._handle_flush_timer, rid)
+            return
+
+        if state["timer"] is None:
+            self._flush_notifications(rid)
+
+    def _handle_flush_timer(self, rid):
+        try:
+            self._pending[rid]["timer"] = None
+        except KeyError:
+            return
+        try:
+            self._flush_notifications(rid)
+        except Exception:
+            self.logger.exception("Failed to send notifications of %s", rid)
+
+    def _flush_notifications(self, rid):
+        state = self._pending[rid]
+        sub = state["sub"]
+
+        if not state["resources"]:
+            return
+
+        rate_limit = sub.rateLimit
+        if rate_limit and rate_limit.maxNrOfNotify:
+            now = time()
+            time_window = rate_limit.timeWindow or 0
+            if now - state["window_start"] >= time_window:
+                state["window_start"] = now
+                state["window_count"] = 0
+            if state["window_count"] >= rate_limit.maxNrOfNotify:
+                # hold back until the next window starts
+                if state["timer"] is None:
+                    state["timer"] = self.api.set_timer(
+                        state["window_start"] + time_window - now,
+                        self._handle_flush_timer, rid)
+                return
+            state["window_count"] += 1
+
+        if state["timer"] is not None:
+            self.api.cancel_timer(state["timer"])
+            state["timer"] = None
+
+        resources = state["resources"]
+        state["resources"] = []
+        self._send_notification(resources, sub)
+
+    def _discard_pending(self, rid):
+        try:
+            state = self._pending.pop(rid)
+        except KeyError:
+            return
+        if state["timer"] is not None:
+            self.api.cancel_timer(state["timer"])
+        if state["resources"]:
+            self.logger.debug("discarding %d pending notifications of %s",
+                              len(state["resources"]), rid)
+
     def _send_notification(self, resource, sub):
         self.logger.debug("sending notification for resource: %s", resource)
 
+        # a list of resources is sent as aggregated notification
+        resources = resource if isinstance(resource, list) else [resource]
+
         for uri in sub.notificationURI:
-            self.api.handle_onem2m_request(OneM2MRequest(
-                op=OneM2MOperation.notify,
-                to=uri,
-                pc=Notification(
+            notifications = [
+                Notification(
                     notificationEvent=NotificationEventC(
-                        representation=resource
+                        representation=r
                     ),
                     subscriptionReference=self._get_subscription_reference(uri, sub.path),
                     # TODO(rst): check if this is the sub creator or the creator of the notification
                     # TODO          in this case the CSE
                     creator=sub.creator
-                ),
+                ) for r in resources
+            ]
+            if len(notifications) == 1:
+                pc = notifications[0]
+            else:
+                pc = AggregatedNotification(notification=notifications)
+
+            self._outbox.send(uri, OneM2MRequest(
+                op=OneM2MOperation.notify,
+                to=uri,
+                pc=pc,
             ))
@@ -0,0 +1,199 @@
+from collections import deque
+from time import time
+
+from futile.logging import LoggerMixin
+from openmtc_onem2m.exc import (OneM2MError, STATUS_REQUEST_TIMEOUT,
+                                STATUS_INTERNAL_SERVER_ERROR,
+                                STATUS_TARGET_NOT_REACHABLE,
+                                STATUS_EXTERNAL_OBJECT_NOT_REACHABLE)
+from openmtc_onem2m.transport import OneM2MErrorResponse
+
+# response status codes after which a delivery is retried, other errors
+# (e.g. missing privileges) will not go away by trying again
+_retry_status_codes = frozenset((
+    STATUS_REQUEST_TIMEOUT.numeric_code,
+    STATUS_INTERNAL_SERVER_ERROR.numeric_code,
+    STATUS_TARGET_NOT_REACHABLE.numeric_code,
+    STATUS_EXTERNAL_OBJECT_NOT_REACHABLE.numeric_code,
+))
+
+
+def is_retriable(error):
+    if isinstance(error, OneM2MError):
+        return getattr(error, "rsc", None) in _retry_status_codes
+    # network errors, timeouts, ...
+    return True
+
+
+class OutboxTarget(object):
+    """Queue and delivery state of a single notification target."""
+
+    def __init__(self, uri):
+        super(OutboxTarget, self).__init__()
+        self.uri = uri
+        # (request, enqueue time, attempts)
+        self.queue = deque()
+        self.in_flight = 0
+        self.failures = 0
+        self.retry_timer = None
+        self.delivered = 0
+        self.dropped = 0
+
+    @property
+    def idle(self):
+        return not (self.queue or self.in_flight or self.retry_timer)
+
+
+class NotificationOutbox(LoggerMixin):
+    """Delivers notify requests in the background.
+
+    Every notification target gets a bounded queue and a limit of concurrent
+    requests, so a slow or unreachable target only delays its own
+    notifications. Failed deliveries are retried with exponential backoff,
+    while a target backs off its queue is held. When a queue is full the
+    oldest request is dropped.
+    """
+
+    def __init__(self, api, max_queue_size=1000, max_in_flight=2,
+                 max_retries=5, retry_backoff=1.0, max_retry_backoff=60.0,
+                 request_timeout=30.0):
+        super(NotificationOutbox, self).__init__()
+        self.api = api
+        self.max_queue_size = max_queue_size
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_retry_backoff = max_retry_backoff
+        self.request_timeout = request_timeout
+
+        self._targets = {}
+
+        # counters
+        self.delivered = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retried = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def send(self, uri, request):
+        """Queues the notify request for the given notification target.
+
+        Returns False if an older request had to be dropped to make room.
+        """
+        try:
+            target = self._targets[uri]
+        except KeyError:
+            target = self._targets[uri] = OutboxTarget(uri)
+
+        queue = target.queue
+        accepted = True
+        if len(queue) >= self.max_queue_size:
+            dropped = queue.popleft()[0]
+            target.dropped += 1
+            self.dropped += 1
+            accepted = False
+            self.logger.warning("Outbox for %s is full, dropping %s", uri,
+                                dropped)
+
+        queue.append((request, time(), 0))
+        self._schedule(target)
+        return accepted
+
+    def _schedule(self, target):
+        while (target.queue and target.retry_timer is None and
+               target.in_flight < self.max_in_flight):
+            item = target.queue.popleft()
+            target.in_flight += 1
+            # timers run outside of the task runner's pool
+            self.api.set_timer(0, self._deliver, target, item)
+
+    def _deliver(self, target, item):
+        request, enqueued, attempts = item
+        try:
+            promise = self.api.handle_onem2m_request(request)
+            promise.wait(self.request_timeout)
+        except Exception as error:
+            self._handle_error(target, item, error)
+            self._release(target)
+            return
+
+        if promise.isPending():
+            # the request is still outstanding, it keeps its slot until it
+            # settles, so max_in_flight holds for slow targets as well
+            self._handle_error(target, item, OneM2MErrorResponse(
+                STATUS_REQUEST_TIMEOUT, request=request))
+            promise.addCallback(lambda _: self._release(target))
+            promise.addErrback(lambda _: self._release(target))
+            return
+
+        if promise.isRejected():
+            self._handle_error(target, item, promise.reason)
+        else:
+            latency = time() - enqueued
+            target.failures = 0
+            target.delivered += 1
+            self.delivered += 1
+            self.latency_total += latency
+            if latency > self.latency_max:
+                self.latency_max = latency
+        self._release(target)
+
+    def _release(self, target):
+        target.in_flight -= 1
+        self._schedule(target)
+        if target.idle and self._targets.get(target.uri) is target:
+            del self._targets[target.uri]
+
+    def _handle_error(self, target, item, error):
+        request, enqueued, attempts = item
+
+        if attempts >= self.max_retries or not is_retriable(error):
+            self.failed += 1
+            self.logger.warning("Failed to deliver notification to %s: %r",
+                                target.uri, error)
+            return
+
+        target.failures += 1
+        self.retried += 1
+        target.queue.appendleft((request, enqueued, attempts + 1))
+
+        if target.retry_timer is None:
+            delay = min(self.retry_backoff * 2 ** (target.failures - 1),
+                        self.max_retry_backoff)
+            self.logger.debug("Delivery to %s failed (%r), retrying in %ss",
+                              target.uri, error, delay)
+            target.retry_timer = self.api.set_timer(delay, self._resume,
+                                                    target)
+
+    def _resume(self, target):
+        target.retry_timer = None
+        self._schedule(target)
+
+    def get_stats(self):
+        targets = self._targets.values()
+        return {
+            "targets": len(self._targets),
+            "queued": sum(len(t.queue) for t in targets),
+            "in_flight": sum(t.in_flight for t in targets),
+            "backing_off": sum(1 for t in targets if t.retry_timer),
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "retried": self.retried,
+            "latency_avg": (self.latency_total / self.delivered
+                            if self.delivered else 0.0),
+            "latency_max": self.latency_max,
+        }
+
+    def get_queue_depths(self):
+        return {uri: len(t.queue) for uri, t in self._targets.items()}
+
+    def stop(self):
+        for target in self._targets.values():
+            if target.retry_timer is not None:
+                self.api.cancel_timer(target.retry_timer)
+                target.retry_timer = None
+            self.dropped += len(target.queue)
+            target.queue.clear()
+        self.logger.info("Notification outbox stopped: %s", self.get_stats())
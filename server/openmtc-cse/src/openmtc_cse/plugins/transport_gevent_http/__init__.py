@@ -2,10 +2,11 @@ import ssl
 from socket import getservbyname
 
 from openmtc_cse import OneM2MEndPoint
-from openmtc_onem2m.client.http import get_client
+from openmtc_onem2m.client.http import get_client, connection_pools
 from openmtc_server.Plugin import Plugin
 from openmtc_server.configuration import Configuration, SimpleOption
 from openmtc_server.platform.gevent.ServerRack import GEventServerRack
+from .cache import RepresentationCache
 from .wsgi import OpenMTCWSGIServer, OpenMTCWSGIApplication, OpenMTCWSGIHandler
 
 
@@ -20,8 +21,26 @@ class HTTPTransportPlugin(Plugin):
     __configuration__ = HTTPTransportPluginConfiguration
 
     def _init(self):
+        # outgoing requests of all components share the connection pools
+        connection_pools.configure(
+            max_connections=self.config.get("max_client_connections"),
+            idle_timeout=self.config.get("client_idle_timeout"),
+            connection_timeout=self.config.get("client_connection_timeout"))
+
+        cache_size = self.config.get("representation_cache_size", 1000)
+        if cache_size:
+            self.representation_cache = RepresentationCache(cache_size)
+            self.events.resource_updated.register_handler(
+                self._invalidate_representations)
+            self.events.resource_deleted.register_handler(
+                self._invalidate_representations)
+        else:
+            self.representation_cache = None
         self._initialized()
 
+    def _invalidate_representations(self, resource, *args):
+        self.representation_cache.invalidate(resource.resourceID)
+
     def _start_server_rack(self):
         servers = []
 
@@ -45,13 +64,16 @@ class HTTPTransportPlugin(Plugin):
 
         pretty = self.config.get("global", {}).get("pretty", False)
 
+        max_body_size = self.config.get("max_body_size", 16 * 1024 * 1024)
+
         # the __call__ of the OpenMTCWSGIApplication should return a function,
         #   which is given to the WSGIServer as
         # the function that is called by the server for each incoming request
         application = OpenMTCWSGIApplication(
             self.api.handle_onem2m_request, server_address=interface,
             default_content_type=default_content_type, pretty=pretty,
-            require_cert=require_cert
+            require_cert=require_cert, max_body_size=max_body_size,
+            representation_cache=self.representation_cache
         )
 
         if is_https:
@@ -88,4 +110,10 @@ class HTTPTransportPlugin(Plugin):
 
     def _stop(self):
         self.__rack.stop()
+        self.logger.debug("Connection pool stats: %s",
+                          connection_pools.get_stats())
+        connection_pools.close()
+        if self.representation_cache is not None:
+            self.logger.debug("Representation cache stats: %s",
+                              self.representation_cache.get_stats())
         self._stopped()
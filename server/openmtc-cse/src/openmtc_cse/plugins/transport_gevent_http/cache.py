@@ -0,0 +1,82 @@
+from hashlib import md5
+
+from futile.caching import LRUCache
+from futile.logging import LoggerMixin
+
+
+class RepresentationCache(LoggerMixin):
+    """Caches the encoded representations of retrieved resources.
+
+    Entries are keyed by (resourceID, stateTag, lastModifiedTime, content
+    type, fields, rcn, pretty, resourceID prefix), so a changed resource never
+    matches an old entry. Updating or deleting a resource additionally drops
+    all of its entries right away.
+
+    Every entry carries an ETag computed from the encoded body.
+    """
+
+    def __init__(self, max_items=1000):
+        super(RepresentationCache, self).__init__()
+        self._representations = LRUCache(max_items=max_items,
+                                         threadsafe=False)
+        # resourceID -> keys of its cached representations
+        self._keys_by_resource = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Returns (content type, body, ETag) or None."""
+        try:
+            representation = self._representations[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return representation
+
+    def set(self, key, content_type, body):
+        """Stores a representation, key[0] is the resourceID.
+
+        Returns (content type, body, ETag).
+        """
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        representation = (content_type, body, md5(body).hexdigest())
+
+        representations = self._representations
+        representations[key] = representation
+        keys_by_resource = self._keys_by_resource
+        keys = keys_by_resource.setdefault(key[0], set())
+        keys.add(key)
+        if len(keys_by_resource) > 2 * representations.max_items:
+            self._forget_evicted()
+        return representation
+
+    def _forget_evicted(self):
+        # resources never updated keep the keys of their evicted entries
+        live = set(self._representations)
+        self._keys_by_resource = {
+            resource_id: keys & live
+            for resource_id, keys in self._keys_by_resource.items()
+            if not keys.isdisjoint(live)
+        }
+
+    def invalidate(self, resource_id):
+        keys = self._keys_by_resource.pop(resource_id, ())
+        for key in keys:
+            self._representations.pop(key, None)
+        self.invalidations += len(keys)
+
+    def clear(self):
+        self._representations.clear()
+        self._keys_by_resource.clear()
+
+    def get_stats(self):
+        return {
+            "size": len(self._representations),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
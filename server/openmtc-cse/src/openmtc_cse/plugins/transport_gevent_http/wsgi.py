@@ -9,25 +9,41 @@ from funcy import pluck
 from gevent.pywsgi import WSGIHandler, WSGIServer
 #from werkzeug.wrappers import (BaseRequest, CommonRequestDescriptorsMixin,
 #                               UserAgentMixin, AcceptMixin, Response)
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.http import parse_accept_header, parse_etags
 from werkzeug.wrappers import Request as rq
 from werkzeug.wrappers import Response
 
+from futile.caching import LRUCache
 from futile.collections import get_iterable
 from futile.logging import LoggerMixin
 from openmtc.model import ModelTypeError
-from openmtc_cse.methoddomain.filtercriteria import parse_filter_criteria
+from openmtc_cse.methoddomain.filtercriteria import (parse_filter_criteria,
+                                                     filters)
 from openmtc_onem2m.exc import (CSEError, CSEContentsUnacceptable,
                                 STATUS_INTERNAL_SERVER_ERROR, CSEBadRequest,
                                 STATUS_IMPERSONATION_ERROR)
-from openmtc_onem2m.model import (Notification, AttributeList,
+from openmtc_onem2m.model import (Notification, AttributeList, URIList,
+                                  AggregatedNotification, ResourceC,
                                   get_long_attribute_name)
 from openmtc_onem2m.model import get_long_member_name
 from openmtc_onem2m.serializer import get_onem2m_supported_content_types
 from openmtc_onem2m.serializer.util import (decode_onem2m_content,
-                                            encode_onem2m_content)
+                                            encode_onem2m_content,
+                                            encode_onem2m_content_chunks)
 from openmtc_onem2m.transport import (OneM2MErrorResponse, OneM2MOperation,
                                       OneM2MRequest, OneM2MResponse)
 
+# URI lists with more entries are streamed to the client
+STREAM_URI_LIST_THRESHOLD = 1000
+
+# request bodies without content length are read in chunks of this size
+BODY_CHUNK_SIZE = 64 * 1024
+
+# number of distinct Accept headers whose negotiated content type is kept
+ACCEPT_CACHE_SIZE = 256
+
 _method_map_from_http = {
     'POST': OneM2MOperation.create,
     'GET': OneM2MOperation.retrieve,
@@ -35,6 +51,80 @@ _method_map_from_http = {
     'DELETE': OneM2MOperation.delete
 }
 
+# request headers (as WSGI environ keys) -> request parameters
+_header_map_from_http = {
+    # The X-M2M-Origin header shall be mapped to the From parameter of
+    # request and response primitives and vice versa, if applicable.
+    'HTTP_X_M2M_ORIGIN': 'fr',
+    # The X-M2M-RI header shall be mapped to the Request Identifier
+    # parameter of request and response primitives and vice versa.
+    'HTTP_X_M2M_RI': 'rqi',
+    # The X-M2M-GID header shall be mapped to the Group Request Identifier
+    # parameter of request primitives and vice versa, if applicable.
+    'HTTP_X_M2M_GID': 'gid',
+    # The X-M2M-RTU header shall be mapped to the notificationURI element of
+    # the Response Type parameter of request primitives and vice versa, if
+    # applicable. If there are more than one value in the element, then the
+    # values shall be combined with "&" character.
+    'HTTP_X_M2M_RTU': 'rt',
+    # The X-M2M-OT header shall be mapped to the Originating Timestamp
+    # parameter of request and response primitives, and vice versa, if
+    # applicable.
+    'HTTP_X_M2M_OT': 'ot',
+    # The X-M2M-RST header shall be mapped to the Result Expiration
+    # Timestamp parameter of request and response primitives, and vice
+    # versa, if applicable.
+    'HTTP_X_M2M_RST': 'rset',
+    # The X-M2M-RET header shall be mapped to the Request Expiration
+    # Timestamp parameter of request primitives and vice versa, if
+    # applicable.
+    'HTTP_X_M2M_RET': 'rqet',
+    # The X-M2M-OET header shall be mapped to the Operation Execution Time
+    # parameter of request primitives and vice versa, if applicable
+    'HTTP_X_M2M_OET': 'oet',
+    # The X-M2M-EC header shall be mapped to the Event Category parameter of
+    #  request and response primitives, and vice versa, if applicable.
+    'HTTP_X_M2M_EC': 'ec',
+    'HTTP_X_M2M_RVI': 'rvi',
+    'HTTP_X_M2M_VSI': 'vsi',
+}
+
+# kinds of query parameters
+_REQUEST_PARAM = 0
+_ATTRIBUTE_LIST_PARAM = 1
+_FILTER_PARAM = 2
+
+_not_filter_params = frozenset(('rt', 'rp', 'rcn', 'da', 'drt', 'rids',
+                                'tids', 'ltids', 'tqi'))
+_multiple_params = frozenset(('lbl', 'ty', 'cty', 'atr'))
+
+# query parameter -> (kind, long name, multiple values allowed)
+_query_params = {}
+
+
+def _get_query_param(param):
+    try:
+        return _query_params[param]
+    except KeyError:
+        pass
+
+    param_long_name = get_long_member_name(param)
+
+    # TODO(rst): handle attributes with get_long_attribute_name
+    if param in _not_filter_params:
+        kind = _REQUEST_PARAM
+    elif param_long_name == 'attributeList':
+        kind = _ATTRIBUTE_LIST_PARAM
+    elif param_long_name and hasattr(filters, param_long_name):
+        kind = _FILTER_PARAM
+    else:
+        raise CSEBadRequest("Unknown parameter: %s" % param)
+
+    # only valid parameters are remembered
+    info = _query_params[param] = (kind, param_long_name,
+                                   param in _multiple_params)
+    return info
+
 
 def is_ipv4(address):
     try:
@@ -75,7 +165,8 @@ class OpenMTCWSGIApplication(LoggerMixin):
     __cached_addresses = {}
 
     def __init__(self, request_handler, server_address, default_content_type,
-                 pretty=False, require_cert=True):
+                 pretty=False, require_cert=True, max_body_size=None,
+                 representation_cache=None):
         super(OpenMTCWSGIApplication, self).__init__()
 
         self.request_handler = request_handler
@@ -95,6 +186,11 @@ class OpenMTCWSGIApplication(LoggerMixin):
         self.default_content_type = default_content_type
         self.pretty = pretty
         self.require_cert = require_cert
+        self.max_body_size = max_body_size
+        self.representation_cache = representation_cache
+
+        self.__accept_cache = LRUCache(max_items=ACCEPT_CACHE_SIZE,
+                                       threadsafe=False)
 
     def _get_addresses(self, family):
         try:
@@ -181,6 +277,41 @@ class OpenMTCWSGIApplication(LoggerMixin):
             status=204
         )
 
+    def _read_body(self, http_request):
+        """Reads the request body from the input stream.
+
+        Bodies exceeding max_body_size are rejected with 413 as early as
+        possible: right away if the content length says so, otherwise as
+        soon as that many bytes were received.
+        """
+        stream = http_request.input_stream
+        max_body_size = self.max_body_size
+        content_length = http_request.content_length
+
+        if content_length is not None:
+            if max_body_size is not None and content_length > max_body_size:
+                raise RequestEntityTooLarge()
+            if not content_length:
+                return None
+            # a single buffer, handed to the decoder as it is
+            return stream.read(content_length)
+
+        # chunked transfer encoding, the size is known at the end only
+        chunks = []
+        size = 0
+        while True:
+            chunk = stream.read(BODY_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if max_body_size is not None and size > max_body_size:
+                raise RequestEntityTooLarge()
+            chunks.append(chunk)
+
+        if len(chunks) == 1:
+            return chunks[0]
+        return b"".join(chunks)
+
     def map_http_request_to_onem2m_request(self, http_request):
         """Maps a HTTP request to a OneM2M request.
 
@@ -198,113 +329,71 @@ class OpenMTCWSGIApplication(LoggerMixin):
         elif to.startswith('_/'):
             to = '/' + to[1:]
 
-        get_header = http_request.headers.get
-
-        # The X-M2M-Origin header shall be mapped to the From parameter of
-        # request and response primitives and vice versa, if applicable.
-        fr = get_header("x-m2m-origin")
-
-        # The X-M2M-RI header shall be mapped to the Request Identifier
-        # parameter of request and response primitives and vice versa.
-        rqi = get_header("x-m2m-ri")
+        # one pass over the headers
+        params = {}
+        get_param_name = _header_map_from_http.get
+        for key, value in http_request.environ.items():
+            name = get_param_name(key)
+            if name is not None:
+                params[name] = value
 
         # primitive content
-        pc = decode_onem2m_content(http_request.input_stream.read(),
+        pc = decode_onem2m_content(self._read_body(http_request),
                                    http_request.content_type)
 
         # resource type
         # get out of content-type or from resource
         ty = type(pc) if pc else None
-        if ty is Notification:
+        if ty is Notification or ty is AggregatedNotification:
             op = OneM2MOperation.notify
 
-        # The X-M2M-GID header shall be mapped to the Group Request Identifier
-        # parameter of request primitives and vice versa, if applicable.
-        gid = get_header("x-m2m-gid")
-
-        # The X-M2M-RTU header shall be mapped to the notificationURI element of
-        # the Response Type parameter of request primitives and vice versa, if
-        # applicable. If there are more than one value in the element, then the
-        # values shall be combined with "&" character.
-        rt = get_header("x-m2m-rtu")
-
-        # The X-M2M-OT header shall be mapped to the Originating Timestamp
-        # parameter of request and response primitives, and vice versa, if
-        # applicable.
-        ot = get_header("x-m2m-ot")
-
-        # The X-M2M-RST header shall be mapped to the Result Expiration
-        # Timestamp parameter of request and response primitives, and vice
-        # versa, if applicable.
-        rset = get_header("x-m2m-rst")
-
-        # The X-M2M-RET header shall be mapped to the Request Expiration
-        # Timestamp parameter of request primitives and vice versa, if
-        # applicable.
-        rqet = get_header("x-m2m-ret")
-
-        # The X-M2M-OET header shall be mapped to the Operation Execution Time
-        # parameter of request primitives and vice versa, if applicable
-        oet = get_header("x-m2m-oet")
-
-        # The X-M2M-EC header shall be mapped to the Event Category parameter of
-        #  request and response primitives, and vice versa, if applicable.
-        ec = get_header("x-m2m-ec")
-
-        # The X-M2M-CTS header shall be mapped to the Content Status parameter
-        # of response primitives and vice versa, if applicable.
-        rvi = get_header("x-m2m-rvi")
-
-        # The X-M2M-CTS header shall be mapped to the Content Status parameter
-        # of response primitives and vice versa, if applicable.
-        vsi = get_header("x-m2m-vsi")
-
-        onem2m_request = OneM2MRequest(op=op, to=to, fr=fr, rqi=rqi, ty=ty,
-                                       pc=pc, ot=ot, rqet=rqet, rset=rset,
-                                       oet=oet, rt=rt, ec=ec, gid=gid, rvi=rvi,
-                                       vsi=vsi)
-
-        not_filter_params = ('rt', 'rp', 'rcn', 'da', 'drt', 'rids', 'tids',
-                             'ltids', 'tqi')
-        multiple_params = ('lbl', 'ty', 'cty', 'atr')
-
-        if http_request.query_string:
-            from openmtc_cse.methoddomain.filtercriteria import filters
-            params = urllib.parse.parse_qs(http_request.query_string.decode("utf-8"))
-            get_param = params.get
-            f_c = {}
+        onem2m_request = OneM2MRequest(op=op, to=to, ty=ty, pc=pc, **params)
 
-            for param in params:
-                self.logger.debug("checking '%s'", param)
+        query_string = http_request.query_string
+        if query_string:
+            f_c = {}
+            seen = set()
 
-                values = get_param(param)
+            for param, value in urllib.parse.parse_qsl(
+                    query_string.decode("utf-8")):
+                kind, param_long_name, multiple = _get_query_param(param)
 
-                if param not in multiple_params and len(values) > 1:
+                first = param not in seen
+                if not first and not multiple:
                     raise CSEBadRequest("Multiple field names not permitted "
                                         "for parameter %s" % param)
+                seen.add(param)
 
-                param_long_name = get_long_member_name(param)
-
-                # TODO(rst): handle attributes with get_long_attribute_name
-                if param in not_filter_params:
-                    setattr(onem2m_request, param, values[0])
-                elif param_long_name == 'attributeList':
-                    onem2m_request.pc = AttributeList(
-                        list(map(get_long_attribute_name, values[0].split(' '))))
-                elif param_long_name and hasattr(filters, param_long_name):
-                    self.logger.debug("got values for '%s' ('%s'): %s",
-                                      param_long_name, param, values)
-
-                    if param in multiple_params:
-                        f_c[param_long_name] = values
+                if kind == _FILTER_PARAM:
+                    if multiple:
+                        f_c.setdefault(param_long_name, []).append(value)
                     else:
-                        f_c[param_long_name] = values[0]
-                else:
-                    raise CSEBadRequest("Unknown parameter: %s" % param)
+                        f_c[param_long_name] = value
+                elif kind == _REQUEST_PARAM:
+                    setattr(onem2m_request, param, value)
+                elif first:
+                    onem2m_request.pc = AttributeList(
+                        list(map(get_long_attribute_name, value.split(' '))))
             onem2m_request.filter_criteria = parse_filter_criteria(f_c)
 
         return onem2m_request
 
+    def _negotiate_content_type(self, accept_header):
+        if not accept_header:
+            return self.default_content_type
+        # clients send the same few Accept headers over and over
+        try:
+            return self.__accept_cache[accept_header]
+        except KeyError:
+            supported = get_onem2m_supported_content_types()
+            accept = parse_accept_header(accept_header, MIMEAccept).best_match(
+                supported)
+            if accept is None:
+                # TODO(rst): raise 406 or similar
+                accept = self.default_content_type
+            self.__accept_cache[accept_header] = accept
+            return accept
+
     def map_onem2m_response_to_http_response(self, request, response):
         """Maps a OneM2M response to a HTTP response.
 
@@ -344,24 +433,28 @@ class OpenMTCWSGIApplication(LoggerMixin):
         except (AttributeError, TypeError):
             pass
 
+        environ = request.environ
         pretty = self.pretty
         if pretty is None:
-            user_agent = request.user_agent
-            pretty = user_agent and ("opera" in user_agent or
-                                     "mozilla" in user_agent)
-        supported = get_onem2m_supported_content_types()
-        if request.accept_mimetypes:
-            accept = request.accept_mimetypes.best_match(supported)
-            if accept is None:
-                # TODO(rst): raise 406 or similar
-                accept = self.default_content_type
+            user_agent = environ.get("HTTP_USER_AGENT", "").lower()
+            pretty = "opera" in user_agent or "mozilla" in user_agent
+        accept = self._negotiate_content_type(environ.get("HTTP_ACCEPT"))
+        cache_key = self._get_representation_key(request, response, accept,
+                                                 pretty, resource_id_pre)
+        if cache_key is not None:
+            return self._get_cached_response(request, response, cache_key,
+                                             accept, pretty, resource_id_pre,
+                                             status_code, headers)
+        if (isinstance(response.content, URIList) and
+                len(response.content.values) > STREAM_URI_LIST_THRESHOLD):
+            # large discovery results are sent chunked
+            encode = encode_onem2m_content_chunks
         else:
-            accept = self.default_content_type
+            encode = encode_onem2m_content
         try:
-            content_type, payload = encode_onem2m_content(response.content,
-                                                          accept, pretty,
-                                                          path=resource_id_pre,
-                                                          fields=response.fields)
+            content_type, payload = encode(response.content, accept, pretty,
+                                           path=resource_id_pre,
+                                           fields=response.fields)
         except CSEContentsUnacceptable as e:
             status_code = e.status_code
             content_type = "text/plain"
@@ -374,6 +467,51 @@ class OpenMTCWSGIApplication(LoggerMixin):
             content_type=content_type
         )
 
+    def _get_representation_key(self, request, response, accept, pretty,
+                                resource_id_pre):
+        """Returns the key of the cached representation or None if the
+        response is not cacheable.
+        """
+        if self.representation_cache is None or request.method != "GET":
+            return None
+        content = response.content
+        # the children of a resource may change without the resource itself
+        if not isinstance(content, ResourceC) or \
+                not content.resourceID or content.childResource:
+            return None
+        return (content.resourceID, getattr(content, "stateTag", None),
+                content.lastModifiedTime, accept,
+                tuple(response.fields) if response.fields else None,
+                request.args.get("rcn"), pretty, resource_id_pre)
+
+    def _get_cached_response(self, request, response, cache_key, accept,
+                             pretty, resource_id_pre, status_code, headers):
+        cache = self.representation_cache
+        representation = cache.get(cache_key)
+        if representation is None:
+            try:
+                content_type, payload = encode_onem2m_content(
+                    response.content, accept, pretty, path=resource_id_pre,
+                    fields=response.fields)
+            except CSEContentsUnacceptable as e:
+                return Response(str(e), status=e.status_code,
+                                headers=headers, content_type="text/plain")
+            representation = cache.set(cache_key, content_type, payload)
+
+        content_type, payload, etag = representation
+        headers["ETag"] = '"%s"' % (etag,)
+
+        if_none_match = request.environ.get("HTTP_IF_NONE_MATCH")
+        if if_none_match and parse_etags(if_none_match).contains(etag):
+            return Response(status=304, headers=headers)
+
+        return Response(
+            payload,
+            status=status_code,
+            headers=headers,
+            content_type=content_type
+        )
+
     def map_onem2m_error_to_http_error(self, response):
         """Maps a OneM2M error response to a HTTP response.
 
@@ -426,6 +564,9 @@ class OpenMTCWSGIApplication(LoggerMixin):
                 return response
 
             onem2m_response = self.request_handler(onem2m_request).get()
+        except RequestEntityTooLarge as error:
+            self.logger.debug("Rejecting request: %s", error)
+            return error
         except OneM2MErrorResponse as error_response:
             response = self.map_onem2m_error_to_http_error(error_response)
         except CSEError as error:
@@ -1,3 +1,4 @@
+from time import time
 from urllib.parse import urlparse
 from netifaces import AF_INET, AF_INET6
 
@@ -5,10 +6,11 @@ from aplus import Promise
 from openmtc.exc import OpenMTCNetworkError
 from openmtc_onem2m.model import RemoteCSE
 from futile.collections import get_iterable
-from openmtc_onem2m.transport import OneM2MErrorResponse
+from openmtc_onem2m.transport import OneM2MErrorResponse, OneM2MOperation
 from openmtc_server import Component
 from openmtc_onem2m.exc import CSETargetNotReachable, CSENotImplemented
 from openmtc_onem2m.util import split_onem2m_address
+from .health import EndpointHealthTracker
 
 
 class OneM2MTransportDomain(Component):
@@ -48,6 +50,12 @@ class OneM2MTransportDomain(Component):
 
         self._get_clients = {}
 
+        health_config = self.config.get("onem2m", {}).get("endpoint_health", {})
+        self._health = EndpointHealthTracker(
+            failure_threshold=health_config.get("failure_threshold", 3),
+            cooldown=health_config.get("cooldown", 30.0))
+        self._race_endpoints = health_config.get("race", False)
+
     def initialize(self, api):
         self._api = api
         self.events = api.events
@@ -151,6 +159,63 @@ class OneM2MTransportDomain(Component):
         self._poa_templates.append(poa)
         self._create_endpoints()
 
+    def _get_client(self, poa):
+        use_xml = False  # TODO(rst): check how this needs to be handled
+        ssl_certs = {
+            'ca_certs': self.ca_file,
+            'cert_file': self.cert_file,
+            'key_file': self.key_file
+        }
+        # TODO(hve): add scheme test.
+        scheme = urlparse(poa).scheme
+        try:
+            get_client = self._get_clients[scheme]
+        except KeyError:
+            self.logger.error("Scheme %s not configured" % scheme)
+            return None
+        return get_client(poa, use_xml, insecure=self.accept_insecure_certs,
+                          **ssl_certs)
+
+    def _send_to_endpoint(self, onem2m_request, poa, client):
+        t = time()
+        try:
+            response = client.send_onem2m_request(onem2m_request).get()
+        except OpenMTCNetworkError:
+            self._health.record_failure(poa)
+            raise
+        except OneM2MErrorResponse:
+            # the endpoint is reachable nevertheless
+            self._health.record_success(poa, time() - t)
+            raise
+        self._health.record_success(poa, time() - t)
+        return response
+
+    def _send_to_fastest_endpoint(self, onem2m_request, endpoints):
+        """Sends the request to all endpoints at once, the first answer wins.
+        Raises the last network error if none of them could be reached.
+        """
+        race = Promise()
+        pending = [len(endpoints)]
+
+        def attempt(poa, client):
+            try:
+                response = self._send_to_endpoint(onem2m_request, poa, client)
+            except Exception as error:
+                pending[0] -= 1
+                if race.isPending() and (
+                        not pending[0] or
+                        not isinstance(error, OpenMTCNetworkError)):
+                    race.reject(error)
+            else:
+                pending[0] -= 1
+                if race.isPending():
+                    race.fulfill(response)
+
+        for poa, client in endpoints:
+            self._api.set_timer(0, attempt, poa, client)
+
+        return race.get()
+
     def _send_request_to_endpoints(self, onem2m_request, poa_list):
         with Promise() as p:
             if not poa_list:
@@ -158,24 +223,31 @@ class OneM2MTransportDomain(Component):
 
             onem2m_request.originator = self.originator
 
-            for poa in poa_list:
-                use_xml = False  # TODO(rst): check how this needs to be handled
-                ssl_certs = {
-                    'ca_certs': self.ca_file,
-                    'cert_file': self.cert_file,
-                    'key_file': self.key_file
-                }
-                # TODO(hve): add scheme test.
-                try:
-                    client = self._get_clients[urlparse(poa).scheme](
-                        poa, use_xml, insecure=self.accept_insecure_certs, **ssl_certs)
-                except KeyError:
-                    self.logger.error("Scheme %s not configured" % urlparse(poa).scheme)
-                    continue
+            # healthy and fast endpoints first, known bad ones last
+            endpoints = []
+            for poa in self._health.order(poa_list):
+                client = self._get_client(poa)
+                if client is not None:
+                    endpoints.append((poa, client))
+
+            # only idempotent requests may be sent to more than one endpoint
+            if (self._race_endpoints and len(endpoints) > 1 and
+                    onem2m_request.operation == OneM2MOperation.retrieve and
+                    self._health.is_available(endpoints[1][0])):
+                race, endpoints = endpoints[:2], endpoints[2:]
                 try:
-                    response = client.send_onem2m_request(onem2m_request).get()
-                    p.fulfill(response)
+                    p.fulfill(self._send_to_fastest_endpoint(onem2m_request, race))
+                except OpenMTCNetworkError:
+                    pass
+                except OneM2MErrorResponse as error_response:
+                    p.reject(error_response)
+
+            for poa, client in endpoints:
+                if not p.isPending():
                     break
+                try:
+                    p.fulfill(self._send_to_endpoint(onem2m_request, poa,
+                                                     client))
                 except OpenMTCNetworkError:
                     continue
                 except OneM2MErrorResponse as error_response:
@@ -215,6 +287,9 @@ class OneM2MTransportDomain(Component):
 
     def remove_poa_list(self, identifier):
         try:
-            del self._poa_lists[identifier]
+            self._health.forget(self._poa_lists.pop(identifier))
         except KeyError:
             pass
+
+    def get_endpoint_health(self):
+        return self._health.get_stats()
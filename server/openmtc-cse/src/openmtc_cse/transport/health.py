@@ -0,0 +1,101 @@
+from time import time
+
+from futile.logging import LoggerMixin
+
+
+class EndpointHealth(object):
+    """Recent behaviour of a single point of access."""
+
+    def __init__(self, poa):
+        super(EndpointHealth, self).__init__()
+        self.poa = poa
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency = None
+        self.open_until = 0.0
+
+
+class EndpointHealthTracker(LoggerMixin):
+    """Orders points of access by their health.
+
+    Every point of access keeps a moving average of its latency and the
+    number of consecutive failures. After failure_threshold failures in a
+    row its circuit opens for cooldown seconds: it is then only tried after
+    all other points of access. After the cooldown it is tried again in its
+    normal order, the next failure opens the circuit again right away.
+    """
+
+    def __init__(self, failure_threshold=3, cooldown=30.0, ewma_alpha=0.3):
+        super(EndpointHealthTracker, self).__init__()
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.ewma_alpha = ewma_alpha
+
+        self._endpoints = {}
+
+    def _get(self, poa):
+        try:
+            return self._endpoints[poa]
+        except KeyError:
+            health = self._endpoints[poa] = EndpointHealth(poa)
+            return health
+
+    def order(self, poa_list):
+        """Returns the points of access, healthy and fast ones first.
+
+        Unknown points of access are tried before known ones, so they get
+        measured. Ties keep the given order.
+        """
+        if len(poa_list) < 2:
+            return list(poa_list)
+
+        now = time()
+        endpoints = self._endpoints
+
+        def key(poa):
+            health = endpoints.get(poa)
+            if health is None:
+                return False, 0, 0.0
+            return (health.open_until > now, health.consecutive_failures,
+                    health.latency or 0.0)
+
+        return sorted(poa_list, key=key)
+
+    def record_success(self, poa, latency):
+        health = self._get(poa)
+        health.consecutive_failures = 0
+        health.open_until = 0.0
+        if health.latency is None:
+            health.latency = latency
+        else:
+            health.latency += self.ewma_alpha * (latency - health.latency)
+
+    def record_failure(self, poa):
+        health = self._get(poa)
+        health.failures += 1
+        health.consecutive_failures += 1
+        if health.consecutive_failures >= self.failure_threshold:
+            if health.consecutive_failures == self.failure_threshold:
+                self.logger.warning("%s failed %d times in a row, avoiding it "
+                                    "for %ss", poa, health.consecutive_failures,
+                                    self.cooldown)
+            health.open_until = time() + self.cooldown
+
+    def is_available(self, poa):
+        health = self._endpoints.get(poa)
+        return health is None or health.open_until <= time()
+
+    def forget(self, poa_list):
+        for poa in poa_list:
+            self._endpoints.pop(poa, None)
+
+    def get_stats(self):
+        now = time()
+        return {
+            poa: {
+                "failures": health.failures,
+                "consecutive_failures": health.consecutive_failures,
+                "latency": health.latency,
+                "available": health.open_until <= now,
+            } for poa, health in self._endpoints.items()
+        }
@@ -53,6 +53,10 @@ class Session(object, metaclass=ABCMeta):
     def get(self, resource):
         raise NotImplementedError()
 
+    @abstractmethod
+    def view(self, path):
+        raise NotImplementedError()
+
     @abstractmethod
     def get_collection(self, resource_type, parent, filter_criteria=None):
         raise NotImplementedError()
@@ -65,6 +69,18 @@ class Session(object, metaclass=ABCMeta):
     def get_latest_content_instance(self, parent):
         raise NotImplementedError()
 
+    @abstractmethod
+    def get_nth_content_instance(self, parent, n):
+        raise NotImplementedError()
+
+    @abstractmethod
+    def get_content_instances(self, parent, start=0, stop=None):
+        raise NotImplementedError()
+
+    @abstractmethod
+    def find(self, parent, filter_criteria):
+        raise NotImplementedError()
+
     @abstractmethod
     def exists(self, resource_type, fields):
         raise NotImplementedError()
@@ -119,6 +135,26 @@ class BasicSession(Session, LoggerMixin, metaclass=ABCMeta):
         collection = self._get_content_instances(parent)
         return self._filter_latest(collection)
 
+    def get_nth_content_instance(self, parent, n):
+        collection = self._get_content_instances(parent)
+        try:
+            return collection[n]
+        except IndexError:
+            raise DBError("No ContentInstance at index %s" % (n, ))
+
+    def get_content_instances(self, parent, start=0, stop=None):
+        return self._get_content_instances(parent)[start:stop]
+
+    def view(self, path):
+        """Returns the resource without copying it, the caller must not
+        modify it. Sessions handing out their stored resources override this.
+        """
+        return self.get(path)
+
+    def find(self, parent, filter_criteria):
+        # no indexes, the caller needs to walk the resource tree
+        return None
+
     def delete_children(self, resource_type, parent):
         children = self.get_collection(resource_type, parent)
         for c in children:
@@ -0,0 +1,167 @@
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from itertools import count
+
+# indexed time attributes and the filter criteria for their lower and upper
+# (exclusive) bounds
+time_criteria = (
+    ("creationTime", "createdAfter", "createdBefore"),
+    ("lastModifiedTime", "modifiedSince", "unmodifiedSince"),
+    ("expirationTime", "expireAfter", "expireBefore"),
+)
+
+
+def timestamp(value):
+    try:
+        return value.timestamp()
+    except AttributeError:
+        return None
+
+
+def get_index_criteria(filter_criteria):
+    """Extracts the criteria that can be answered by an index.
+
+    Returns a tuple (labels, resource_types, time_ranges) or None if none of
+    the given criteria is indexed. time_ranges maps the time attribute names
+    to (lower, upper) tuples of timestamps, both bounds may be None.
+    """
+    if filter_criteria is None:
+        return None
+
+    labels = getattr(filter_criteria, "labels", None) or None
+    resource_types = getattr(filter_criteria, "resourceType", None) or None
+    if resource_types is not None:
+        resource_types = set(map(int, resource_types))
+
+    time_ranges = {}
+    for name, lower_criterion, upper_criterion in time_criteria:
+        lower = timestamp(getattr(filter_criteria, lower_criterion, None))
+        upper = timestamp(getattr(filter_criteria, upper_criterion, None))
+        if lower is not None or upper is not None:
+            time_ranges[name] = (lower, upper)
+
+    if labels is None and resource_types is None and not time_ranges:
+        return None
+    return labels, resource_types, time_ranges
+
+
+def in_subtree(path, root_path):
+    return path == root_path or path.startswith(root_path + "/")
+
+
+class SortedIndex(object):
+    """Paths sorted by a numeric key, for range queries."""
+
+    def __init__(self):
+        super(SortedIndex, self).__init__()
+        # (key, sequence number, path), the sequence number makes entries
+        # unique so paths are never compared
+        self._entries = []
+
+    def add(self, key, seq, path):
+        insort(self._entries, (key, seq, path))
+
+    def remove(self, key, seq):
+        entries = self._entries
+        i = bisect_left(entries, (key, seq))
+        if i < len(entries) and entries[i][1] == seq:
+            del entries[i]
+
+    def range(self, lower=None, upper=None):
+        entries = self._entries
+        start = 0 if lower is None else bisect_right(entries,
+                                                     (lower, float("inf")))
+        stop = len(entries) if upper is None else bisect_left(entries,
+                                                              (upper, -1))
+        return {entries[i][2] for i in range(start, stop)}
+
+
+class ResourceIndex(object):
+    """Secondary indexes over labels, resourceType and the time attributes.
+
+    The indexed values of every resource are remembered so a resource can be
+    removed from the index after it has been modified in place.
+    """
+
+    def __init__(self):
+        super(ResourceIndex, self).__init__()
+        self._counter = count()
+        # path -> (sequence number, labels, resourceType, time keys)
+        self._entries = {}
+        self.labels = defaultdict(set)
+        self.resource_types = defaultdict(set)
+        self.times = {name: SortedIndex() for name, _, _ in time_criteria}
+
+    def add(self, resource, seq=None):
+        path = resource.path
+        if seq is None:
+            seq = next(self._counter)
+
+        labels = tuple(getattr(resource, "labels", None) or ())
+        for label in labels:
+            self.labels[label].add(path)
+
+        resource_type = getattr(resource, "resourceType", None)
+        if resource_type is not None:
+            resource_type = int(resource_type)
+            self.resource_types[resource_type].add(path)
+
+        keys = []
+        for name, _, _ in time_criteria:
+            key = timestamp(getattr(resource, name, None))
+            if key is not None:
+                self.times[name].add(key, seq, path)
+            keys.append(key)
+
+        self._entries[path] = (seq, labels, resource_type, keys)
+
+    def remove(self, path):
+        try:
+            seq, labels, resource_type, keys = self._entries.pop(path)
+        except KeyError:
+            return
+
+        for label in labels:
+            paths = self.labels[label]
+            paths.discard(path)
+            if not paths:
+                del self.labels[label]
+
+        if resource_type is not None:
+            paths = self.resource_types[resource_type]
+            paths.discard(path)
+            if not paths:
+                del self.resource_types[resource_type]
+
+        for (name, _, _), key in zip(time_criteria, keys):
+            if key is not None:
+                self.times[name].remove(key, seq)
+
+        return seq
+
+    def update(self, resource):
+        # keep the position in the creation order
+        self.add(resource, self.remove(resource.path))
+
+    def find(self, root_path, criteria):
+        """Returns the paths below and including root_path matching the
+        index criteria (see get_index_criteria()) in creation order.
+        """
+        labels, resource_types, time_ranges = criteria
+
+        candidates = []
+        if labels is not None:
+            candidates.append(set().union(
+                *(self.labels.get(l, ()) for l in labels)))
+        if resource_types is not None:
+            candidates.append(set().union(
+                *(self.resource_types.get(t, ()) for t in resource_types)))
+        for name, (lower, upper) in time_ranges.items():
+            candidates.append(self.times[name].range(lower, upper))
+
+        candidates.sort(key=len)
+        paths = candidates[0].intersection(*candidates[1:])
+
+        entries = self._entries
+        return sorted((p for p in paths if in_subtree(p, root_path)),
+                      key=lambda p: entries[p][0])
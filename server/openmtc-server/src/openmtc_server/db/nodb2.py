@@ -3,9 +3,79 @@ from openmtc_server.db import BasicSession
 from copy import copy
 from collections import defaultdict, OrderedDict
 from openmtc_server.db.exc import DBConflict, DBNotFound
+from openmtc_server.db.index import ResourceIndex, get_index_criteria
 from openmtc_onem2m.model import OneM2MResource
 
 
+class ContentInstanceIndex(object):
+    """Insertion ordered contentInstances of a single container.
+
+    Instances are appended at the end and usually evicted from the front,
+    so both are O(1) (amortized). Positional access does not copy the
+    collection.
+    """
+
+    # compact the backing list when at least this many slots are unused
+    COMPACT_THRESHOLD = 64
+
+    def __init__(self):
+        super(ContentInstanceIndex, self).__init__()
+        self._items = []
+        self._start = 0
+
+    def __len__(self):
+        return len(self._items) - self._start
+
+    def append(self, resource):
+        self._items.append(resource)
+
+    def remove(self, resource):
+        items = self._items
+        path = resource.path
+
+        if not len(self):
+            raise ValueError(path)
+
+        if items[self._start].path == path:
+            items[self._start] = None
+            self._start += 1
+            if self._start == len(items):
+                self._items = []
+                self._start = 0
+            elif (self._start >= self.COMPACT_THRESHOLD and
+                  self._start * 2 >= len(items)):
+                del items[:self._start]
+                self._start = 0
+        elif items[-1].path == path:
+            items.pop()
+        else:
+            for i in range(self._start + 1, len(items) - 1):
+                if items[i].path == path:
+                    del items[i]
+                    break
+            else:
+                raise ValueError(path)
+
+    def __getitem__(self, index):
+        length = len(self)
+
+        if isinstance(index, slice):
+            items = self._items
+            offset = self._start
+            return [items[offset + i] for i in range(*index.indices(length))]
+
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError(index)
+        return self._items[self._start + index]
+
+    def __iter__(self):
+        items = self._items
+        for i in range(self._start, len(items)):
+            yield items[i]
+
+
 class NoDB2Session(BasicSession):
     def __init__(self, db, std_type, *args, **kw):
         super(NoDB2Session, self).__init__(std_type, *args, **kw)
@@ -16,6 +86,8 @@ class NoDB2Session(BasicSession):
         if std_type == 'onem2m':
             self.resources = db.onem2m_resources
             self.children = db.onem2m_children
+            self.content_instances = db.onem2m_content_instances
+            self.resource_index = db.onem2m_index
             self.resource_type = OneM2MResource
         else:
             raise DBError('no valid type: %s' % type)
@@ -40,11 +112,14 @@ class NoDB2Session(BasicSession):
                 self.logger.debug("No parent found")
             else:
                 children[resource_type][resource.path] = resource
+                if resource_type is self.cinType:
+                    self._get_index(parent_path).append(resource)
 
         self.children[path] = defaultdict(OrderedDict)
         self.resources[path] = resource
         if self.std_type == 'onem2m':
             self.resources[resource.resourceID] = resource
+        self.resource_index.add(resource)
 
     def _get(self, path):
         try:
@@ -59,6 +134,36 @@ class NoDB2Session(BasicSession):
         resource = self._get(path)
         return copy(resource)
 
+    def view(self, path):
+        assert path is not None
+        return self._get(path)
+
+    def _get_index(self, path):
+        try:
+            return self.content_instances[path]
+        except KeyError:
+            index = self.content_instances[path] = ContentInstanceIndex()
+            return index
+
+    def get_oldest_content_instance(self, parent):
+        return self.get_nth_content_instance(parent, 0)
+
+    def get_latest_content_instance(self, parent):
+        return self.get_nth_content_instance(parent, -1)
+
+    def get_nth_content_instance(self, parent, n):
+        try:
+            return self.content_instances[parent.path][n]
+        except (KeyError, IndexError):
+            raise DBError("No ContentInstance at index %s" % (n, ))
+
+    def get_content_instances(self, parent, start=0, stop=None):
+        try:
+            index = self.content_instances[parent.path]
+        except KeyError:
+            return []
+        return index[start:stop]
+
     def get_collection(self, resource_type, parent, filter_criteria=None):
         self.logger.debug("Getting %s children of %s (%s)", resource_type,
                           parent, parent.__model_name__)
@@ -80,6 +185,16 @@ class NoDB2Session(BasicSession):
         self.logger.debug("Found children: %s", resources)
         return resources
 
+    def find(self, parent, filter_criteria):
+        criteria = get_index_criteria(filter_criteria)
+        if criteria is None:
+            return None
+
+        # read-only, like the results of get_collection()
+        resources = self.resources
+        return [resources[p] for p in
+                self.resource_index.find(parent.path, criteria)]
+
     def exists(self, resource_type, fields):
         self.logger.debug("Checking existence of %s with %s", resource_type,
                           fields)
@@ -117,6 +232,8 @@ class NoDB2Session(BasicSession):
             for field in fields:
                 setattr(old_resource, field, getattr(resource, field))
 
+        self.resource_index.update(old_resource)
+
     def delete(self, resource):
         self.logger.debug("Deleting: %s", resource)
 
@@ -124,12 +241,16 @@ class NoDB2Session(BasicSession):
         if self.std_type == 'onem2m':
             del self.resources[resource.resourceID]
         del self.children[resource.path]
+        self.content_instances.pop(resource.path, None)
+        self.resource_index.remove(resource.path)
         try:
             children = self.children[resource.parent_path]
         except KeyError:
             self.logger.debug("No parent found")
         else:
             del children[type(resource)][resource.path]
+            if type(resource) is self.cinType:
+                self.content_instances[resource.parent_path].remove(resource)
 
     def commit(self):
         pass
@@ -151,6 +272,8 @@ class NoDB2(DBAdapter):
         super(NoDB2, self).__init__(*args, **kw)
         self.onem2m_resources = None
         self.onem2m_children = None
+        self.onem2m_content_instances = None
+        self.onem2m_index = None
         self.shelves = None
         self.initialized = False
 
@@ -159,6 +282,8 @@ class NoDB2(DBAdapter):
             raise Exception("Already initialized")
         self.onem2m_resources = {}
         self.onem2m_children = {}
+        self.onem2m_content_instances = {}
+        self.onem2m_index = ResourceIndex()
         self.shelves = defaultdict(NoDB2Shelve)
         self.initialized = True
 
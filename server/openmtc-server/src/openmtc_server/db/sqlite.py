@@ -0,0 +1,621 @@
+import sqlite3
+from collections import OrderedDict
+from copy import copy
+from pickle import dumps, loads, HIGHEST_PROTOCOL
+
+from futile.caching import LRUCache
+from openmtc_onem2m.model import OneM2MResource
+from openmtc_server.db import DBAdapter, Shelve, DBError
+from openmtc_server.db import BasicSession
+from openmtc_server.db.exc import DBConflict, DBNotFound
+from openmtc_server.db.index import (get_index_criteria, time_criteria,
+                                     timestamp)
+
+# attributes that are never persisted: the child references are rebuilt from
+# the parent index on demand and the logger is recreated lazily
+_transient_attributes = ("_childResource", "_LoggerMixin__logger")
+
+_schema = (
+    "CREATE TABLE IF NOT EXISTS meta ("
+    " key TEXT PRIMARY KEY,"
+    " value TEXT)",
+    "CREATE TABLE IF NOT EXISTS resources ("
+    " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+    " path TEXT NOT NULL UNIQUE,"
+    " resource_id TEXT UNIQUE,"
+    " parent_path TEXT,"
+    " type TEXT NOT NULL,"
+    " resource_type INTEGER,"
+    " creation_time REAL,"
+    " last_modified_time REAL,"
+    " expiration_time REAL,"
+    " data BLOB NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS resources_children"
+    " ON resources (parent_path, type, seq)",
+    "CREATE INDEX IF NOT EXISTS resources_resource_type"
+    " ON resources (resource_type)",
+    "CREATE INDEX IF NOT EXISTS resources_creation_time"
+    " ON resources (creation_time)",
+    "CREATE INDEX IF NOT EXISTS resources_last_modified_time"
+    " ON resources (last_modified_time)",
+    "CREATE INDEX IF NOT EXISTS resources_expiration_time"
+    " ON resources (expiration_time)",
+    "CREATE TABLE IF NOT EXISTS labels ("
+    " label TEXT NOT NULL,"
+    " seq INTEGER NOT NULL,"
+    " PRIMARY KEY (label, seq))",
+    "CREATE INDEX IF NOT EXISTS labels_seq ON labels (seq)",
+    "CREATE TABLE IF NOT EXISTS shelves ("
+    " name TEXT NOT NULL,"
+    " key BLOB NOT NULL,"
+    " value BLOB NOT NULL,"
+    " PRIMARY KEY (name, key))",
+)
+
+
+def _dump(obj):
+    state = obj.__dict__.copy()
+    for k in _transient_attributes:
+        state.pop(k, None)
+    return dumps((type(obj), state), HIGHEST_PROTOCOL)
+
+
+def _load(data):
+    cls, state = loads(data)
+    obj = cls.__new__(cls)
+    obj.__dict__.update(state)
+    return obj
+
+
+# time attribute -> column
+_time_columns = {
+    "creationTime": "creation_time",
+    "lastModifiedTime": "last_modified_time",
+    "expirationTime": "expiration_time",
+}
+
+
+def _index_values(resource):
+    resource_type = getattr(resource, "resourceType", None)
+    if resource_type is not None:
+        resource_type = int(resource_type)
+    return (resource_type, ) + tuple(
+        timestamp(getattr(resource, name, None))
+        for name, _, _ in time_criteria)
+
+
+def _type_names(resource_type):
+    if resource_type is None:
+        return None
+    if isinstance(resource_type, (list, tuple, set)):
+        return tuple(t.__name__ for t in resource_type)
+    return (resource_type.__name__,)
+
+
+class SQLiteSession(BasicSession):
+    """Session working on a private write set.
+
+    Changes are only visible to the session itself until commit() writes
+    them to the database within a single transaction. rollback() discards
+    them.
+    """
+
+    def __init__(self, db, std_type, *args, **kw):
+        super(SQLiteSession, self).__init__(std_type, *args, **kw)
+
+        self.db = db
+        self.std_type = std_type
+
+        if std_type == 'onem2m':
+            self.resource_type = OneM2MResource
+        else:
+            raise DBError('no valid type: %s' % type)
+
+        # path -> resource, for resources created or updated in this session
+        self._stored = OrderedDict()
+        # paths of resources created in this session
+        self._created = set()
+        # resourceID -> path, for resources stored in this session
+        self._ids = {}
+        # path -> resourceID, for resources deleted in this session
+        self._deleted = {}
+
+    def _is_deleted(self, key):
+        return key in self._deleted or key in self._deleted.values()
+
+    def _get(self, path):
+        try:
+            return self._stored[path]
+        except KeyError:
+            pass
+        try:
+            return self._stored[self._ids[path]]
+        except KeyError:
+            pass
+        if self._deleted and self._is_deleted(path):
+            self.logger.debug("Resource was deleted")
+            raise DBNotFound(path)
+        return self.db.load_resource(path)
+
+    def store(self, resource):
+        path = resource.path
+
+        self.logger.debug("Adding resource to db: %s -> %s (%s)",
+                          path, resource, type(resource))
+
+        try:
+            self._get(path)
+        except DBNotFound:
+            pass
+        else:
+            raise DBConflict(path)
+
+        self._stored[path] = resource
+        self._created.add(path)
+        self._ids[resource.resourceID] = path
+
+    def get(self, path):
+        assert path is not None
+        self.logger.debug("Getting resource: %s", path)
+        resource = self._get(path)
+        return copy(resource)
+
+    def view(self, path):
+        assert path is not None
+        return self._get(path)
+
+    def _iter_children(self, parent_path, type_names, reverse=False,
+                       limit=None):
+        created = [r for p, r in self._stored.items()
+                   if p in self._created and r.parent_path == parent_path and
+                   (type_names is None or type(r).__name__ in type_names)]
+
+        if limit is not None:
+            # skip entries which were deleted in this session
+            limit += len(self._deleted)
+
+        stored = self.db.load_children(parent_path, type_names, reverse,
+                                       limit)
+
+        def merged():
+            for resource in stored:
+                path = resource.path
+                if path in self._deleted:
+                    continue
+                yield self._stored.get(path, resource)
+
+        if reverse:
+            for resource in reversed(created):
+                yield resource
+            for resource in merged():
+                yield resource
+        else:
+            for resource in merged():
+                yield resource
+            for resource in created:
+                yield resource
+
+    def get_collection(self, resource_type, parent, filter_criteria=None):
+        self.logger.debug("Getting %s children of %s (%s)", resource_type,
+                          parent, parent.__model_name__)
+
+        resources = list(self._iter_children(parent.path,
+                                             _type_names(resource_type)))
+        self.logger.debug("Found children: %s", resources)
+        return resources
+
+    def _get_content_instance(self, parent, reverse):
+        for resource in self._iter_children(parent.path,
+                                            _type_names(self.cinType),
+                                            reverse, 1):
+            return resource
+        raise DBError("ContentInstance collection is empty")
+
+    def get_oldest_content_instance(self, parent):
+        return self._get_content_instance(parent, False)
+
+    def get_latest_content_instance(self, parent):
+        return self._get_content_instance(parent, True)
+
+    def get_nth_content_instance(self, parent, n):
+        if self._created or self._deleted:
+            # positions are shifted by the pending changes of this session
+            return super(SQLiteSession, self).get_nth_content_instance(
+                parent, n)
+
+        reverse = n < 0
+        for resource in self.db.load_children(parent.path,
+                                              _type_names(self.cinType),
+                                              reverse, 1,
+                                              -n - 1 if reverse else n):
+            return self._stored.get(resource.path, resource)
+        raise DBError("No ContentInstance at index %s" % (n, ))
+
+    def get_content_instances(self, parent, start=0, stop=None):
+        if (self._created or self._deleted or start < 0 or
+                (stop is not None and stop < 0)):
+            return super(SQLiteSession, self).get_content_instances(
+                parent, start, stop)
+
+        if stop is None:
+            limit = None
+        elif stop <= start:
+            return []
+        else:
+            limit = stop - start
+
+        return [self._stored.get(r.path, r) for r in
+                self.db.load_children(parent.path, _type_names(self.cinType),
+                                      False, limit, start)]
+
+    def find(self, parent, filter_criteria):
+        if self._stored or self._deleted:
+            # the indexes only cover committed resources
+            return None
+
+        criteria = get_index_criteria(filter_criteria)
+        if criteria is None:
+            return None
+
+        # read-only, like the results of get_collection()
+        return list(self.db.find(parent.path, criteria))
+
+    def exists(self, resource_type, fields):
+        self.logger.debug("Checking existence of %s with %s", resource_type,
+                          fields)
+        fields = dict(fields)
+
+        if not fields:
+            raise ValueError(fields)
+
+        try:
+            path = fields["path"]
+        except KeyError:
+            raise NotImplementedError("exist() only works for path")
+
+        if len(fields) != 1 or not path:
+            raise NotImplementedError("exist() only works for path")
+
+        try:
+            self._get(path)
+        except DBNotFound:
+            return False
+        return True
+
+    def update(self, resource, fields=None):
+        path = resource.path
+        old_resource = self._get(path)
+        self.logger.debug("Updating resource %s with %s", path, fields)
+
+        if path not in self._stored:
+            # never touch the shared, committed instance
+            old_resource = copy(old_resource)
+            self._stored[path] = old_resource
+            self._ids[old_resource.resourceID] = path
+
+        if fields is None:
+            old_resource.set_values(resource.values)
+        else:
+            for field in fields:
+                setattr(old_resource, field, getattr(resource, field))
+
+    def delete(self, resource):
+        self.logger.debug("Deleting: %s", resource)
+
+        path = resource.path
+        self._get(path)
+
+        self._stored.pop(path, None)
+        self._ids.pop(resource.resourceID, None)
+        if path in self._created:
+            self._created.discard(path)
+        else:
+            self._deleted[path] = resource.resourceID
+
+    def commit(self):
+        if not (self._stored or self._deleted):
+            return
+
+        self.db.write(self._stored, self._created, self._deleted)
+        self._reset()
+
+    def rollback(self):
+        self._reset()
+
+    def _reset(self):
+        self._stored = OrderedDict()
+        self._created = set()
+        self._ids = {}
+        self._deleted = {}
+
+
+class SQLiteShelve(Shelve):
+    def __init__(self, db, name, *args, **kw):
+        super(SQLiteShelve, self).__init__(*args, **kw)
+
+        self.db = db
+        self.name = name
+
+        # key -> value, None marks deleted keys
+        self._pending = {}
+
+    def __getitem__(self, k):
+        try:
+            v = self._pending[k]
+        except KeyError:
+            return self.db.load_shelve_value(self.name, k)
+        if v is None:
+            raise KeyError(k)
+        return v
+
+    def __setitem__(self, k, v):
+        if v is None:
+            raise ValueError("None values are not supported")
+        self._pending[k] = v
+
+    def __delitem__(self, k):
+        self[k]
+        self._pending[k] = None
+
+    def __iter__(self):
+        for k in self.db.load_shelve_keys(self.name):
+            if k not in self._pending:
+                yield k
+        for k, v in list(self._pending.items()):
+            if v is not None:
+                yield k
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def items(self):
+        # a single query instead of one per key
+        pending = self._pending
+        items = [(k, v) for k, v in self.db.load_shelve_items(self.name)
+                 if k not in pending]
+        items.extend((k, v) for k, v in pending.items() if v is not None)
+        return items
+
+    def commit(self):
+        if self._pending:
+            self.db.write_shelve(self.name, self._pending)
+            self._pending = {}
+
+    def rollback(self):
+        self._pending = {}
+
+
+class SQLiteDB(DBAdapter):
+    """Persistent DB adapter storing resources in a SQLite database.
+
+    Configuration:
+        "database": {
+            "driver": "openmtc_server.db.sqlite.SQLiteDB",
+            "file": "/var/lib/openmtc/gateway.db",
+            "cache_size": 10000
+        }
+    """
+
+    DEFAULT_FILE = "/var/lib/openmtc/openmtc.db"
+    DEFAULT_CACHE_SIZE = 10000
+
+    def __init__(self, *args, **kw):
+        super(SQLiteDB, self).__init__(*args, **kw)
+
+        self.filename = self.config.get("file", self.DEFAULT_FILE)
+        cache_size = self.config.get("cache_size", self.DEFAULT_CACHE_SIZE)
+
+        # committed resources by path and by resourceID
+        self._cache = LRUCache(max_items=cache_size * 2, threadsafe=False)
+
+        self._shelves = {}
+
+        self._connection = sqlite3.connect(self.filename,
+                                           isolation_level=None,
+                                           check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        with self._transaction() as c:
+            for statement in _schema:
+                c.execute(statement)
+
+    def _transaction(self):
+        return _Transaction(self._connection)
+
+    def initialize(self, force=False):
+        if not force and self.is_initialized():
+            raise Exception("Already initialized")
+
+        with self._transaction() as c:
+            c.execute("DELETE FROM resources")
+            c.execute("DELETE FROM labels")
+            c.execute("DELETE FROM shelves")
+            c.execute("INSERT OR REPLACE INTO meta VALUES ('initialized', '1')")
+
+        self._cache.clear()
+        self._shelves.clear()
+
+    def is_initialized(self):
+        row = self._connection.execute(
+            "SELECT value FROM meta WHERE key = 'initialized'").fetchone()
+        return row is not None
+
+    def start_session(self, std_type):
+        return SQLiteSession(self, std_type)
+
+    def get_shelve(self, name):
+        try:
+            return self._shelves[name]
+        except KeyError:
+            shelve = self._shelves[name] = SQLiteShelve(self, name)
+            return shelve
+
+    def stop(self):
+        self._connection.close()
+
+    # resources
+
+    def _cache_resource(self, resource):
+        self._cache[resource.path] = resource
+        self._cache[resource.resourceID] = resource
+
+    def load_resource(self, key):
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+
+        row = self._connection.execute(
+            "SELECT data FROM resources WHERE path = ? OR resource_id = ?",
+            (key, key)).fetchone()
+        if row is None:
+            self.logger.debug("Resource not found")
+            raise DBNotFound(key)
+
+        resource = _load(row[0])
+        self._cache_resource(resource)
+        return resource
+
+    def load_children(self, parent_path, type_names=None, reverse=False,
+                      limit=None, offset=None):
+        query = "SELECT path, data FROM resources WHERE parent_path = ?"
+        params = [parent_path]
+        if type_names is not None:
+            query += " AND type IN (%s)" % ", ".join("?" * len(type_names))
+            params.extend(type_names)
+        query += " ORDER BY seq DESC" if reverse else " ORDER BY seq"
+        if limit is not None or offset:
+            query += " LIMIT ?"
+            params.append(-1 if limit is None else limit)
+        if offset:
+            query += " OFFSET ?"
+            params.append(offset)
+
+        return self._load_rows(self._connection.execute(query, params))
+
+    def _load_rows(self, rows):
+        for path, data in rows:
+            try:
+                yield self._cache[path]
+            except KeyError:
+                resource = _load(data)
+                self._cache_resource(resource)
+                yield resource
+
+    def find(self, root_path, criteria):
+        labels, resource_types, time_ranges = criteria
+
+        # the subtree is selected by a range on the path index, "0" is the
+        # character following "/"
+        query = ("SELECT path, data FROM resources "
+                 "WHERE (path = ? OR (path > ? AND path < ?))")
+        params = [root_path, root_path + "/", root_path + "0"]
+
+        if labels is not None:
+            query += (" AND seq IN (SELECT seq FROM labels WHERE label IN "
+                      "(%s))" % ", ".join("?" * len(labels)))
+            params.extend(labels)
+        if resource_types is not None:
+            query += (" AND resource_type IN (%s)" %
+                      ", ".join("?" * len(resource_types)))
+            params.extend(resource_types)
+        for name, (lower, upper) in time_ranges.items():
+            if lower is not None:
+                query += " AND %s > ?" % _time_columns[name]
+                params.append(lower)
+            if upper is not None:
+                query += " AND %s < ?" % _time_columns[name]
+                params.append(upper)
+        query += " ORDER BY seq"
+
+        return self._load_rows(self._connection.execute(query, params))
+
+    def write(self, stored, created, deleted):
+        with self._transaction() as c:
+            if deleted:
+                paths = [(p,) for p in deleted]
+                c.executemany("DELETE FROM labels WHERE seq = "
+                              "(SELECT seq FROM resources WHERE path = ?)",
+                              paths)
+                c.executemany("DELETE FROM resources WHERE path = ?", paths)
+            for path, resource in stored.items():
+                index_values = _index_values(resource)
+                if path in created:
+                    seq = c.execute(
+                        "INSERT INTO resources "
+                        "(path, resource_id, parent_path, type, "
+                        "resource_type, creation_time, last_modified_time, "
+                        "expiration_time, data) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (path, resource.resourceID,
+                         resource.parent_path,
+                         type(resource).__name__) + index_values +
+                        (_dump(resource), )).lastrowid
+                else:
+                    c.execute("UPDATE resources SET resource_type = ?, "
+                              "creation_time = ?, last_modified_time = ?, "
+                              "expiration_time = ?, data = ? WHERE path = ?",
+                              index_values + (_dump(resource), path))
+                    seq = c.execute("SELECT seq FROM resources "
+                                    "WHERE path = ?", (path, )).fetchone()[0]
+                    c.execute("DELETE FROM labels WHERE seq = ?", (seq, ))
+                labels = set(getattr(resource, "labels", None) or ())
+                if labels:
+                    c.executemany("INSERT INTO labels VALUES (?, ?)",
+                                  [(l, seq) for l in labels])
+
+        for path, resource_id in deleted.items():
+            self._cache.pop(path, None)
+            self._cache.pop(resource_id, None)
+        for resource in stored.values():
+            self._cache_resource(resource)
+
+    # shelves
+
+    def load_shelve_value(self, name, k):
+        row = self._connection.execute(
+            "SELECT value FROM shelves WHERE name = ? AND key = ?",
+            (name, dumps(k, HIGHEST_PROTOCOL))).fetchone()
+        if row is None:
+            raise KeyError(k)
+        return loads(row[0])
+
+    def load_shelve_keys(self, name):
+        rows = self._connection.execute(
+            "SELECT key FROM shelves WHERE name = ?", (name,)).fetchall()
+        return [loads(row[0]) for row in rows]
+
+    def load_shelve_items(self, name):
+        rows = self._connection.execute(
+            "SELECT key, value FROM shelves WHERE name = ?", (name,))
+        return [(loads(k), loads(v)) for k, v in rows]
+
+    def write_shelve(self, name, values):
+        with self._transaction() as c:
+            for k, v in values.items():
+                k = dumps(k, HIGHEST_PROTOCOL)
+                if v is None:
+                    c.execute("DELETE FROM shelves WHERE name = ? AND key = ?",
+                              (name, k))
+                else:
+                    c.execute("INSERT OR REPLACE INTO shelves VALUES (?, ?, ?)",
+                              (name, k, dumps(v, HIGHEST_PROTOCOL)))
+
+
+class _Transaction(object):
+    def __init__(self, connection):
+        self._connection = connection
+
+    def __enter__(self):
+        self._connection.execute("BEGIN")
+        return self._connection
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self._connection.execute("COMMIT")
+        else:
+            self._connection.execute("ROLLBACK")
+        return False
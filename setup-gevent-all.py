@@ -29,7 +29,7 @@ SETUP_REQUIRES = [
     "flask", "enum34", "geventhttpclient",
     # server only
     "funcy", "netifaces", "decorator", "mimeparse", "coapthon", "rdflib",
-     "yapps", "paho_mqtt"
+     "yapps", "paho_mqtt (>=1.5, <2)"
 ]
 SETUP_INSTALL_REQUIRES = [
     "urllib3", "gevent >= 1.0", "iso8601 >= 0.1.5", "werkzeug >= 0.9",
@@ -37,7 +37,7 @@ SETUP_INSTALL_REQUIRES = [
     "flask", "enum34", "geventhttpclient",
     # server only
     "funcy", "netifaces", "decorator", "mimeparse", "coapthon", "rdflib",
-     "yapps", "paho_mqtt"
+     "yapps", "paho_mqtt >= 1.5, < 2"
 ]
 
 # packages
@@ -0,0 +1,80 @@
+"""
+Compares payload size and encoding/decoding time of the CBOR serializer with
+the JSON serializer for typical sensor data.
+
+Run from the repository root after installing the gateway (or with the
+common/ src directories on the PYTHONPATH).
+
+Dependencies:
+    pip install tabulate cbor2
+"""
+
+from datetime import datetime
+from timeit import timeit
+
+from tabulate import tabulate
+
+from openmtc_onem2m.model import Container, ContentInstance
+from openmtc_onem2m.serializer import get_onem2m_decoder
+
+loops = 20000
+
+now = datetime.utcnow()
+
+reading = ContentInstance(
+    path="onem2m/sensor/temperature/cin42", resourceName="cin42",
+    resourceID="cin42", parentID="cnt0", creationTime=now,
+    lastModifiedTime=now, expirationTime=now, stateTag=0, creator="Csensor",
+    contentInfo="application/json", contentSize=4, content="21.5")
+
+container = Container(
+    path="onem2m/sensor/temperature", resourceName="temperature",
+    resourceID="cnt0", parentID="ae0", creationTime=now, lastModifiedTime=now,
+    expirationTime=now, labels=["openmtc:sensor_data", "openmtc:id:3"],
+    stateTag=12, creator="Csensor", maxNrOfInstances=100, maxByteSize=65536,
+    currentNrOfInstances=42, currentByteSize=1024)
+
+tests = [
+    # (title, resource)
+    ("Sensor reading", reading),
+    ("Container", container),
+]
+
+serializers = [
+    # (title, content type)
+    ("JSON", "application/json"),
+    ("CBOR", "application/vnd.onem2m-res+cbor"),
+]
+
+json = get_onem2m_decoder("application/json")
+
+table = []
+
+print("Running tests (%d loops each)" % loops)
+
+for title, resource in tests:
+    print(title)
+
+    row = [title]
+    for _, content_type in serializers:
+        serializer = get_onem2m_decoder(content_type)
+        data = serializer.encode_resource(resource)
+        # byte strings stay binary in CBOR, compare the decoded resources
+        assert serializer.decode(data).values == json.decode(
+            json.encode_resource(resource)).values
+        row += [
+            len(data),
+            timeit(lambda: serializer.encode_resource(resource),
+                   number=loops) / loops * 1e6,
+            timeit(lambda: serializer.decode_resource_values(data),
+                   number=loops) / loops * 1e6,
+        ]
+    table.append(row)
+
+headers = ["Resource"]
+for title, _ in serializers:
+    headers += ["%s bytes" % title, "%s encode (us)" % title,
+                "%s decode (us)" % title]
+
+print()
+print(tabulate(table, headers=headers, floatfmt=".1f"))
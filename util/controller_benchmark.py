@@ -0,0 +1,128 @@
+"""
+Measures RETRIEVE and CREATE latency through the method domain, once with the
+controller context built at startup and once with the context derived from
+the configuration on every request (as the controllers used to do).
+
+Run from the repository root after installing the gateway (or with the
+common/ and server/ src directories on the PYTHONPATH).
+
+Dependencies:
+    pip install tabulate
+"""
+
+from datetime import timedelta
+from timeit import timeit
+
+from tabulate import tabulate
+
+import openmtc_cse.api
+from openmtc_cse.methoddomain import OneM2MMethodDomain
+from openmtc_onem2m.model import AE, Container, ContentInstance
+from openmtc_onem2m.transport import OneM2MRequest, OneM2MOperation
+from openmtc_server.db.nodb2 import NoDB2
+from openmtc_server.platform.default.Event import ResourceFinishEvent
+
+loops = 10000
+
+config = {
+    "global": {
+        "require_auth": False,
+        "default_lifetime": timedelta(hours=1),
+        "min_lifetime": timedelta(seconds=5),
+        "max_lifetime": timedelta(days=1),
+    },
+    "onem2m": {
+        "sp_id": "openmtc.org",
+        "cse_type": "MN-CSE",
+        "cse_id": "mn-cse-1",
+        "cse_base": "onem2m",
+        "default_privileges": [{
+            "accessControlOperations": [2, 32],
+            "accessControlOriginators": ["all"]
+        }],
+        "dynamic_authorization": {
+            "enabled": False,
+            "poa": []
+        }
+    },
+}
+
+
+def run_task(f, *args, **kw):
+    f(*args, **kw)
+
+
+def create_method_domain():
+    db = NoDB2({})
+    db.initialize()
+
+    class Api(object):
+        class events(object):
+            resource_created = ResourceFinishEvent(run_task)
+            resource_deleted = ResourceFinishEvent(run_task)
+            resource_updated = ResourceFinishEvent(run_task)
+            resource_announced = ResourceFinishEvent(run_task)
+
+        start_onem2m_session = db.start_onem2m_session
+        get_shelve = db.get_shelve
+        run_task = run_task
+
+    openmtc_cse.api.config = config
+    openmtc_cse.api.api = Api
+    openmtc_cse.api.events = Api.events
+
+    omd = OneM2MMethodDomain(config)
+    omd.initialize(Api)
+    omd.init_cse_base()
+
+    ae = AE(resourceName="app", App_ID="app", requestReachability=False)
+    omd.handle_onem2m_request(OneM2MRequest(
+        OneM2MOperation.create, "onem2m", fr="Capp", ty=AE, pc=ae)).get()
+    cnt = Container(resourceName="data", maxNrOfInstances=100)
+    omd.handle_onem2m_request(OneM2MRequest(
+        OneM2MOperation.create, "onem2m/app", fr="Capp", ty=Container,
+        pc=cnt)).get()
+
+    return omd
+
+
+def retrieve(omd):
+    return omd.handle_onem2m_request(OneM2MRequest(
+        OneM2MOperation.retrieve, "onem2m/app", fr="Capp")).get()
+
+
+def create(omd):
+    cin = ContentInstance(content="42")
+    return omd.handle_onem2m_request(OneM2MRequest(
+        OneM2MOperation.create, "onem2m/app/data", fr="Capp",
+        ty=ContentInstance, pc=cin)).get()
+
+
+def measure(omd, f):
+    f(omd)
+    return timeit(lambda: f(omd), number=loops) / loops * 1e6
+
+
+tests = [
+    # (title, request)
+    ("RETRIEVE", retrieve),
+    ("CREATE", create),
+]
+
+prebuilt = create_method_domain()
+per_request = create_method_domain()
+# without a context the controllers derive it from the configuration
+per_request._controller_context = None
+
+table = []
+
+print("Running tests (%d loops each)" % loops)
+
+for title, request in tests:
+    print(title)
+    table.append([title, measure(per_request, request),
+                  measure(prebuilt, request)])
+
+print("\nMicroseconds per request")
+print(tabulate(table, headers=["Request", "Context per request",
+                               "Context at startup"]))
@@ -0,0 +1,107 @@
+"""
+Measures construction time and memory of ContentInstance, Container and AE
+entities.
+
+Compares the constructor, which converts and checks all values, with
+Entity.from_trusted_values(), which stores them as they are. The memory is
+measured for new entities and for entities updated through a copy, as they
+are stored by NoDB2 after an UPDATE.
+
+Run from the repository root after installing the gateway (or with the
+common/ src directories on the PYTHONPATH).
+
+Dependencies:
+    pip install tabulate
+"""
+
+import tracemalloc
+from copy import copy
+from timeit import timeit
+
+from tabulate import tabulate
+
+from openmtc.util import datetime_now
+from openmtc_onem2m.model import (AE, Container, ContentInstance,
+                                  ResourceTypeE)
+
+loops = 20000
+
+now = datetime_now()
+
+tests = [
+    # (title, resource type, values)
+    ("ContentInstance", ContentInstance, {
+        "resourceName": "cin42", "resourceID": "cin42", "parentID": "cnt0",
+        "resourceType": ResourceTypeE.contentInstance, "creationTime": now,
+        "lastModifiedTime": now, "expirationTime": now,
+        "labels": ["openmtc:sensor_data"], "stateTag": 0, "creator": "Csensor",
+        "contentInfo": "application/json", "contentSize": 4,
+        "content": b"21.5"}),
+    ("Container", Container, {
+        "resourceName": "temperature", "resourceID": "cnt0", "parentID": "ae0",
+        "resourceType": ResourceTypeE.container, "creationTime": now,
+        "lastModifiedTime": now, "expirationTime": now,
+        "labels": ["openmtc:sensor_data", "openmtc:id:3"], "stateTag": 12,
+        "creator": "Csensor", "maxNrOfInstances": 100, "maxByteSize": 65536,
+        "currentNrOfInstances": 42, "currentByteSize": 1024}),
+    ("AE", AE, {
+        "resourceName": "sensor", "resourceID": "Csensor", "parentID": "cb0",
+        "resourceType": ResourceTypeE.AE, "creationTime": now,
+        "lastModifiedTime": now, "expirationTime": now,
+        "labels": ["openmtc:ae"], "App-ID": "sensor", "AE-ID": "Csensor",
+        "nodeLink": "dummy", "requestReachability": True,
+        "pointOfAccess": ["http://localhost:21345"]}),
+]
+
+
+def construct(resource_type, values):
+    return resource_type(**values)
+
+
+def construct_trusted(resource_type, values):
+    return resource_type.from_trusted_values(values)
+
+
+def update(resource):
+    resource = copy(resource)
+    resource.lastModifiedTime = now
+    return resource
+
+
+def retained_bytes(create, number=loops):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    results = [create() for _ in range(number)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del results
+    return (after - before) / float(number)
+
+
+table = []
+
+print("Running tests (%d loops each)" % loops)
+
+for title, resource_type, values in tests:
+    print(title)
+
+    resource = construct_trusted(resource_type, values)
+    assert resource.values == construct(resource_type, values).values
+    assert update(resource).values == resource.values
+
+    table.append([
+        title,
+        timeit(lambda: construct(resource_type, values),
+               number=loops) / loops * 1e6,
+        timeit(lambda: construct_trusted(resource_type, values),
+               number=loops) / loops * 1e6,
+        retained_bytes(lambda: construct(resource_type, values)),
+        retained_bytes(
+            lambda: update(construct_trusted(resource_type, values))),
+    ])
+
+print()
+print(tabulate(table, headers=["Entity", "constructor us",
+                               "from_trusted_values() us", "new bytes",
+                               "updated bytes"],
+               floatfmt=".1f"))
@@ -0,0 +1,99 @@
+"""
+Compares the interpreted filter criteria check (check_match() as it used to
+be) with the compiled predicate from compile_filter_criteria() on synthetic
+resources.
+
+Run from the repository root after installing the gateway (or with the
+common/ and server/ src directories on the PYTHONPATH).
+
+Dependencies:
+    pip install tabulate
+"""
+
+from datetime import timedelta
+from timeit import timeit
+
+from tabulate import tabulate
+
+from openmtc.util import datetime_now
+from openmtc_cse.methoddomain.filtercriteria import (compile_filter_criteria,
+                                                     filters)
+from openmtc_onem2m.model import (Container, FilterCriteria, ResourceTypeE,
+                                  FilterUsageE)
+
+number_of_resources = 100000
+loops = 5
+
+
+def interpreted_check_match(resource, filter_criteria):
+    for criteria, value in filter_criteria.get_values(True).items():
+        if not value:
+            continue
+        try:
+            filter_function = getattr(filters, criteria)
+        except AttributeError:
+            return False
+        else:
+            if not filter_function(resource, value):
+                return False
+    return True
+
+
+def create_resources():
+    now = datetime_now()
+    return [
+        Container(path="onem2m/ae/cnt%d" % i, resourceID="cnt%d" % i,
+                  resourceType=ResourceTypeE.container,
+                  labels=["openmtc:id:%d" % (i % 100), "openmtc:sensor_data"
+                          if i % 10 == 0 else "openmtc:actuator"],
+                  stateTag=i % 50,
+                  creationTime=now - timedelta(seconds=i),
+                  lastModifiedTime=now)
+        for i in range(number_of_resources)
+    ]
+
+
+now = datetime_now()
+
+tests = [
+    # (title, filter criteria)
+    ("labels", FilterCriteria(filterUsage=FilterUsageE.Discovery,
+                              labels=["openmtc:sensor_data"])),
+    ("labels, resourceType", FilterCriteria(
+        filterUsage=FilterUsageE.Discovery,
+        labels=["openmtc:sensor_data", "openmtc:id:3"],
+        resourceType=[ResourceTypeE.container, ResourceTypeE.AE])),
+    ("labels, resourceType, createdAfter, stateTagBigger", FilterCriteria(
+        filterUsage=FilterUsageE.Discovery,
+        labels=["openmtc:sensor_data"],
+        resourceType=[ResourceTypeE.container],
+        createdAfter=now - timedelta(hours=12),
+        stateTagBigger=10)),
+]
+
+resources = create_resources()
+table = []
+
+print("Running tests (%d resources, %d loops each)" %
+      (number_of_resources, loops))
+
+for title, filter_criteria in tests:
+    print(title)
+
+    def interpreted():
+        return [r for r in resources
+                if interpreted_check_match(r, filter_criteria)]
+
+    def compiled():
+        match = compile_filter_criteria(filter_criteria)
+        return [r for r in resources if match(r)]
+
+    assert len(interpreted()) == len(compiled())
+
+    table.append([title, len(compiled()),
+                  timeit(interpreted, number=loops) / loops,
+                  timeit(compiled, number=loops) / loops])
+
+print("\nSeconds per %d resources" % number_of_resources)
+print(tabulate(table, headers=["Criteria", "Matches", "Interpreted",
+                               "Compiled"]))
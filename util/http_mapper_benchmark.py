@@ -0,0 +1,151 @@
+"""
+Compares the table driven HTTP request mapping and the cached Accept header
+negotiation of the HTTP transport with the former implementation (header by
+header lookups, parse_qs, negotiation on every response).
+
+Run from the repository root after installing the gateway (or with the
+common/, server/ and openmtc-gevent/ src directories on the PYTHONPATH).
+
+Dependencies:
+    pip install tabulate
+"""
+
+import urllib.parse
+from timeit import timeit
+
+from tabulate import tabulate
+from werkzeug.test import EnvironBuilder
+
+from openmtc_cse.methoddomain.filtercriteria import (parse_filter_criteria,
+                                                     filters)
+from openmtc_cse.plugins.transport_gevent_http.wsgi import (
+    OpenMTCWSGIApplication, Request, _method_map_from_http)
+from openmtc_onem2m.exc import CSEBadRequest
+from openmtc_onem2m.model import (AttributeList, get_long_attribute_name,
+                                  get_long_member_name)
+from openmtc_onem2m.serializer import get_onem2m_supported_content_types
+from openmtc_onem2m.transport import OneM2MRequest
+
+loops = 20000
+
+
+def former_map_http_request_to_onem2m_request(http_request):
+    op = _method_map_from_http[http_request.method]
+    to = http_request.path[1:].lstrip('/')
+    if to.startswith('~/'):
+        to = to[1:]
+    elif to.startswith('_/'):
+        to = '/' + to[1:]
+
+    get_header = http_request.headers.get
+    fr = get_header("x-m2m-origin")
+    rqi = get_header("x-m2m-ri")
+    gid = get_header("x-m2m-gid")
+    rt = get_header("x-m2m-rtu")
+    ot = get_header("x-m2m-ot")
+    rset = get_header("x-m2m-rst")
+    rqet = get_header("x-m2m-ret")
+    oet = get_header("x-m2m-oet")
+    ec = get_header("x-m2m-ec")
+    rvi = get_header("x-m2m-rvi")
+    vsi = get_header("x-m2m-vsi")
+
+    onem2m_request = OneM2MRequest(op=op, to=to, fr=fr, rqi=rqi, ty=None,
+                                   pc=None, ot=ot, rqet=rqet, rset=rset,
+                                   oet=oet, rt=rt, ec=ec, gid=gid, rvi=rvi,
+                                   vsi=vsi)
+
+    not_filter_params = ('rt', 'rp', 'rcn', 'da', 'drt', 'rids', 'tids',
+                         'ltids', 'tqi')
+    multiple_params = ('lbl', 'ty', 'cty', 'atr')
+
+    if http_request.query_string:
+        params = urllib.parse.parse_qs(
+            http_request.query_string.decode("utf-8"))
+        get_param = params.get
+        f_c = {}
+
+        for param in params:
+            values = get_param(param)
+
+            if param not in multiple_params and len(values) > 1:
+                raise CSEBadRequest()
+
+            param_long_name = get_long_member_name(param)
+
+            if param in not_filter_params:
+                setattr(onem2m_request, param, values[0])
+            elif param_long_name == 'attributeList':
+                onem2m_request.pc = AttributeList(
+                    list(map(get_long_attribute_name, values[0].split(' '))))
+            elif param_long_name and hasattr(filters, param_long_name):
+                if param in multiple_params:
+                    f_c[param_long_name] = values
+                else:
+                    f_c[param_long_name] = values[0]
+            else:
+                raise CSEBadRequest()
+        onem2m_request.filter_criteria = parse_filter_criteria(f_c)
+
+    return onem2m_request
+
+
+def former_negotiate_content_type(http_request):
+    supported = get_onem2m_supported_content_types()
+    if http_request.accept_mimetypes:
+        accept = http_request.accept_mimetypes.best_match(supported)
+        if accept is None:
+            accept = "application/json"
+    else:
+        accept = "application/json"
+    return accept
+
+
+headers = {
+    "X-M2M-Origin": "CAdmin",
+    "X-M2M-RI": "req-1234",
+    "X-M2M-RVI": "2a",
+    "Accept": "application/json, text/plain;q=0.8, */*;q=0.5",
+    "User-Agent": "openmtc-benchmark",
+}
+
+tests = [
+    # (title, path, query string)
+    ("RETRIEVE", "/onem2m/app/data/la", ""),
+    ("RETRIEVE, rcn", "/onem2m/app/data", "rcn=4"),
+    ("discovery", "/onem2m", "fu=1&lbl=openmtc:sensor_data&lbl=openmtc:id:3"
+                             "&ty=3&ty=2&lim=100&stb=10"),
+]
+
+app = OpenMTCWSGIApplication(None, "127.0.0.1", "application/json",
+                             require_cert=False)
+
+table = []
+
+print("Running tests (%d loops each)" % loops)
+
+for title, path, query_string in tests:
+    print(title)
+
+    environ = EnvironBuilder(path=path, query_string=query_string,
+                             headers=headers).get_environ()
+
+    def former():
+        http_request = Request(environ)
+        former_map_http_request_to_onem2m_request(http_request)
+        return former_negotiate_content_type(http_request)
+
+    def table_driven():
+        http_request = Request(environ)
+        app.map_http_request_to_onem2m_request(http_request)
+        return app._negotiate_content_type(environ.get("HTTP_ACCEPT"))
+
+    assert former() == table_driven()
+
+    table.append([title,
+                  loops / timeit(former, number=loops),
+                  loops / timeit(table_driven, number=loops)])
+
+print("\nRequests mapped per second")
+print(tabulate(table, headers=["Request", "Former", "Table driven"],
+               floatfmt=".0f"))
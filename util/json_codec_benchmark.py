@@ -0,0 +1,91 @@
+"""
+Compares encoding and decoding of Container and ContentInstance
+representations with the default JSON serializer and the orjson based
+serializer.
+
+Run from the repository root after installing the gateway (or with the
+common/ src directories on the PYTHONPATH).
+
+Dependencies:
+    pip install tabulate orjson
+"""
+
+from datetime import datetime
+from timeit import repeat
+
+from orjson import loads
+from tabulate import tabulate
+
+from openmtc_onem2m.model import (AccessControlPolicy, Container,
+                                  ContentInstance)
+from openmtc_onem2m.serializer.json import OneM2MJsonSerializer
+from openmtc_onem2m.serializer.json.fast import OneM2MFastJsonSerializer
+
+loops = 20000
+repetitions = 5
+
+now = datetime.utcnow()
+
+container = Container(
+    path="onem2m/app/data", resourceName="data", resourceID="cnt0",
+    parentID="ae0", creationTime=now, lastModifiedTime=now, expirationTime=now,
+    labels=["openmtc:sensor_data", "openmtc:id:3"], stateTag=12,
+    creator="Capp", maxNrOfInstances=100, maxByteSize=65536,
+    maxInstanceAge=3600, currentNrOfInstances=42, currentByteSize=1024,
+    accessControlPolicyIDs=["acp0"])
+container.latest = ContentInstance(resourceID="cin42")
+
+content_instance = ContentInstance(
+    path="onem2m/app/data/cin42", resourceName="cin42", resourceID="cin42",
+    parentID="cnt0", creationTime=now, lastModifiedTime=now,
+    expirationTime=now, labels=["openmtc:sensor_data"], stateTag=0,
+    creator="Capp", contentInfo="application/json:1", contentSize=56,
+    content='{"n": "temperature", "u": "Cel", "v": 21.5, "t": 1.5e9}')
+
+policy = AccessControlPolicy(
+    path="onem2m/acp0", resourceName="acp0", resourceID="acp0",
+    parentID="cb0", creationTime=now, lastModifiedTime=now,
+    expirationTime=now, labels=[],
+    privileges={"accessControlRule": [{
+        "accessControlOriginators": ["all"],
+        "accessControlOperations": [2, 32]}]},
+    selfPrivileges={"accessControlRule": [{
+        "accessControlOriginators": ["CAdmin"],
+        "accessControlOperations": [1, 2, 4, 8, 16, 32]}]})
+
+tests = [
+    # (title, resource)
+    ("Container", container),
+    ("ContentInstance", content_instance),
+    ("AccessControlPolicy", policy),
+]
+
+default = OneM2MJsonSerializer()
+fast = OneM2MFastJsonSerializer()
+
+table = []
+
+print("Running tests (best of %d runs of %d loops each)" %
+      (repetitions, loops))
+
+for title, resource in tests:
+    print(title)
+
+    encoded = default.encode_resource(resource)
+    assert loads(encoded) == loads(fast.encode_resource(resource))
+    assert (default.decode_resource_values(encoded) ==
+            fast.decode_resource_values(encoded))
+
+    table.append([title] + [
+        loops / min(repeat(f, number=loops, repeat=repetitions)) for f in (
+            lambda: default.encode_resource(resource),
+            lambda: fast.encode_resource(resource),
+            lambda: default.decode_resource_values(encoded),
+            lambda: fast.decode_resource_values(encoded),
+        )
+    ])
+
+print("\nOperations per second")
+print(tabulate(table, headers=["Resource", "Encode default", "Encode orjson",
+                               "Decode default", "Decode orjson"],
+               floatfmt=".0f"))
@@ -0,0 +1,202 @@
+"""
+Measures the throughput of oneM2M request/response round trips over MQTT
+without network: a broker stand-in delivers every published payload directly
+to the subscriber of its topic.
+
+Compares the former encoding of the primitives of OneM2MMQTTClient (content
+encoded, parsed and encoded again with the primitive) with the single pass of
+OneM2MPrimitiveCodec.
+
+Run from the repository root after installing the gateway (or with the
+common/ src directories on the PYTHONPATH).
+
+Dependencies:
+    pip install tabulate
+"""
+
+from timeit import timeit
+
+from simplejson import JSONDecoder, JSONEncoder
+from tabulate import tabulate
+
+from openmtc.util import datetime_now
+from openmtc_onem2m.exc import STATUS_CREATED, STATUS_OK
+from openmtc_onem2m.model import Container, ContentInstance, ResourceTypeE
+from openmtc_onem2m.serializer import get_onem2m_supported_content_types
+from openmtc_onem2m.serializer.primitive import (OneM2MPrimitiveCodec,
+                                                 request_fields,
+                                                 response_fields)
+from openmtc_onem2m.serializer.util import (decode_onem2m_content,
+                                            encode_onem2m_content)
+from openmtc_onem2m.transport import (OneM2MOperation, OneM2MRequest,
+                                      OneM2MResponse)
+
+loops = 5000
+
+now = datetime_now()
+
+
+class Broker(object):
+    """Delivers payloads to the subscriber of the topic right away."""
+
+    def __init__(self):
+        self.subscriptions = {}
+        self.bytes = 0
+
+    def subscribe(self, topic, callback):
+        self.subscriptions[topic] = callback
+
+    def publish(self, topic, payload):
+        self.bytes += len(payload)
+        self.subscriptions[topic](payload)
+
+
+class OldCodec(object):
+    """The encoding of the primitives before OneM2MPrimitiveCodec."""
+
+    def __init__(self, content_type):
+        self.content_type = content_type
+        if content_type == "application/json":
+            def _default(x):
+                return x.isoformat()
+            self.encode = JSONEncoder(default=_default).encode
+            self.decode = JSONDecoder().decode
+        else:
+            serializer = OneM2MPrimitiveCodec(content_type)
+            self.encode, self.decode = serializer.dumps, serializer.loads
+
+    def encode_request(self, request):
+        if request.ty and request.op == OneM2MOperation.create:
+            request.ty = ResourceTypeE[request.resource_type.typename].value
+        else:
+            request.ty = None
+        request.op = 1 + list(OneM2MOperation._member_map_.keys()).index(
+            OneM2MOperation[request.op].name)
+        if request.pc:
+            request.pc = self.decode(encode_onem2m_content(
+                request.pc, self.content_type, path=request.to)[1])
+        return self.encode({
+            k: getattr(request, k) for k in request_fields
+            if getattr(request, k) is not None
+        })
+
+    def decode_request(self, payload):
+        request = self.decode(payload)
+        try:
+            request["pc"] = decode_onem2m_content(self.encode(request["pc"]),
+                                                  self.content_type)
+            request["ty"] = type(request["pc"])
+        except KeyError:
+            request["ty"] = None
+        op = list(OneM2MOperation._member_map_.values())[request["op"] - 1]
+        to = request["to"]
+        del request["op"], request["to"]
+        return OneM2MRequest(op, to, **request)
+
+    def encode_response(self, response, path):
+        if response.content:
+            response.content = self.decode(encode_onem2m_content(
+                response.content, self.content_type, path=path)[1])
+        return self.encode({
+            k: getattr(response, k) for k in response_fields
+            if getattr(response, k) is not None
+        })
+
+    def decode_response(self, payload):
+        response = self.decode(payload)
+        response["pc"] = decode_onem2m_content(self.encode(response["pc"]),
+                                               self.content_type)
+        status_code = response.pop("rsc")
+        return OneM2MResponse(status_code, **response)
+
+
+class NewCodec(OneM2MPrimitiveCodec):
+    def decode_request(self, payload):
+        return super(NewCodec, self).decode_request(self.loads(payload))
+
+    def decode_response(self, payload):
+        return super(NewCodec, self).decode_response(self.loads(payload))
+
+
+def handle_request(request):
+    if request.op == OneM2MOperation.create:
+        content = ContentInstance(resourceName="cin42", resourceID="cin42",
+                                  parentID="cnt0", creationTime=now,
+                                  lastModifiedTime=now, expirationTime=now,
+                                  stateTag=0, content=request.pc.content,
+                                  contentInfo="application/json",
+                                  contentSize=4)
+        return OneM2MResponse(STATUS_CREATED, request=request, pc=content)
+    return OneM2MResponse(STATUS_OK, request=request, pc=Container(
+        resourceName="temperature", resourceID="cnt0", parentID="ae0",
+        creationTime=now, lastModifiedTime=now, expirationTime=now,
+        labels=["openmtc:sensor_data"], stateTag=12, maxNrOfInstances=100,
+        currentNrOfInstances=42, currentByteSize=1024))
+
+
+def make_round_trip(codec, op):
+    broker = Broker()
+    responses = []
+
+    def on_request(payload):
+        response = handle_request(codec.decode_request(payload))
+        broker.publish("/oneM2M/resp/CAE1/mn-cse-1",
+                       codec.encode_response(response, "/mn-cse-1"))
+
+    broker.subscribe("/oneM2M/req/CAE1/mn-cse-1", on_request)
+    broker.subscribe("/oneM2M/resp/CAE1/mn-cse-1",
+                     lambda payload: responses.append(
+                         codec.decode_response(payload)))
+
+    def round_trip():
+        if op == OneM2MOperation.create:
+            request = OneM2MRequest(op, "/mn-cse-1/onem2m/sensor/temperature",
+                                    fr="CAE1", ty=ContentInstance,
+                                    pc=ContentInstance(content="21.5"))
+        else:
+            request = OneM2MRequest(op, "/mn-cse-1/onem2m/sensor/temperature",
+                                    fr="CAE1")
+        broker.publish("/oneM2M/req/CAE1/mn-cse-1",
+                       codec.encode_request(request))
+        return responses.pop()
+
+    return round_trip, broker
+
+
+tests = [
+    # (title, content type, operation)
+    ("JSON create", "application/json", OneM2MOperation.create),
+    ("JSON retrieve", "application/json", OneM2MOperation.retrieve),
+]
+if "application/vnd.onem2m-res+cbor" in get_onem2m_supported_content_types():
+    tests += [
+        ("CBOR create", "application/vnd.onem2m-res+cbor",
+         OneM2MOperation.create),
+        ("CBOR retrieve", "application/vnd.onem2m-res+cbor",
+         OneM2MOperation.retrieve),
+    ]
+
+table = []
+
+print("Running tests (%d round trips each)" % loops)
+
+for title, content_type, op in tests:
+    print(title)
+    old, _ = make_round_trip(OldCodec(content_type), op)
+    new, broker = make_round_trip(NewCodec(content_type), op)
+
+    assert old().pc.values == new().pc.values
+    broker.bytes = 0
+    new_time = timeit(new, number=loops)
+
+    table.append([
+        title,
+        loops / timeit(old, number=loops),
+        loops / new_time,
+        broker.bytes / float(loops),
+    ])
+
+print()
+print(tabulate(table, headers=["Round trip", "before /s",
+                               "OneM2MPrimitiveCodec /s", "bytes"],
+               floatfmt=".0f"))
@@ -0,0 +1,195 @@
+"""
+Compares the former polling loop of OneM2MMQTTClient (Client.loop() with a
+timeout of 100 ms in a greenlet) with the gevent driven GeventMQTTLoop:
+round trip latency of oneM2M requests between two clients and the CPU time
+used by idle clients.
+
+A minimal MQTT 3.1.1 broker stand-in (CONNECT, SUBSCRIBE, PUBLISH and PING,
+messages are forwarded with QoS 0) runs in the same process on localhost.
+
+Run from the repository root after installing the gateway (or with the
+common/ src directories on the PYTHONPATH).
+
+Dependencies:
+    pip install tabulate
+"""
+
+import struct
+from socket import IPPROTO_TCP, TCP_NODELAY
+from time import process_time, time
+
+import gevent
+from gevent.server import StreamServer
+from tabulate import tabulate
+
+from openmtc_onem2m.client import mqtt as mqtt_client
+from openmtc_onem2m.client.mqtt import OneM2MMQTTClient, mqtt_loop
+from openmtc_onem2m.exc import STATUS_OK
+from openmtc_onem2m.model import Container
+from openmtc_onem2m.transport import (OneM2MOperation, OneM2MRequest,
+                                      OneM2MResponse)
+
+round_trips = 500
+idle_clients = 50
+idle_time = 3
+
+mqtt_client.MQTT_RESPONSE_TIMEOUT = 10
+
+
+class Broker(object):
+    """Forwards published messages to the subscribers of their topics."""
+
+    def __init__(self):
+        self.subscriptions = []  # (topic filter, socket)
+        self.server = StreamServer(("127.0.0.1", 0), self.handle)
+        self.server.start()
+        self.port = self.server.server_port
+
+    @staticmethod
+    def matches(topic_filter, topic):
+        filter_levels = topic_filter.split("/")
+        levels = topic.split("/")
+        for i, level in enumerate(filter_levels):
+            if level == "#":
+                return True
+            if i >= len(levels) or level not in ("+", levels[i]):
+                return False
+        return len(filter_levels) == len(levels)
+
+    @staticmethod
+    def packet(header, body=b""):
+        length = bytearray()
+        n = len(body)
+        while True:
+            n, digit = divmod(n, 128)
+            length.append(digit | 0x80 if n else digit)
+            if not n:
+                return bytes([header]) + bytes(length) + body
+
+    @staticmethod
+    def read_packet(f):
+        header = f.read(1)
+        if not header:
+            return None, None
+        length = 0
+        multiplier = 1
+        while True:
+            digit = f.read(1)[0]
+            length += (digit & 0x7f) * multiplier
+            multiplier *= 128
+            if not digit & 0x80:
+                return header[0], f.read(length)
+
+    def handle(self, sock, _):
+        sock.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+        f = sock.makefile("rb")
+        try:
+            while True:
+                header, body = self.read_packet(f)
+                command = header and header >> 4
+                if command is None or command == 14:  # DISCONNECT
+                    return
+                elif command == 1:  # CONNECT
+                    sock.sendall(self.packet(0x20, b"\0\0"))
+                elif command == 8:  # SUBSCRIBE
+                    pos, granted = 2, b""
+                    while pos < len(body):
+                        n, = struct.unpack("!H", body[pos:pos + 2])
+                        topic = body[pos + 2:pos + 2 + n].decode("utf-8")
+                        self.subscriptions.append((topic, sock))
+                        pos += n + 3
+                        granted += b"\0"
+                    sock.sendall(self.packet(0x90, body[:2] + granted))
+                elif command == 3:  # PUBLISH
+                    n, = struct.unpack("!H", body[:2])
+                    topic = body[2:2 + n].decode("utf-8")
+                    payload = body[2 + n:]
+                    if (header >> 1) & 3:
+                        sock.sendall(self.packet(0x40, payload[:2]))
+                        payload = payload[2:]
+                    message = self.packet(0x30, body[:2 + n] + payload)
+                    for topic_filter, subscriber in list(self.subscriptions):
+                        if self.matches(topic_filter, topic):
+                            subscriber.sendall(message)
+                elif command == 10:  # UNSUBSCRIBE
+                    sock.sendall(self.packet(0xb0, body[:2]))
+                elif command == 12:  # PINGREQ
+                    sock.sendall(self.packet(0xd0))
+        finally:
+            self.subscriptions = [s for s in self.subscriptions
+                                  if s[1] is not sock]
+
+
+def use_polling(client):
+    """Replaces the GeventMQTTLoop of a client with the former loop."""
+    paho = client._client
+    mqtt_loop.remove(paho)
+
+    def loop():
+        try:
+            while paho.loop(timeout=0.1) != mqtt_client.mqtt.mqtt_cs_disconnecting:
+                gevent.sleep()
+        except (SystemExit, KeyboardInterrupt, AttributeError):
+            pass
+
+    return gevent.spawn(loop)
+
+
+def handle_request(request):
+    return OneM2MResponse(STATUS_OK, request=request, pc=Container(
+        resourceName="temperature", resourceID="cnt0",
+        path="/mn-cse-1/onem2m/temperature"), to="/mn-cse-1")
+
+
+def measure(broker, polling):
+    ep = "mqtt://127.0.0.1:%d" % (broker.port, )
+    server = OneM2MMQTTClient(ep, False, "/mn-cse-1",
+                              handle_request_func=handle_request)
+    requester = OneM2MMQTTClient(ep + "#mn-cse-1", False, "CAE1")
+    idle = [OneM2MMQTTClient(ep, False, "CIdle%d" % (i, ))
+            for i in range(idle_clients)]
+    clients = [server, requester] + idle
+    loops = [use_polling(c) for c in clients] if polling else []
+    gevent.sleep(0.5)
+
+    def request():
+        return requester.send_onem2m_request(OneM2MRequest(
+            OneM2MOperation.retrieve, "/mn-cse-1/onem2m/temperature",
+            fr="CAE1")).get()
+
+    assert request().content.resourceName == "temperature"
+
+    start = time()
+    for _ in range(round_trips):
+        request()
+    latency = (time() - start) / round_trips * 1e3
+
+    # only the clients are running now
+    start = process_time()
+    gevent.sleep(idle_time)
+    idle_cpu = (process_time() - start) / idle_time * 1e2
+
+    for greenlet in loops:
+        greenlet.kill()
+    for client in clients:
+        if not polling:
+            mqtt_loop.remove(client._client)
+        client._client.disconnect()
+    gevent.sleep(0.5)
+    return latency, idle_cpu
+
+
+broker = Broker()
+
+print("Running tests (%d round trips, %d idle clients for %d s)"
+      % (round_trips, idle_clients, idle_time))
+
+table = []
+for title, polling in (("Client.loop() polling", True),
+                       ("GeventMQTTLoop", False)):
+    print(title)
+    table.append([title] + list(measure(broker, polling)))
+
+print()
+print(tabulate(table, headers=["Loop", "round trip ms", "idle CPU %"],
+               floatfmt=".2f"))
@@ -0,0 +1,161 @@
+"""
+Compares the resource copies handed out by NoDB2Session.get(), made by
+Entity.__copy__(), with the former copies made by copy.copy() through
+__reduce_ex__(), and for the lookups which only read the resources with the
+uncopied resources of NoDB2Session.view().
+
+Measures latency and memory allocated per copy, per RETRIEVE-like read, per
+UPDATE-like read-modify and per discovery node, and the memory of the stored
+resources, which must not grow by handing out copies.
+
+Run from the repository root after installing the gateway (or with the
+common/ and server/ src directories on the PYTHONPATH).
+
+Dependencies:
+    pip install tabulate
+"""
+
+import copy
+import sys
+import tracemalloc
+from timeit import timeit
+
+from tabulate import tabulate
+
+from openmtc.util import datetime_now
+from openmtc_onem2m.model import CSEBase, AE, Container, ContentInstance
+from openmtc_server.db.nodb2 import NoDB2
+
+loops = 10000
+nodes = 1000
+
+
+def create_db():
+    db = NoDB2({})
+    db.initialize()
+    session = db.start_onem2m_session()
+
+    now = datetime_now()
+
+    def store(resource_type, path, **values):
+        values.setdefault("creationTime", now)
+        values.setdefault("lastModifiedTime", now)
+        resource = resource_type(path=path, resourceID=path.replace("/", "-"),
+                                 **values)
+        session.store(resource)
+        return resource
+
+    store(CSEBase, "onem2m", cseType=1, CSE_ID="/mn-cse-1")
+    store(AE, "onem2m/ae", AE_ID="Cae", App_ID="bench",
+          parentID="onem2m", labels=["a", "b"], requestReachability=False)
+    for i in range(nodes):
+        cnt = "onem2m/ae/cnt%d" % i
+        store(Container, cnt, parentID="onem2m-ae", labels=["c%d" % i],
+              currentNrOfInstances=1, currentByteSize=4, stateTag=0)
+        store(ContentInstance, cnt + "/cin", parentID=cnt.replace("/", "-"),
+              content=b"1234", contentInfo="text/plain:0", contentSize=4,
+              stateTag=0)
+
+    return session
+
+
+def reduce_copy(session, path):
+    # what copy.copy() did before entities had __copy__()
+    resource = session._get(path)
+    return copy._reconstruct(resource, None, *resource.__reduce_ex__(4))
+
+
+def entity_copy(session, path):
+    return session.get(path)
+
+
+def view(session, path):
+    return session.view(path)
+
+
+def get_only(session, get):
+    return get(session, "onem2m/ae/cnt0/cin")
+
+
+def retrieve(session, get):
+    resource = get(session, "onem2m/ae/cnt0/cin")
+    return resource.get_values_representation()
+
+
+def update(session, get):
+    resource = get(session, "onem2m/ae/cnt0")
+    resource.stateTag += 1
+    resource.lastModifiedTime = datetime_now()
+    return resource
+
+
+def discovery(session, get):
+    node = get(session, "onem2m/ae")
+    found = [node.labels]
+    for child in session.get_collection(Container, node):
+        node = get(session, child.path)
+        session.get_collection(None, node)
+        found.append(node.labels)
+    return found
+
+
+def allocated_bytes(session, operation, get, number):
+    allocated = 0
+    tracemalloc.start()
+    for _ in range(number):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        operation(session, get)
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return allocated / float(number)
+
+
+def stored_bytes(session):
+    # resources are stored by path and by resource ID
+    resources = {id(r): r for r in session.resources.values()}
+    return sum(sys.getsizeof(r.__dict__) for r in resources.values())
+
+
+tests = [
+    # (title, operation, repetitions, nodes per repetition, read-only)
+    ("get", get_only, loops, 1, True),
+    # a RETRIEVE sets resourceType and childResource on its copy
+    ("retrieve", retrieve, loops, 1, False),
+    ("update", update, loops, 1, False),
+    ("discovery", discovery, loops // nodes or 1, nodes + 1, True),
+]
+
+session = create_db()
+stored = stored_bytes(session)
+table = []
+
+print("Running tests (%d loops each, %d nodes for discovery)" %
+      (loops, nodes))
+
+for title, operation, number, per_run, read_only in tests:
+    print(title)
+    row = [title]
+    getters = (reduce_copy, entity_copy, view if read_only else None)
+    for get in getters:
+        if get is None:
+            row.append(None)
+        else:
+            seconds = timeit(lambda: operation(session, get), number=number)
+            row.append(seconds / (number * per_run) * 1e6)
+    for get in getters:
+        if get is None:
+            row.append(None)
+        else:
+            row.append(allocated_bytes(session, operation, get, number) /
+                       per_run)
+    table.append(row)
+
+print("\nPer request / per discovery node")
+print(tabulate(table, headers=["Operation", "__reduce_ex__() us",
+                               "__copy__() us", "view() us",
+                               "__reduce_ex__() bytes", "__copy__() bytes",
+                               "view() bytes"],
+               floatfmt=".2f"))
+print("\nInstance dicts of the stored resources: %d bytes before, %d bytes "
+      "after the tests" % (stored, stored_bytes(session)))
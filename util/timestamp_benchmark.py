@@ -0,0 +1,67 @@
+"""
+Compares the timestamp handling of openmtc.timestamp with iso8601 and
+strftime(): parsing, formatting and the comparisons of the time filter
+criteria (formerly with the pure Python UTC time zone of openmtc.util).
+
+Run from the repository root after installing the gateway (or with the
+common/ src directories on the PYTHONPATH).
+
+Dependencies:
+    pip install tabulate
+"""
+
+from datetime import datetime, timezone
+from timeit import timeit
+
+from iso8601 import parse_date
+from tabulate import tabulate
+
+from openmtc.timestamp import format_timestamp, parse_timestamp
+from openmtc.util import Utc
+
+loops = 100000
+
+basic = "20170101T120000"
+extended = "2017-01-01T12:00:00+02:00"
+
+value = datetime(2017, 1, 1, 12, tzinfo=timezone.utc)
+old_value = datetime(2017, 1, 1, 12, tzinfo=Utc())
+timestamp = parse_timestamp(basic)
+bound = parse_timestamp("20170101T110000")
+
+assert parse_timestamp(basic) == parse_date(basic)
+assert parse_timestamp(extended) == parse_date(extended)
+assert format_timestamp(timestamp) == value.strftime("%Y%m%dT%H%M%S")
+
+tests = [
+    # (title, before, after)
+    ("parse basic format",
+     lambda: parse_date(basic),
+     lambda: parse_timestamp(basic)),
+    ("parse extended format",
+     lambda: parse_date(extended),
+     lambda: parse_timestamp(extended)),
+    ("format",
+     lambda: value.strftime("%Y%m%dT%H%M%S"),
+     lambda: format_timestamp(timestamp)),
+    ("compare (createdAfter)",
+     lambda: old_value > bound,
+     lambda: timestamp > bound),
+]
+
+table = []
+
+print("Running tests (%d loops each)" % loops)
+
+for title, before, after in tests:
+    print(title)
+    table.append([
+        title,
+        timeit(before, number=loops) / loops * 1e6,
+        timeit(after, number=loops) / loops * 1e6,
+    ])
+
+print()
+print(tabulate(table, headers=["Operation", "before us",
+                               "openmtc.timestamp us"],
+               floatfmt=".2f"))